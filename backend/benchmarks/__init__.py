@@ -0,0 +1,2 @@
+# ベンチマーク用スクリプト置き場
+# backend ディレクトリから python -m benchmarks.<名前> で実行する
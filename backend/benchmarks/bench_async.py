@@ -0,0 +1,163 @@
+"""
+同時接続が多いときの def (スレッドプール) と async def の読み込みAPIを比べる
+uvicorn を別プロセスで起動し、GET /posts 相当のリクエストを多数の接続から同時に送る
+
+python -m benchmarks.bench_async [同時接続数] [接続あたりのリクエスト数]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from fastapi import FastAPI, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import Base, create_engines, ReadSessionLocal, get_async_db
+from models import User, Song, Post
+import crud
+import crud_async
+
+USER_COUNT = 50
+POST_COUNT = 500
+PAGE_SIZE = 20
+
+# --- ベンチマーク用のAPI (uvicorn の子プロセスで動く) ---
+
+app = FastAPI()
+
+
+# def 側は読み込み専用の接続を使う (async 側の get_async_db と条件をそろえる)
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def posts_payload(posts):
+    return [
+        {"id": p.id, "comment": p.comment, "user": p.user_name, "song": p.title}
+        for p in posts
+    ]
+
+
+@app.get("/sync/posts")
+def sync_posts(db: Session = Depends(get_read_db)):
+    return posts_payload(crud.get_recent_post_rows(db, limit=PAGE_SIZE))
+
+
+@app.get("/async/posts")
+async def async_posts(db: AsyncSession = Depends(get_async_db)):
+    return posts_payload(await crud_async.get_recent_post_rows(db, limit=PAGE_SIZE))
+
+
+# --- 負荷をかける側 ---
+
+def make_db(path):
+    write_engine, _ = create_engines(path)
+    Base.metadata.create_all(bind=write_engine)
+    db = sessionmaker(bind=write_engine)()
+    db.add_all(
+        User(id=f"bench-{i}", name=f"bench{i}", score_vc=0.5, score_ma=0.5, score_pr=0.5, score_hs=0.5)
+        for i in range(USER_COUNT)
+    )
+    db.add(Song(id=1, title="bench", artist="bench", url="/static/bench.mp3"))
+    db.add_all(
+        Post(user_id=f"bench-{i % USER_COUNT}", song_id=1, comment=f"post {i}")
+        for i in range(POST_COUNT)
+    )
+    db.commit()
+    db.close()
+    write_engine.dispose()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, port):
+    env = dict(os.environ, TOMOTUNE_DB_PATH=db_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_async:app",
+         "--port", str(port), "--log-level", "warning", "--backlog", "2048"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("uvicorn が起動しませんでした")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+async def load(url, connections, per_connection):
+    import httpx
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = asyncio.Event()
+
+        async def worker():
+            nonlocal errors
+            await start.wait()
+            for _ in range(per_connection):
+                started = time.perf_counter()
+                try:
+                    r = await client.get(url)
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    errors += 1
+
+        tasks = [asyncio.create_task(worker()) for _ in range(connections)]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        start.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return sorted(latencies), errors, elapsed
+
+
+def run(name, base_url, connections, per_connection):
+    latencies, errors, elapsed = asyncio.run(load(f"{base_url}/{name}/posts", connections, per_connection))
+    ms = [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+    print(
+        f"{name:5s} connections={connections:4d} requests={len(latencies):6d} "
+        f"{len(latencies) / elapsed:8.1f} req/s  "
+        f"p50={ms[0]:8.2f}ms p95={ms[1]:8.2f}ms p99={ms[2]:8.2f}ms  errors={errors}"
+    )
+
+
+if __name__ == "__main__":
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    per_connection = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        make_db(db_path)
+        port = free_port()
+        server = start_server(db_path, port)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            run("sync", base_url, connections, per_connection)
+            run("async", base_url, connections, per_connection)
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,128 @@
+"""
+いいねの書き込みが続いている間の、読み込み(GET相当)の待ち時間を比べる
+production: WAL + PRAGMA + 読み込み専用プール / compat: 以前と同じ既定の設定
+
+python -m benchmarks.bench_concurrency [秒数] [書き込みスレッド数] [読み込みスレッド数]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_engines
+from models import User, Song, Post
+from data import songs
+import crud
+import catalog
+
+USER_COUNT = 20
+POST_COUNT = 200
+
+
+def make_db(path, profile):
+    write_engine, read_engine = create_engines(path, profile)
+    Base.metadata.create_all(bind=write_engine)
+    WriteSession = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
+    ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+    db = WriteSession()
+    for i in range(USER_COUNT):
+        db.add(User(id=f"bench-{i}", name=f"bench{i}", score_vc=0.5, score_ma=0.5, score_pr=0.5, score_hs=0.5))
+    for s in songs:
+        db.add(Song(title=s["title"], artist=s["artist"], url=s["url"], **s["features"]))
+    db.flush()
+    song_ids = [song.id for song in db.query(Song).all()]
+    for i in range(POST_COUNT):
+        db.add(Post(user_id=f"bench-{i % USER_COUNT}", song_id=song_ids[i % len(song_ids)], comment=f"post {i}"))
+    db.commit()
+    catalog.load_song_vectors(db)
+    db.close()
+    return write_engine, read_engine, WriteSession, ReadSession, song_ids
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def run(profile, seconds, writers, readers):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_engine, read_engine, WriteSession, ReadSession, song_ids = make_db(
+            os.path.join(tmp, "bench.db"), profile
+        )
+        stop = threading.Event()
+        lock = threading.Lock()
+        latencies = []
+        counts = {"writes": 0, "write_locked": 0, "read_locked": 0}
+
+        def writer(n):
+            user_id = f"bench-{n % USER_COUNT}"
+            i = 0
+            while not stop.is_set():
+                song_id = song_ids[i % len(song_ids)]
+                i += 1
+                db = WriteSession()
+                try:
+                    crud.apply_like(db, user_id, song_id, catalog.get_song_vector(db, song_id))
+                    with lock:
+                        counts["writes"] += 1
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        counts["write_locked"] += 1
+                finally:
+                    db.close()
+
+        def reader(n):
+            user_id = f"bench-{n % USER_COUNT}"
+            local = []
+            while not stop.is_set():
+                db = ReadSession()
+                started = time.perf_counter()
+                try:
+                    # /posts と /favorites 相当
+                    crud.get_recent_post_rows(db, limit=50)
+                    crud.get_favorite_song_ids(db, user_id)
+                    local.append(time.perf_counter() - started)
+                except OperationalError:
+                    with lock:
+                        counts["read_locked"] += 1
+                finally:
+                    db.close()
+            with lock:
+                latencies.extend(local)
+
+        workers = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        workers += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        for w in workers:
+            w.start()
+        time.sleep(seconds)
+        stop.set()
+        for w in workers:
+            w.join()
+
+        write_engine.dispose()
+        read_engine.dispose()
+
+    latencies.sort()
+    ms = [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+    print(
+        f"{profile:10s} reads={len(latencies):6d} "
+        f"p50={ms[0]:7.2f}ms p95={ms[1]:7.2f}ms p99={ms[2]:7.2f}ms  "
+        f"writes={counts['writes'] / seconds:7.1f}/s  "
+        f"locked(write)={counts['write_locked']} locked(read)={counts['read_locked']}"
+    )
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    run("compat", seconds, writers, readers)
+    run("production", seconds, writers, readers)
@@ -0,0 +1,64 @@
+"""
+いいねのログ1回あたりに、リクエストのスレッドが使う時間を比べる
+- 今まで: logger.info(f"...") で文字列を作り、その場で書き出す
+- event_log: キューに入れるだけ (全件 / 1%)
+書き出し先は /dev/null (端末への出力の速さで結果が変わらないように)。キューがいっぱいで捨てた数も出す
+
+python -m benchmarks.bench_event_log [回数]
+"""
+import logging
+import os
+import sys
+import time
+
+import metrics
+from event_log import EventLog
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure(fn, calls: int) -> list[float]:
+    """1回ごとの時間 (マイクロ秒) の p50 / p99 / 最大"""
+    latencies = []
+    for i in range(calls):
+        started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return [percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6, latencies[-1] * 1e6]
+
+
+def dropped() -> float:
+    return sum(value for _, _, value in metrics.log_events_dropped.collect())
+
+
+def main(calls: int):
+    devnull = open(os.devnull, "w")
+    logger = logging.getLogger("bench.sync")
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(devnull))
+    logger.setLevel(logging.INFO)
+
+    def sync_log(i):
+        logger.info(f"[❤️]: User: Test User | SongID: {i % 100} | Total: {i}")
+
+    print(f"{'':<24} {'p50':>9} {'p99':>9} {'最大':>9}  (µs/回, {calls:,} 回)")
+    p50, p99, worst = measure(sync_log, calls)
+    print(f"{'logger.info (今まで)':<24} {p50:>9.2f} {p99:>9.2f} {worst:>9.2f}")
+
+    for name, rate in (("event_log 全件", 1.0), ("event_log 1%", 0.01)):
+        log = EventLog({"like": rate}, handler=logging.StreamHandler(devnull))
+        log.start()
+        before = dropped()
+        p50, p99, worst = measure(
+            lambda i: log.emit("like", user_id="u", user="Test User", song_id=i % 100, total=i), calls)
+        log.stop()
+        print(f"{name:<24} {p50:>9.2f} {p99:>9.2f} {worst:>9.2f}  捨てた数 {dropped() - before:,.0f}")
+    devnull.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 100_000)
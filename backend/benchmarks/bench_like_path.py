@@ -0,0 +1,127 @@
+"""
+いいね1回あたりのSQL文の数とスループットを、従来の処理と1トランザクション版で比べる
+(1曲をひたすら連打する想定。複数スレッドなら2台の端末から同時に押す状況)
+
+python -m benchmarks.bench_like_path [タップ数] [スレッド数]
+"""
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User, Song
+from data import songs
+import crud
+import catalog
+import typeCal
+
+TEST_USER_ID = "bench-user"
+
+
+def legacy_like(db, user_id: str, song_id: int):
+    """変更前の main.create_like と同じ手順 (読み込み→Pythonで計算→書き戻し)"""
+    target_song = crud.get_song_by_id(db, song_id)
+    user = crud.get_user_by_id(db, user_id)
+    new_vc, new_ma, new_pr, new_hs = typeCal.calculate_new_scores(user, catalog.song_vector(target_song))
+    user.score_vc = new_vc
+    user.score_ma = new_ma
+    user.score_pr = new_pr
+    user.score_hs = new_hs
+    user.music_type_code = typeCal.determine_music_type_code(new_vc, new_ma, new_pr, new_hs)
+    db.add(user)
+    crud.create_like(db, user.id, song_id)
+    total = crud.count_likes(db, song_id, user.id)
+    return user.music_type_code, total
+
+
+def atomic_like(db, user_id: str, song_id: int):
+    """現在の main.create_like と同じ手順"""
+    song_vector = catalog.get_song_vector(db, song_id)
+    user_row, total = crud.apply_like(db, user_id, song_id, song_vector)
+    return user_row.music_type_code, total
+
+
+def make_db(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    db.add(User(id=TEST_USER_ID, name="bench", score_vc=0.5, score_ma=0.5, score_pr=0.5, score_hs=0.5))
+    for s in songs:
+        db.add(Song(title=s["title"], artist=s["artist"], url=s["url"], **s["features"]))
+    db.commit()
+    catalog.load_song_vectors(db)
+    db.close()
+    return engine, Session
+
+
+def applied_taps(final_vc: float, target_vc: float) -> float:
+    """最終的なVCから、実際に反映されたタップ数を逆算する (0.5*(1-a)^n + v*(1-(1-a)^n) = VC)"""
+    return math.log((final_vc - target_vc) / (0.5 - target_vc)) / math.log(1 - typeCal.ALPHA)
+
+
+def run(name, like_fn, taps, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = make_db(os.path.join(tmp, "bench.db"))
+        db = Session()
+        song = db.query(Song).first()
+        target_vc = catalog.song_vector(song)[0]
+        db.close()
+
+        counts = {"statements": 0, "commits": 0, "errors": 0}
+
+        def count_statement(*args):
+            counts["statements"] += 1
+
+        def count_commit(*args):
+            counts["commits"] += 1
+
+        event.listen(engine, "before_cursor_execute", count_statement)
+        event.listen(engine, "commit", count_commit)
+
+        def worker(n):
+            for _ in range(n):
+                db = Session()
+                try:
+                    like_fn(db, TEST_USER_ID, song.id)
+                except Exception:
+                    counts["errors"] += 1
+                finally:
+                    db.close()
+
+        per_thread = taps // threads
+        workers = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+        done = per_thread * threads
+
+        db = Session()
+        final_vc = crud.get_user_by_id(db, TEST_USER_ID).score_vc
+        logged = crud.count_likes(db, song.id, TEST_USER_ID)
+        db.close()
+        engine.dispose()
+
+    print(
+        f"{name:8s} taps={done:6d} threads={threads:2d} "
+        f"stmts/req={counts['statements'] / done:5.2f} commits/req={counts['commits'] / done:4.2f} "
+        f"{done / elapsed:8.1f} req/s  errors={counts['errors']} "
+        f"logged={logged} score_applied={applied_taps(final_vc, target_vc):.0f}"
+    )
+
+
+if __name__ == "__main__":
+    # VCの逆算が桁落ちしないよう、既定は少なめのタップ数
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    run("legacy", legacy_like, taps, threads)
+    run("atomic", atomic_like, taps, threads)
@@ -0,0 +1,68 @@
+"""
+メトリクス (metrics.py) の記録1回あたりの時間を測る
+リクエストごとに Counter.inc と Histogram.observe を呼んでも待ち時間に響かないことを確かめる
+(スレッド数を増やしても1回あたりの時間が変わらないこと = ロックで待たないこと も見る)
+
+python -m benchmarks.bench_metrics [1スレッドあたりの回数] [スレッド数]
+"""
+import sys
+import threading
+import time
+
+import metrics
+
+
+def measure(fn, calls: int, threads: int) -> float:
+    """fn を threads 本のスレッドで calls 回ずつ呼び、1回あたりの時間 (マイクロ秒) を返す"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(calls):
+            fn(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - started) / (calls * threads) * 1e6
+
+
+def main(calls: int, threads: int):
+    registry = metrics.Registry()
+    counter = registry.counter("bench_total", "", ("method", "route", "status"))
+    histogram = registry.histogram("bench_seconds", "", ("method", "route"))
+    routes = ["/posts", "/likes", "/users/{user_id}", "/timeline/{user_id}"]
+
+    cases = {
+        "何もしない (ループだけ)": lambda i: None,
+        "Counter.inc": lambda i: counter.inc("GET", routes[i & 3], "200"),
+        "Histogram.observe": lambda i: histogram.observe((i % 1000) / 10000, "GET", routes[i & 3]),
+    }
+    thread_counts = sorted({1, threads})
+    for n in thread_counts:
+        print(f"\n== {n} スレッド x {calls:,} 回")
+        for name, fn in cases.items():
+            print(f"  {name:<26} {measure(fn, calls, n):.3f} µs/回")
+
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"\nrender: {(time.perf_counter() - started) * 1000:.2f}ms ({len(text):,} 文字)")
+
+    # スレッドごとに足した値の合計が合っていること
+    expected = calls * sum(thread_counts)
+    total = sum(value for _, _, value in counter.collect())
+    print(f"Counter の合計: {total:,} (期待値 {expected:,})")
+    if total != expected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 200_000,
+        int(args[1]) if len(args) > 1 else 8,
+    )
@@ -0,0 +1,186 @@
+"""
+投稿一覧・コメント一覧のレスポンスを作るまで (DBの読み込み + 辞書にする) を、2つの読み方で比べる
+- ORM: Post / Comment / User を組み立てる (今までの読み方)
+- 行: 返す列だけを select し、Row のまま辞書にする (main.posts_page / list_comments)
+1リクエストで確保するメモリの最大 (tracemalloc) と、1秒あたりに返せる行数 (投稿 + コメント) を出す
+
+python -m benchmarks.bench_post_rows [回数]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_posts_response import COMMENTS_PER_POST, POSTS, seed
+
+
+def orm_posts_payload(posts, comment_previews, comment_counts, type_registry):
+    """行で読むようにする前の posts_page と同じ組み立て"""
+    results = []
+    for p in posts:
+        user, song = p.user, p.song
+        comments_payload = []
+        for c in comment_previews.get(p.id, []):
+            comment_user = c.user
+            comments_payload.append({
+                "id": c.id,
+                "content": c.content,
+                "created_at": c.created_at.isoformat(),
+                "user": {
+                    "id": comment_user.id,
+                    "name": comment_user.name,
+                    "music_type": type_registry.get(comment_user.music_type_code),
+                } if comment_user else None,
+            })
+        results.append({
+            "id": p.id,
+            "comment": p.comment,
+            "created_at": p.created_at.isoformat(),
+            "user": {
+                "id": user.id,
+                "name": user.name,
+                "music_type": type_registry.get(user.music_type_code),
+            } if user else None,
+            "song": {"id": song.id, "title": song.title, "artist": song.artist, "url": song.url} if song else None,
+            "comment_count": comment_counts.get(p.id, 0),
+            "comments": comments_payload,
+        })
+    return results
+
+
+async def run(runs: int, post_id: int):
+    from fastapi import Response
+    from sqlalchemy import select, tuple_
+    from sqlalchemy.orm import joinedload, selectinload
+    from models import Comment, Post
+    import crud
+    import crud_async
+    import database
+    import main as app_main
+    import type_registry
+
+    # --- 行で読むようにする前の crud_async の読み込み (ここにだけ残してある) ---
+
+    async def get_post_by_id(db, post_id: int) -> Post:
+        result = await db.execute(
+            select(Post)
+            .options(
+                joinedload(Post.user),
+                joinedload(Post.song),
+                joinedload(Post.comments).joinedload(Comment.user),
+            )
+            .where(Post.id == post_id)
+        )
+        return result.unique().scalars().first()
+
+    async def get_recent_posts(db, limit: int = 50, before: tuple | None = None):
+        query = select(Post).options(selectinload(Post.user), selectinload(Post.song))
+        if before is not None:
+            query = query.where(tuple_(Post.created_at, Post.id) < tuple_(*before))
+        return (await db.execute(
+            query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+        )).scalars().all()
+
+    async def get_comment_previews(db, post_ids: list[int], k: int) -> dict:
+        if not post_ids or k <= 0:
+            return {}
+        query = crud._latest_comments(select(Comment).options(selectinload(Comment.user)), post_ids, k)
+        return crud._group_by_post((await db.execute(query)).scalars().all())
+
+    async def get_comments_by_post(db, post_id: int):
+        return (await db.execute(
+            select(Comment)
+            .options(joinedload(Comment.user))
+            .where(Comment.post_id == post_id)
+            .order_by(Comment.created_at.asc())
+        )).scalars().all()
+
+    async def orm_posts(db):
+        posts = await get_recent_posts(db, limit=POSTS)
+        post_ids = [p.id for p in posts]
+        previews = await get_comment_previews(db, post_ids, app_main.COMMENT_PREVIEW_LIMIT)
+        counts = await crud_async.count_comments(db, post_ids)
+        return orm_posts_payload(posts, previews, counts, type_registry)
+
+    async def row_posts(db):
+        posts = await crud_async.get_recent_post_rows(db, limit=POSTS)
+        return await app_main.posts_page(db, posts, POSTS, Response())
+
+    async def orm_comments(db):
+        # 今までの list_comments (投稿を確認してからコメントを読む)
+        await get_post_by_id(db, post_id)
+        return [
+            {
+                "id": c.id,
+                "content": c.content,
+                "created_at": c.created_at.isoformat(),
+                "user": {"id": c.user.id, "name": c.user.name,
+                         "music_type": type_registry.get(c.user.music_type_code)} if c.user else None,
+            }
+            for c in await get_comments_by_post(db, post_id)
+        ]
+
+    async def row_comments(db):
+        return await app_main.list_comments(post_id, db)
+
+    def count_rows(payload):
+        return len(payload) + sum(len(p.get("comments", ())) for p in payload)
+
+    async def request(fn):
+        # get_async_db と同じく、リクエストごとにセッションを作る
+        async with database.AsyncReadSessionLocal() as db:
+            return await fn(db)
+
+    print(f"{'':<34} {'メモリ最大':>12} {'1回':>10} {'行/秒':>12}  ({runs:,} 回)")
+    for name, before, after in (
+        (f"GET /posts ({POSTS}件)", orm_posts, row_posts),
+        (f"GET /posts/{{id}}/comments ({COMMENTS_PER_POST}件)", orm_comments, row_comments),
+    ):
+        assert await request(before) == await request(after), f"{name}: レスポンスが一致しません"
+        for label, fn in (("ORM", before), ("行", after)):
+            tracemalloc.start()
+            peaks = []
+            for _ in range(min(runs, 50)):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                await request(fn)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            tracemalloc.stop()
+
+            rows = 0
+            started = time.perf_counter()
+            for _ in range(runs):
+                rows += count_rows(await request(fn))
+            elapsed = time.perf_counter() - started
+            print(f"  {name + ' ' + label:<32} {sorted(peaks)[len(peaks) // 2] / 1024:>9.1f}KB "
+                  f"{elapsed / runs * 1000:>8.3f}ms {rows / elapsed:>12,.0f}")
+
+    # aiosqlite の接続のスレッドを閉じる (残っているとプロセスが終わらない)
+    await database.async_read_engine.dispose()
+
+
+def main(runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.py がエンジンを作る前にDBの場所を差し替える
+        os.environ["TOMOTUNE_DB_PATH"] = os.path.join(tmp, "bench.db")
+        import database
+        import init_db
+        import type_registry
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_db.init_database()
+        post_id = seed(database)
+        type_registry.load()
+
+        asyncio.run(run(runs, post_id))
+        database.engine.dispose()
+        database.read_engine.dispose()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 300)
@@ -0,0 +1,116 @@
+"""
+GET /posts (50件、各投稿にコメント20件) のレスポンスを作る時間を測る
+
+1. JSONにする部分だけ: 同じ中身を
+   - 今まで: jsonable_encoder (辞書を1つずつたどる) + JSONResponse (json.dumps)
+   - レスポンスモデル: pydantic-core で検証・変換 + FastJSONResponse (pydantic_core.to_json)
+2. API 全体 (DBの読み込みを含む): GET /posts?limit=50 と GET /posts/{id}/comments (20件)
+
+python -m benchmarks.bench_posts_response [回数]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+POSTS = 50
+COMMENTS_PER_POST = 20
+USERS = 20
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure(fn, runs: int) -> tuple[float, float]:
+    """p50 / p95 (ms)"""
+    fn()
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000
+
+
+def seed(database):
+    from models import Comment, MusicType, Post, Song, User
+
+    db = database.SessionLocal()
+    try:
+        type_codes = [code for (code,) in db.query(MusicType.code)]
+        song_ids = [song_id for (song_id,) in db.query(Song.id)]
+        db.add_all(
+            User(id=f"bench-{i}", name=f"bench-{i}", music_type_code=type_codes[i % len(type_codes)])
+            for i in range(USERS)
+        )
+        db.flush()
+        posts = [
+            Post(user_id=f"bench-{i % USERS}", song_id=song_ids[i % len(song_ids)], comment=f"post {i}")
+            for i in range(POSTS)
+        ]
+        db.add_all(posts)
+        db.flush()
+        db.add_all(
+            Comment(post_id=post.id, user_id=f"bench-{j % USERS}", content=f"comment {j} " + "あ" * 40)
+            for post in posts for j in range(COMMENTS_PER_POST)
+        )
+        db.commit()
+        return posts[0].id
+    finally:
+        db.close()
+
+
+def main(runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.py がエンジンを作る前にDBの場所を差し替える
+        os.environ["TOMOTUNE_DB_PATH"] = os.path.join(tmp, "bench.db")
+        from fastapi.encoders import jsonable_encoder
+        from fastapi.responses import JSONResponse
+        from fastapi.testclient import TestClient
+        from pydantic import TypeAdapter
+        import database
+        import init_db
+        import main as app_main
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_db.init_database()
+        post_id = seed(database)
+
+        with TestClient(app_main.app) as client:
+            payload = client.get("/posts", params={"limit": POSTS}).json()
+            comments = client.get(f"/posts/{post_id}/comments").json()
+            assert len(payload) == POSTS and len(comments) == COMMENTS_PER_POST
+
+            print(f"== JSONにする部分だけ ({POSTS}件の投稿 / {COMMENTS_PER_POST}件のコメント, {runs:,} 回)")
+            for name, data, model in (
+                ("GET /posts", payload, list[app_main.PostResponse]),
+                ("GET /posts/{post_id}/comments", comments, list[app_main.CommentResponse]),
+            ):
+                adapter = TypeAdapter(model)
+                before = measure(lambda: JSONResponse(jsonable_encoder(data)), runs)
+                after = measure(
+                    lambda: app_main.FastJSONResponse(adapter.dump_python(adapter.validate_python(data), mode="json")),
+                    runs,
+                )
+                print(f"  {name:<30} 今まで p50 {before[0]:7.3f}ms p95 {before[1]:7.3f}ms"
+                      f" | モデル p50 {after[0]:7.3f}ms p95 {after[1]:7.3f}ms ({before[0] / after[0]:.1f}倍)")
+
+            print(f"\n== API 全体 (TestClient, {runs:,} 回)")
+            for name, url, params in (
+                ("GET /posts?limit=50", "/posts", {"limit": POSTS}),
+                ("GET /posts/{post_id}/comments", f"/posts/{post_id}/comments", None),
+            ):
+                p50, p95 = measure(lambda: client.get(url, params=params), runs)
+                print(f"  {name:<30} p50 {p50:7.3f}ms p95 {p95:7.3f}ms")
+
+        database.engine.dispose()
+        database.read_engine.dispose()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 300)
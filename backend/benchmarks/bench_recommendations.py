@@ -0,0 +1,55 @@
+"""
+おすすめ曲 (recommendations) の1リクエストあたりの時間を、ランダムな曲ベクトルの曲で測る
+キャッシュが無いとき (採点1回 + 並べ直し) と、キャッシュに当たったときを比べる
+
+python -m benchmarks.bench_recommendations [曲数] [件数] [リクエスト数]
+"""
+import sys
+import time
+
+import numpy as np
+
+import catalog
+from recommendations import RecommendationCache, rank
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure(fn, requests):
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+
+
+def main(songs, limit, requests):
+    rng = np.random.default_rng(0)
+    matrix = catalog.SongMatrix(1, np.arange(1, songs + 1, dtype=np.int64), rng.random((songs, 4), dtype=np.float32))
+    # catalog の行列の代わりに使う
+    catalog.song_matrix = lambda: matrix
+
+    users = rng.random((requests, 4))
+    favorites = [rng.integers(1, songs + 1, size=20).tolist() for _ in range(requests)]
+
+    cold = measure(lambda i: rank(matrix, users[i], favorites[i], limit), requests)
+
+    cache = RecommendationCache(max_users=requests)
+    for i in range(requests):
+        cache.get(f"user-{i}", tuple(users[i]), favorites[i], limit)
+    hit = measure(lambda i: cache.get(f"user-{i}", tuple(users[i]), favorites[i], limit), requests)
+
+    print(f"songs={songs} limit={limit} matrix={matrix.vectors.nbytes / 1024 / 1024:.1f}MB")
+    print(f"scoring    p50={cold[0]:.2f}ms p95={cold[1]:.2f}ms p99={cold[2]:.2f}ms")
+    print(f"cache hit  p50={hit[0]:.3f}ms p95={hit[1]:.3f}ms p99={hit[2]:.3f}ms")
+
+
+if __name__ == "__main__":
+    songs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    main(songs, limit, requests)
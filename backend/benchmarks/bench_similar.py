@@ -0,0 +1,63 @@
+"""
+好みの近いユーザー (taste_index) の検索1回あたりの時間を、ランダムなスコアのユーザーで測る
+全ユーザーを1つの行列で総当たりする場合とも比べる
+
+python -m benchmarks.bench_similar [ユーザー数] [k] [リクエスト数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from taste_index import TasteIndex
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure(search, users, requests, rng):
+    latencies = []
+    for user in rng.integers(users, size=requests).tolist():
+        started = time.perf_counter()
+        search(user)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+
+
+def main(users, k, requests):
+    rng = np.random.default_rng(0)
+    user_ids = [f"user-{i}" for i in range(users)]
+    # いいねを重ねたスコアは 0.5 付近に集まるので、正規分布にする
+    vectors = rng.normal(0.5, 0.15, (users, 4)).clip(0, 1).astype(np.float32)
+
+    index = TasteIndex()
+    started = time.perf_counter()
+    index.build(user_ids, vectors)
+    build_ms = (time.perf_counter() - started) * 1000
+    memory_mb = sum(b.vectors.nbytes + b.members.nbytes for b in index._buckets) / 1024 / 1024
+
+    # 更新 (タイプが変わる人を含む) も測る
+    started = time.perf_counter()
+    for user in rng.integers(users, size=requests).tolist():
+        index.update(user_ids[user], rng.normal(0.5, 0.15, 4).clip(0, 1))
+    update_us = (time.perf_counter() - started) / requests * 1_000_000
+
+    def brute_force(user):
+        d = ((vectors - vectors[user]) ** 2).sum(axis=1)
+        d[user] = np.inf
+        np.argsort(d[np.argpartition(d, k)[:k]])
+
+    ms = measure(lambda user: index.nearest(user_ids[user], k), users, requests, rng)
+    brute_ms = measure(brute_force, users, requests, rng)
+    print(f"users={users} k={k} build={build_ms:.0f}ms matrix={memory_mb:.1f}MB update={update_us:.1f}us")
+    print(f"index        p50={ms[0]:.2f}ms p95={ms[1]:.2f}ms p99={ms[2]:.2f}ms")
+    print(f"brute force  p50={brute_ms[0]:.2f}ms p95={brute_ms[1]:.2f}ms p99={brute_ms[2]:.2f}ms")
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    main(users, k, requests)
@@ -0,0 +1,63 @@
+"""
+友だち候補 (follow_graph) の1リクエストあたりの時間を、ランダムなフォローグラフで測る
+DBは使わず、グラフの探索と並べ替えだけを測る (ユーザーの取得は crud の1クエリ)
+
+python -m benchmarks.bench_suggestions [ユーザー数] [1人あたりのフォロー数] [リクエスト数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from follow_graph import FollowGraph, rank
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def main(users, follows_per_user, requests):
+    rng = np.random.default_rng(0)
+    user_ids = [f"user-{i}" for i in range(users)]
+    src = np.repeat(np.arange(users, dtype=np.int32), follows_per_user)
+    # 人気のあるユーザーほどフォローされやすい分布 (パレート分布)
+    dst = (rng.pareto(1.2, len(src)) * users / 50).astype(np.int64) % users
+    dst = dst.astype(np.int32)
+    scores = rng.random((users, 4), dtype=np.float32)
+
+    graph = FollowGraph()
+    started = time.perf_counter()
+    graph.build(user_ids, src, dst)
+    build_ms = (time.perf_counter() - started) * 1000
+    memory_mb = (graph._indptr.nbytes + graph._indices.nbytes) / 1024 / 1024
+
+    # 差分がある状態も含めて測る
+    for i in range(1000):
+        graph.add_edge(user_ids[rng.integers(users)], user_ids[rng.integers(users)])
+
+    latencies = []
+    pool_sizes = []
+    for user in rng.integers(users, size=requests):
+        started = time.perf_counter()
+        candidate_ids, mutual = graph.candidates(user_ids[user])
+        if candidate_ids:
+            numbers = [int(c.split("-")[1]) for c in candidate_ids]
+            points, _ = rank(mutual, scores[user], scores[numbers])
+            np.argsort(-points)[:10]
+        latencies.append(time.perf_counter() - started)
+        pool_sizes.append(len(candidate_ids))
+    latencies.sort()
+
+    ms = [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+    print(
+        f"users={users} edges={len(src)} build={build_ms:.0f}ms csr={memory_mb:.1f}MB  "
+        f"p50={ms[0]:.2f}ms p95={ms[1]:.2f}ms p99={ms[2]:.2f}ms  "
+        f"candidates(avg)={sum(pool_sizes) / len(pool_sizes):.0f}"
+    )
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    follows_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    main(users, follows_per_user, requests)
@@ -0,0 +1,57 @@
+"""
+急上昇 (trending) の記録と集計の時間を測る
+集計の時間は曲数だけで決まり、記録したいいねの数には関係しないことを確かめる
+
+python -m benchmarks.bench_trending [曲数] [いいね数] [集計の回数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from trending import TrendingCounter, TYPE_GROUPS
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure_top(counter, queries, rng):
+    codes = list(TYPE_GROUPS)
+    latencies = []
+    for i in range(queries):
+        window = "24h" if i % 2 else "7d"
+        music_type = codes[rng.integers(len(codes))] if i % 3 else None
+        started = time.perf_counter()
+        counter.top(window, music_type, 20)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+
+
+def main(songs, likes, queries):
+    rng = np.random.default_rng(0)
+    codes = list(TYPE_GROUPS)
+    counter = TrendingCounter()
+    for song_id in range(songs):
+        counter.record(song_id, None, 0)
+
+    for total in (likes // 10, likes):
+        song_ids = (rng.zipf(1.3, total) % songs).tolist()
+        types = rng.integers(len(codes), size=total).tolist()
+        started = time.perf_counter()
+        for song_id, t in zip(song_ids, types):
+            counter.record(song_id, codes[t])
+        record_us = (time.perf_counter() - started) / total * 1_000_000
+        ms = measure_top(counter, queries, rng)
+        print(
+            f"songs={songs} likes+={total} record={record_us:.1f}us  "
+            f"top p50={ms[0]:.2f}ms p95={ms[1]:.2f}ms p99={ms[2]:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    songs = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    likes = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    main(songs, likes, queries)
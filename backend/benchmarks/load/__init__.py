@@ -0,0 +1,4 @@
+# 負荷試験: 本番規模の合成データを作り、実際の app (main.py) をプロセス内で叩いて API ごとの待ち時間を測る
+# python -m benchmarks.load.datagen    データの生成だけ
+# python -m benchmarks.load            シナリオを実行して結果を JSON に保存
+# python -m benchmarks.load.compare    2回分の JSON を比べる
@@ -0,0 +1,194 @@
+"""
+合成データのDBで実際の app (main.py) をプロセス内で起動し、シナリオごとに同時接続で叩いて
+API ごとの待ち時間 (p50/p95/p99) とスループットを測る。結果は JSON に保存する (compare で比べられる)
+
+python -m benchmarks.load [規模 または DBファイル] [シナリオごとの秒数] [同時接続数] [結果のJSON] [シナリオ,...]
+
+- 規模 (tiny / small / medium / production) を渡すと、その場で合成データを作る
+  大きい規模は先に python -m benchmarks.load.datagen で作っておき、そのDBファイルを渡す
+- DBファイルはコピーしてから使う (試験中の書き込みで元のデータが変わらないように)
+- DB_PROFILE・LIKE_BUFFER_MAX_LOSS_MS などの環境変数はそのまま app に効く
+- 結果のJSONを省略すると benchmarks/results/ に保存する
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.load.scenarios import SCENARIOS, Population, Recorder, VirtualUser
+
+SEED = 0
+# シナリオで使う既存ユーザーの数 (DBから抜き出す)
+SAMPLE_USERS = 5_000
+POPULAR_USERS = 50
+# 結果のJSONの既定の保存先 (git には入れない)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "results")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def load_population(engine) -> Population:
+    rng = random.Random(SEED)
+    with engine.connect() as conn:
+        max_rowid = conn.exec_driver_sql("SELECT max(rowid) FROM users").scalar() or 0
+        rowids = sorted(rng.sample(range(1, max_rowid + 1), min(SAMPLE_USERS, max_rowid)))
+        users = conn.exec_driver_sql(
+            f"SELECT id, name FROM users WHERE rowid IN ({','.join(map(str, rowids))}) ORDER BY rowid"
+        ).all()
+        popular = conn.exec_driver_sql(
+            "SELECT id FROM users ORDER BY follower_count DESC LIMIT ?", (POPULAR_USERS,)
+        ).scalars().all()
+        song_ids = conn.exec_driver_sql("SELECT id FROM songs ORDER BY id").scalars().all()
+    return Population(
+        user_ids=[row.id for row in users],
+        user_names=[row.name for row in users],
+        popular_user_ids=list(popular),
+        song_ids=list(song_ids),
+    )
+
+
+async def run_scenario(client, scenario, population, seconds: float, concurrency: int) -> tuple[Recorder, float]:
+    recorder = Recorder()
+    deadline = time.perf_counter() + seconds
+
+    async def worker(index):
+        vu = VirtualUser(index, client, population, recorder, SEED)
+        while time.perf_counter() < deadline:
+            await scenario(vu)
+            vu.iteration += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return recorder, time.perf_counter() - started
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            "count": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "throughput_rps": round(len(values) / elapsed, 1),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+    requests = sum(r["count"] for r in routes.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": requests,
+        "errors": sum(r["errors"] for r in routes.values()),
+        "throughput_rps": round(requests / elapsed, 1),
+        "routes": routes,
+    }
+
+
+def print_summary(name: str, result: dict):
+    print(f"\n== {name}: {result['requests']:,} リクエスト / {result['elapsed_s']:.1f}秒 "
+          f"= {result['throughput_rps']:,.1f} req/s (エラー {result['errors']})")
+    print(f"  {'API':<36} {'回数':>8} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, r in result["routes"].items():
+        print(f"  {route:<36} {r['count']:>8,} {r['throughput_rps']:>9,.1f} "
+              f"{r['p50_ms']:>7.2f}ms {r['p95_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_all(app, population, scenario_names, seconds, concurrency):
+    import httpx
+    import database
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            for name in scenario_names:
+                database.reset_route_sql_stats()
+                recorder, elapsed = await run_scenario(client, SCENARIOS[name], population, seconds, concurrency)
+                results[name] = summarize(recorder, elapsed)
+                # サーバー側で数えたSQLの数・DBの時間 (GET /debug/sql-stats と同じ)
+                results[name]["sql"] = database.route_sql_stats()
+                print_summary(name, results[name])
+    return results
+
+
+def main(target: str, seconds: float, concurrency: int, output: str | None, scenario_names: list[str]):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "load.db")
+        # database.py がエンジンを作る前にDBの場所を差し替える (datagen も database を読み込む)
+        os.environ["TOMOTUNE_DB_PATH"] = db_path
+        from benchmarks.load import datagen
+        import database
+        import main as app_main
+
+        if target in datagen.SCALES:
+            datagen.generate(db_path, target, SEED)
+        else:
+            print(f"{target} をコピーして使います")
+            shutil.copyfile(target, db_path)
+
+        # 読み込み時などのログを減らす (警告は出す。イベントログは EVENT_LOG_SAMPLE_RATES で間引かれる)
+        logging.getLogger("uvicorn").setLevel(logging.WARNING)
+
+        population = load_population(database.engine)
+        print(f"シナリオ: {', '.join(scenario_names)} (各 {seconds:g}秒, 同時接続 {concurrency})")
+        started_at = datetime.now().isoformat(timespec="seconds")
+        scenarios = asyncio.run(run_all(app_main.app, population, scenario_names, seconds, concurrency))
+        database.engine.dispose()
+        database.read_engine.dispose()
+
+    report = {
+        "meta": {
+            "target": target,
+            "seed": SEED,
+            "seconds": seconds,
+            "concurrency": concurrency,
+            "started_at": started_at,
+            "git_commit": git_commit(),
+            "db_profile": database.DB_PROFILE,
+            "like_buffer_max_loss_ms": os.environ.get("LIKE_BUFFER_MAX_LOSS_MS", "0"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": scenarios,
+    }
+    if output is None:
+        name = os.path.splitext(os.path.basename(target))[0]
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{name}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        args[0] if len(args) > 0 else "tiny",
+        float(args[1]) if len(args) > 1 else 10,
+        int(args[2]) if len(args) > 2 else 32,
+        args[3] if len(args) > 3 and args[3] else None,
+        args[4].split(",") if len(args) > 4 else list(SCENARIOS),
+    )
@@ -0,0 +1,49 @@
+"""
+負荷試験の結果 (python -m benchmarks.load の JSON) を2つ比べ、API ごとの p50/p95/p99 とスループットの変化を表示する
+
+python -m benchmarks.load.compare <前の結果.json> <今回の結果.json>
+"""
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def change(before, after):
+    if not before:
+        return "    -"
+    return f"{(after - before) / before * 100:+5.0f}%"
+
+
+def compare(before: dict, after: dict):
+    for key in ("target", "git_commit", "concurrency", "seconds", "db_profile"):
+        print(f"{key:>12}: {before['meta'].get(key)} -> {after['meta'].get(key)}")
+
+    for name, result in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            print(f"\n== {name}: 前の結果にありません")
+            continue
+        print(f"\n== {name}: {old['throughput_rps']:,.1f} -> {result['throughput_rps']:,.1f} req/s "
+              f"({change(old['throughput_rps'], result['throughput_rps'])})")
+        print(f"  {'API':<36} {'p50':>22} {'p95':>22} {'p99':>22} {'req/s':>8}")
+        for route, r in result["routes"].items():
+            o = old["routes"].get(route)
+            if o is None:
+                print(f"  {route:<36} (新規)")
+                continue
+            cells = [
+                f"{o[p]:7.2f}->{r[p]:7.2f} {change(o[p], r[p])}"
+                for p in ("p50_ms", "p95_ms", "p99_ms")
+            ]
+            print(f"  {route:<36} {cells[0]:>22} {cells[1]:>22} {cells[2]:>22} "
+                  f"{change(o['throughput_rps'], r['throughput_rps']):>8}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    compare(load(sys.argv[1]), load(sys.argv[2]))
@@ -0,0 +1,290 @@
+"""
+負荷試験用の合成データを作る (同じ規模・シードなら毎回同じデータになる)
+
+- ユーザー: 4軸スコアはばらばら。名前は bench0000000 から連番 (ログインの試験で使う)
+- フォロー: 一部の人気ユーザーにフォロワーが集中する (べき分布)
+- いいね: 「同じ曲を数秒の間に何回も押す」連打をひとまとまりとして作る。人気の曲・よく使う人に偏る
+- 投稿・コメント: 投稿する人・コメントする人も偏る
+- 集計 (like_counts・フォロー数・タイムライン) は crud と同じ形で作り直す
+
+python -m benchmarks.load.datagen <DBファイル> [規模] [シード]
+規模: tiny / small / medium / production (production は 100万ユーザー・1億いいね)
+"""
+import os
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from data import songs as catalog_songs, music_types
+from migrations import upgrade_schema
+from models import SONG_FEATURE_COLUMNS
+from taste_index import bucket_numbers, type_code_of
+import crud
+
+
+@dataclass(frozen=True)
+class Scale:
+    users: int
+    songs: int
+    likes: int
+    follows_per_user: float
+    posts_per_user: float
+    comments_per_post: float
+    # この日数の間にばらまく (いいねログの保存期間 30日 より短くして、起動時の圧縮が走らないようにする)
+    days: int = 28
+
+
+SCALES = {
+    "tiny": Scale(users=2_000, songs=200, likes=100_000, follows_per_user=15, posts_per_user=1, comments_per_post=2),
+    "small": Scale(users=20_000, songs=1_000, likes=1_000_000, follows_per_user=20, posts_per_user=2, comments_per_post=3),
+    "medium": Scale(users=200_000, songs=3_000, likes=10_000_000, follows_per_user=25, posts_per_user=2, comments_per_post=3),
+    "production": Scale(users=1_000_000, songs=5_000, likes=100_000_000, follows_per_user=30, posts_per_user=2, comments_per_post=3),
+}
+
+# 1回の INSERT にまとめる行数
+CHUNK_ROWS = 500_000
+# 連打1回あたりの平均タップ数と、タップの間隔 (秒)
+MEAN_BURST_TAPS = 3
+TAP_GAP_SECONDS = (0.15, 1.5)
+# 偏りの強さ (べき分布の指数。大きいほど上位に集中する)
+FOLLOW_SKEW = 0.9      # フォローされる相手
+ACTIVITY_SKEW = 0.8    # いいね・投稿・コメントする人
+SONG_SKEW = 1.0        # いいね・投稿される曲
+
+
+def user_name(i: int) -> str:
+    return f"bench{i:07d}"
+
+
+def _power_law(rng, n: int, size, exponent: float) -> np.ndarray:
+    """0..n-1 の番号を、k 番が (k+1)^-exponent に比例する割合で選ぶ (連続のべき分布の逆関数で引く)"""
+    u = rng.random(size)
+    if exponent == 1:
+        x = (n + 1) ** u
+    else:
+        x = (1 + u * ((n + 1) ** (1 - exponent) - 1)) ** (1 / (1 - exponent))
+    return np.minimum(x.astype(np.int64) - 1, n - 1)
+
+
+def _timestamps(now: float, seconds) -> list[str]:
+    """UNIX時刻 -> SQLAlchemy の DateTime と同じ形の文字列 ('2025-01-01 12:00:00.000000')"""
+    values = (np.asarray(seconds) * 1_000_000).astype("datetime64[us]")
+    # DB には現地時刻で入っているので、UTC との差を足す
+    values = values + np.timedelta64(int(datetime.fromtimestamp(now).astimezone().utcoffset().total_seconds()), "s")
+    return np.char.replace(np.datetime_as_string(values, unit="us"), "T", " ").tolist()
+
+
+def _ages(rng, days: int, size) -> np.ndarray:
+    """何秒前か (新しいほど多い。days 日までで打ち切った指数分布)"""
+    scale, limit = days * 86400 / 3, days * 86400
+    return -scale * np.log1p(-rng.random(size) * (1 - np.exp(-limit / scale)))
+
+
+class Generator:
+    def __init__(self, path: str, scale: Scale, seed: int = 0):
+        self.path = path
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.now = time.time()
+        self.engine = create_engine(f"sqlite:///{path}")
+        # 読み込みの間だけ安全性を下げて速くする (途中で落ちたら作り直す)
+        event.listen(self.engine, "connect", _bulk_load_pragmas)
+        # 人気の順番 (番号が小さいほど人気) -> ユーザー番号・曲番号
+        self.user_rank = self.rng.permutation(scale.users)
+        self.user_ids = []
+        self.song_ids = []
+
+    def run(self):
+        started = time.perf_counter()
+        upgrade_schema(self.engine)
+        for step in (self.songs, self.types, self.users, self.follows, self.posts, self.likes, self.aggregates):
+            step_started = time.perf_counter()
+            rows = step()
+            print(f"  {step.__name__}: {rows:,} 行 ({time.perf_counter() - step_started:.1f}秒)", flush=True)
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        self.engine.dispose()
+        print(f"完了 ({time.perf_counter() - started:.1f}秒)")
+
+    def _insert(self, sql: str, rows):
+        with self.engine.begin() as conn:
+            for start in range(0, len(rows), CHUNK_ROWS):
+                conn.exec_driver_sql(sql, rows[start:start + CHUNK_ROWS])
+
+    # --- 各テーブル ---
+
+    def songs(self) -> int:
+        rows = []
+        for s in catalog_songs:
+            rows.append((s["title"], s["artist"], s["url"], *(s["features"].get(c) for c in SONG_FEATURE_COLUMNS)))
+        for i in range(len(rows), self.scale.songs):
+            f = self.rng.random(8)
+            features = (
+                *f.round(3).tolist()[:5],                       # acousticness .. liveness
+                round(-30 + 28 * f[5], 1),                      # loudness
+                round(float(f[6]) * 0.3, 3),                    # speechiness
+                round(float(f[7]), 3),                          # valence
+                round(float(self.rng.uniform(60, 190)), 1),     # tempo
+                int(self.rng.integers(12)), int(self.rng.integers(2)), 4,
+            )
+            rows.append((f"Bench Song {i}", f"Bench Artist {i % 97}", catalog_songs[i % len(catalog_songs)]["url"], *features))
+        columns = ", ".join(SONG_FEATURE_COLUMNS)
+        placeholders = ", ".join("?" * (3 + len(SONG_FEATURE_COLUMNS)))
+        self._insert(f"INSERT INTO songs (title, artist, url, {columns}) VALUES ({placeholders})", rows)
+        with self.engine.connect() as conn:
+            self.song_ids = np.array([row[0] for row in conn.exec_driver_sql("SELECT id FROM songs ORDER BY id")])
+        self.song_rank = self.rng.permutation(len(self.song_ids))
+        return len(rows)
+
+    def types(self) -> int:
+        rows = [(t["code"], t["name"], t["description"]) for t in music_types]
+        self._insert("INSERT OR REPLACE INTO music_types (code, name, description) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def users(self) -> int:
+        n = self.scale.users
+        scores = self.rng.beta(2, 2, (n, 4))
+        codes = [type_code_of(b) for b in range(16)]
+        buckets = bucket_numbers(scores)
+        raw = self.rng.bytes(16 * n)
+        self.user_ids = [str(uuid.UUID(bytes=raw[16 * i:16 * i + 16], version=4)) for i in range(n)]
+        rows = [
+            (self.user_ids[i], user_name(i), *scores[i].tolist(), codes[buckets[i]])
+            for i in range(n)
+        ]
+        self._insert(
+            "INSERT INTO users (id, name, score_vc, score_ma, score_pr, score_hs, music_type_code, "
+            "follower_count, following_count) VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0)",
+            rows,
+        )
+        return n
+
+    def follows(self) -> int:
+        """フォローする数は人によってばらばら、フォローされる相手は人気ユーザーに偏る"""
+        n = self.scale.users
+        total = 0
+        per_chunk = max(1, CHUNK_ROWS // int(self.scale.follows_per_user + 1))
+        for start in range(0, n, per_chunk):
+            followers = np.arange(start, min(n, start + per_chunk))
+            degrees = np.minimum(self.rng.geometric(1 / self.scale.follows_per_user, len(followers)), n - 1)
+            sources = np.repeat(followers, degrees)
+            targets = self.user_rank[_power_law(self.rng, n, len(sources), FOLLOW_SKEW)]
+            keep = sources != targets
+            pairs = np.unique(sources[keep] * n + targets[keep])
+            created = _timestamps(self.now, self.now - _ages(self.rng, self.scale.days, len(pairs)))
+            rows = [
+                (self.user_ids[pair // n], self.user_ids[pair % n], created[j])
+                for j, pair in enumerate(pairs.tolist())
+            ]
+            self._insert("INSERT INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, ?)", rows)
+            total += len(rows)
+        return total
+
+    def posts(self) -> int:
+        n_posts = int(self.scale.users * self.scale.posts_per_user)
+        authors = self.user_rank[_power_law(self.rng, self.scale.users, n_posts, ACTIVITY_SKEW)]
+        songs = self.song_ids[self.song_rank[_power_law(self.rng, len(self.song_ids), n_posts, SONG_SKEW)]]
+        # 古い順に id を振る (id と created_at の順番をそろえる)
+        posted = np.sort(self.now - _ages(self.rng, self.scale.days, n_posts))
+        created = _timestamps(self.now, posted)
+        rows = [
+            (i + 1, self.user_ids[a], int(s), f"bench post {i}", created[i])
+            for i, (a, s) in enumerate(zip(authors.tolist(), songs.tolist()))
+        ]
+        self._insert("INSERT INTO posts (id, user_id, song_id, comment, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+        # コメント: 投稿から少し後 (新しい投稿ほどまだ少ない)
+        counts = self.rng.poisson(self.scale.comments_per_post, n_posts)
+        post_index = np.repeat(np.arange(n_posts), counts)
+        commented = np.minimum(posted[post_index] + self.rng.exponential(3 * 3600, len(post_index)), self.now)
+        order = np.argsort(commented, kind="stable")
+        post_index, commented = post_index[order], commented[order]
+        commenters = self.user_rank[_power_law(self.rng, self.scale.users, len(post_index), ACTIVITY_SKEW)]
+        created = _timestamps(self.now, commented)
+        comment_rows = [
+            (int(p) + 1, self.user_ids[u], f"bench comment {j}", created[j])
+            for j, (p, u) in enumerate(zip(post_index.tolist(), commenters.tolist()))
+        ]
+        self._insert("INSERT INTO comments (post_id, user_id, content, created_at) VALUES (?, ?, ?, ?)", comment_rows)
+        return len(rows) + len(comment_rows)
+
+    def likes(self) -> int:
+        """連打 (同じ人が同じ曲を数秒の間に何回も押す) 単位で作る"""
+        total = 0
+        while total < self.scale.likes:
+            remaining = self.scale.likes - total
+            bursts = max(1, min(CHUNK_ROWS, remaining) // MEAN_BURST_TAPS)
+            taps = self.rng.geometric(1 / MEAN_BURST_TAPS, bursts)
+            # 合計が残りの件数を超えないように、はみ出した連打を削る
+            taps = np.diff(np.minimum(np.cumsum(taps), remaining), prepend=0)
+            users = self.user_rank[_power_law(self.rng, self.scale.users, bursts, ACTIVITY_SKEW)]
+            songs = self.song_ids[self.song_rank[_power_law(self.rng, len(self.song_ids), bursts, SONG_SKEW)]]
+            started = self.now - _ages(self.rng, self.scale.days, bursts)
+
+            burst_of = np.repeat(np.arange(bursts), taps)
+            # 連打の中での経過秒数 (連打ごとに 0 から数える)
+            elapsed = np.cumsum(self.rng.uniform(*TAP_GAP_SECONDS, len(burst_of)))
+            first_tap = np.cumsum(taps) - taps
+            offsets = elapsed - elapsed[first_tap[burst_of]]
+            stamps = _timestamps(self.now, np.minimum(started[burst_of] + offsets, self.now))
+            user_ids = self.user_ids
+            rows = [
+                (user_ids[u], s, stamps[j])
+                for j, (u, s) in enumerate(zip(users[burst_of].tolist(), songs[burst_of].tolist()))
+            ]
+            self._insert("INSERT INTO like_logs (user_id, song_id, timestamp) VALUES (?, ?, ?)", rows)
+            total += len(rows)
+        return total
+
+    def aggregates(self) -> int:
+        """like_counts・フォロー数・タイムラインを、アプリが書き込むのと同じ形で作る"""
+        db = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)()
+        try:
+            counts = crud.rebuild_like_counts(db)
+            crud.reconcile_follow_counts(db)
+        finally:
+            db.close()
+        with self.engine.begin() as conn:
+            timeline = conn.execute(text(
+                "INSERT INTO timeline_entries (user_id, post_id, created_at) "
+                "SELECT follows.follower_id, posts.id, posts.created_at FROM posts "
+                "JOIN users ON users.id = posts.user_id "
+                "JOIN follows ON follows.followed_id = posts.user_id "
+                "WHERE users.follower_count <= :limit"
+            ), {"limit": crud.TIMELINE_FANOUT_MAX_FOLLOWERS}).rowcount
+            conn.exec_driver_sql("ANALYZE")
+        return counts + timeline
+
+
+def _bulk_load_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA cache_size=-200000")
+    cursor.close()
+
+
+def generate(path: str, scale_name: str = "small", seed: int = 0):
+    """path に合成データのDBを作る (既にあれば作り直す)"""
+    scale = SCALES[scale_name]
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    print(f"合成データを作成: {path} (規模 {scale_name}: ユーザー {scale.users:,} / いいね {scale.likes:,}, シード {seed})")
+    Generator(path, scale, seed).run()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    generate(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else "small",
+        int(sys.argv[3]) if len(sys.argv) > 3 else 0,
+    )
@@ -0,0 +1,158 @@
+"""
+負荷試験のシナリオ (仮想ユーザー1人の1回分の操作)
+
+各シナリオは async def scenario(vu) で、vu.call(...) で API を呼ぶ
+待ち時間は API ("GET /posts/{post_id}/comments" のようなパスのテンプレート) ごとに記録する
+"""
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+# 1ページの件数 (フロントの Home と同じくらい)
+PAGE_SIZE = 20
+# スクロールして読むページ数の最大
+MAX_PAGES = 3
+
+
+@dataclass
+class Population:
+    """シナリオで使う既存のデータ (DBから抜き出したもの)"""
+    user_ids: list[str]
+    user_names: list[str]
+    popular_user_ids: list[str]
+    song_ids: list[int]
+
+
+@dataclass
+class Recorder:
+    """API ごとの待ち時間 (秒) とエラー数"""
+    latencies: dict = field(default_factory=lambda: defaultdict(list))
+    errors: dict = field(default_factory=lambda: defaultdict(int))
+
+    def add(self, route: str, seconds: float, ok: bool):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+
+class VirtualUser:
+    """1人分の仮想ユーザー (乱数は番号ごとに固定なので、同じ設定なら同じ順に操作する)"""
+
+    def __init__(self, index: int, client, population: Population, recorder: Recorder, seed: int = 0):
+        self.index = index
+        self.client = client
+        self.population = population
+        self.recorder = recorder
+        self.rng = random.Random(seed * 100_003 + index)
+        self.user_id = self.rng.choice(population.user_ids)
+        self.iteration = 0
+
+    async def call(self, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        # 404 は「消された投稿を開いた」などシナリオ上ありうるので、5xx と 4xx (404以外) をエラーにする
+        ok = response.status_code < 400 or response.status_code == 404
+        self.recorder.add(route, time.perf_counter() - started, ok)
+        return response
+
+    def song(self) -> int:
+        """人気の曲ほど選ばれやすい (前の方の曲を多めに)"""
+        songs = self.population.song_ids
+        return songs[min(int(len(songs) * self.rng.random() ** 3), len(songs) - 1)]
+
+    def someone(self) -> str:
+        """見に行くユーザー (3割は人気ユーザー)"""
+        if self.population.popular_user_ids and self.rng.random() < 0.3:
+            return self.rng.choice(self.population.popular_user_ids)
+        return self.rng.choice(self.population.user_ids)
+
+
+async def login_storm(vu: VirtualUser):
+    """起動直後などのログインの集中 (ほとんどは既存ユーザー、1割は新規登録)"""
+    if vu.rng.random() < 0.1:
+        name = f"storm-{vu.index}-{vu.iteration}"
+    else:
+        name = vu.rng.choice(vu.population.user_names)
+    await vu.call("POST /login", "POST", "/login", json={"name": name})
+
+
+async def heart_spam(vu: VirtualUser):
+    """同じ曲のハートを連打する (2割はまとめて送る /likes/batch、たまに取り消す)"""
+    song_id = vu.song()
+    taps = vu.rng.randint(3, 15)
+    if vu.rng.random() < 0.2:
+        await vu.call("POST /likes/batch", "POST", "/likes/batch", json={
+            "user_id": vu.user_id, "taps": [{"song_id": song_id, "count": taps}],
+        })
+    else:
+        for _ in range(taps):
+            await vu.call("POST /likes", "POST", "/likes", json={"song_id": song_id, "user_id": vu.user_id})
+    if vu.rng.random() < 0.05:
+        await vu.call("DELETE /likes", "DELETE", "/likes", json={"song_id": song_id, "user_id": vu.user_id})
+
+
+async def feed_scroll(vu: VirtualUser):
+    """Home の一覧とフォロー中のタイムラインをスクロールし、投稿のコメントを開く (たまにコメントする)"""
+    if vu.rng.random() < 0.5:
+        route, url = "GET /posts", "/posts"
+    else:
+        route, url = "GET /timeline/{user_id}", f"/timeline/{vu.user_id}"
+
+    cursor = None
+    seen = []
+    for _ in range(vu.rng.randint(1, MAX_PAGES)):
+        params = {"limit": PAGE_SIZE}
+        if cursor:
+            params["cursor"] = cursor
+        response = await vu.call(route, "GET", url, params=params)
+        if response.status_code != 200:
+            return
+        seen.extend(post["id"] for post in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    if seen:
+        post_id = vu.rng.choice(seen)
+        await vu.call("GET /posts/{post_id}/comments", "GET", f"/posts/{post_id}/comments")
+        if vu.rng.random() < 0.1:
+            await vu.call(
+                "POST /posts/{post_id}/comments", "POST", f"/posts/{post_id}/comments",
+                json={"user_id": vu.user_id, "content": f"load test {vu.index}-{vu.iteration}"},
+            )
+    if vu.rng.random() < 0.02:
+        await vu.call("POST /posts", "POST", "/posts", json={
+            "user_id": vu.user_id, "song_id": vu.song(), "comment": f"load test {vu.index}-{vu.iteration}",
+        })
+
+
+async def profile_views(vu: VirtualUser):
+    """他の人のプロフィールとお気に入りを見る (自分のおすすめ・急上昇も見る、たまにフォローする)"""
+    target = vu.someone()
+    await vu.call("GET /users/{user_id}", "GET", f"/users/{target}", params={"viewer_id": vu.user_id})
+    await vu.call("GET /favorites/{user_id}", "GET", f"/favorites/{target}")
+
+    roll = vu.rng.random()
+    if roll < 0.25:
+        await vu.call("GET /users/{user_id}/suggestions", "GET", f"/users/{vu.user_id}/suggestions")
+    elif roll < 0.5:
+        await vu.call("GET /users/{user_id}/similar", "GET", f"/users/{vu.user_id}/similar")
+    elif roll < 0.75:
+        await vu.call("GET /recommendations/{user_id}", "GET", f"/recommendations/{vu.user_id}")
+    else:
+        await vu.call("GET /trending", "GET", "/trending", params={"window": vu.rng.choice(["24h", "7d"])})
+
+    if target != vu.user_id and vu.rng.random() < 0.05:
+        if vu.rng.random() < 0.7:
+            await vu.call("POST /users/{target_id}/follow", "POST", f"/users/{target}/follow", json={"user_id": vu.user_id})
+        else:
+            await vu.call("DELETE /users/{target_id}/follow", "DELETE", f"/users/{target}/follow", json={"user_id": vu.user_id})
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "heart_spam": heart_spam,
+    "feed_scroll": feed_scroll,
+    "profile_views": profile_views,
+}
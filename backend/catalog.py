@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database import read_engine, ReadSessionLocal
+from models import Song, SONG_FEATURE_COLUMNS
+import crud
+
+# --- 曲の4軸ベクトル ---
+# いいね時に使う「曲がユーザーのスコアを引っ張る先」(VC, MA, PR, HS) を
+# 起動時にまとめて計算し、プロセス全体で共有する
+#   VC <- valence / MA <- instrumentalness / PR <- energy / HS <- acousticness
+# 値が無い列は既定値を使う (valence・energy は中間、instrumentalness・acousticness は 0)
+AXIS_DEFAULTS = (0.5, 0.0, 0.5, 0.0)
+
+_lock = threading.Lock()
+
+
+class _VectorTable:
+    """曲ベクトルの表 (読み込み直すときは丸ごと差し替える)"""
+
+    def __init__(self):
+        self.song_ids = array("q")   # 行番号 -> song_id
+        self.vectors = array("d")    # 4つずつ並べたベクトル (行番号*4 から4つ)
+        self.index = {}              # song_id -> 行番号
+
+    def append(self, song: Song):
+        self.index[song.id] = len(self.song_ids)
+        self.song_ids.append(song.id)
+        self.vectors.extend(song_vector(song))
+
+
+_table = _VectorTable()
+
+
+def song_vector(song: Song):
+    """Song の特徴量列から4軸ベクトルを作る"""
+    values = (song.valence, song.instrumentalness, song.energy, song.acousticness)
+    return tuple(
+        float(v) if v is not None else default
+        for v, default in zip(values, AXIS_DEFAULTS)
+    )
+
+
+def load_song_vectors(db: Session):
+    """全曲のベクトルを読み込み直す (起動時・曲の追加後)"""
+    global _table
+    table = _VectorTable()
+    for song in db.query(Song).order_by(Song.id).all():
+        table.append(song)
+    with _lock:
+        _table = table
+
+
+def get_song_vector(db: Session, song_id: int):
+    """
+    曲の4軸ベクトルを返す (曲が無ければ None)
+    起動後に追加された曲は、最初に使われたときにDBから読み込む
+    """
+    table = _table
+    i = table.index.get(song_id)
+    if i is None:
+        song = db.query(Song).filter(Song.id == song_id).first()
+        if song is None:
+            return None
+        with _lock:
+            table = _table
+            if song_id not in table.index:
+                table.append(song)
+            i = table.index[song_id]
+    return tuple(table.vectors[i * 4:i * 4 + 4])
+
+
+# --- おすすめ曲用の曲行列 ---
+# 曲ベクトルの表を NumPy の行列 (float32) にしたもの。曲が増えたら作り直す
+
+class SongMatrix:
+    def __init__(self, version: int, song_ids: np.ndarray, vectors: np.ndarray):
+        self.version = version    # 作り直すたびに増える (キャッシュの無効化用)
+        self.song_ids = song_ids  # 行番号 -> song_id (int64)
+        self.vectors = vectors    # 曲数 x 4 (float32)
+        self.squared_norms = (vectors * vectors).sum(axis=1)  # 距離の計算用
+
+
+_matrix = None
+_matrix_source = None  # (_table, 曲数): 行列を作ったときの表
+
+
+def song_matrix() -> SongMatrix:
+    """全曲の4軸ベクトルの行列を返す"""
+    global _matrix, _matrix_source
+    matrix, table = _matrix, _table
+    if matrix is not None and _matrix_source == (table, len(table.song_ids)):
+        return matrix
+    with _lock:
+        table = _table
+        size = len(table.song_ids)
+        # array を直接参照し続けると append できなくなるのでコピーする
+        song_ids = np.array(table.song_ids, dtype=np.int64)
+        vectors = np.array(table.vectors, dtype=np.float32).reshape(size, 4)
+        version = _matrix.version + 1 if _matrix is not None else 1
+        _matrix = SongMatrix(version, song_ids, vectors)
+        _matrix_source = (table, size)
+        return _matrix
+
+
+# --- GET /songs のレスポンスキャッシュ ---
+# 曲一覧は init_db.py で曲を追加したときしか変わらないので、
+# JSONにエンコード済みのバイト列とハッシュ(ETag)を持っておき、毎回のDBアクセス・変換をしない
+
+# 曲が追加されていないか確認する間隔(秒)
+CHECK_INTERVAL = float(os.environ.get("CATALOG_CHECK_SECONDS", "30"))
+# ブラウザにはキャッシュさせつつ、毎回 ETag で確認させる
+CACHE_CONTROL = "public, no-cache"
+
+
+class _EncodedCatalog:
+    def __init__(self, version: int, body: bytes, fingerprint):
+        self.version = version
+        self.body = body
+        # 内容のハッシュなので、再起動しても中身が同じなら同じ ETag になる
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.fingerprint = fingerprint
+
+
+_catalog_lock = threading.Lock()
+_encoded = None
+_checked_at = 0.0
+
+
+def _songs_fingerprint(conn):
+    """曲が追加されたら変わる値 (init_db.py は曲を追加するだけで更新はしない)"""
+    return conn.execute(select(func.count(), func.max(Song.id)).select_from(Song)).one()
+
+
+def song_payload(song: Song) -> dict:
+    return {
+        "id": song.id,
+        "title": song.title,
+        "artist": song.artist,
+        "url": song.url,
+        "features": {name: getattr(song, name) for name in SONG_FEATURE_COLUMNS},
+    }
+
+
+def _build():
+    global _encoded, _checked_at
+    db = ReadSessionLocal()
+    try:
+        fingerprint = _songs_fingerprint(db.connection())
+        songs = crud.get_all_songs(db)
+        # FastAPI の JSONResponse と同じ形式でエンコード
+        body = json.dumps(
+            [song_payload(song) for song in songs],
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        # 曲が増えていればベクトルも読み込み直す
+        if _encoded is not None and fingerprint != _encoded.fingerprint:
+            load_song_vectors(db)
+    finally:
+        db.close()
+    version = _encoded.version + 1 if _encoded is not None else 1
+    _encoded = _EncodedCatalog(version, body, fingerprint)
+    _checked_at = time.monotonic()
+    return _encoded
+
+
+def get_encoded_catalog():
+    """エンコード済みの曲一覧 (body, etag) を返す"""
+    global _checked_at
+    encoded = _encoded
+    now = time.monotonic()
+    if encoded is not None and now - _checked_at < CHECK_INTERVAL:
+        return encoded.body, encoded.etag
+
+    with _catalog_lock:
+        encoded = _encoded
+        if encoded is not None and now - _checked_at < CHECK_INTERVAL:
+            return encoded.body, encoded.etag
+        if encoded is not None:
+            with read_engine.connect() as conn:
+                fingerprint = _songs_fingerprint(conn)
+            if fingerprint == encoded.fingerprint:
+                _checked_at = now
+                return encoded.body, encoded.etag
+        encoded = _build()
+    return encoded.body, encoded.etag
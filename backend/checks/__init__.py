@@ -0,0 +1,2 @@
+# DBまわりの性能を確認するスクリプト置き場 (失敗したら終了コード1)
+# backend ディレクトリから python -m checks.<名前> で実行する
@@ -0,0 +1,160 @@
+"""
+crud.py の全関数が発行するSQLについて EXPLAIN QUERY PLAN を取り、
+インデックスを使わずにテーブルを全件走査しているものがあれば失敗にする
+
+python -m checks.query_plans
+"""
+import inspect
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from migrations import upgrade_schema
+from models import User, Song
+import crud
+
+USER_A = "user-a"
+USER_B = "user-b"
+
+# crud の関数ごとの呼び出し方 (上から順に実行するので、作成→取得→削除の順に並べる)
+CASES = [
+    ("get_all_songs", lambda db: crud.get_all_songs(db)),
+    ("get_song_by_id", lambda db: crud.get_song_by_id(db, 1)),
+    ("get_songs_by_ids", lambda db: crud.get_songs_by_ids(db, [1, 2])),
+    ("get_user_by_name", lambda db: crud.get_user_by_name(db, "a")),
+    ("get_user_by_id", lambda db: crud.get_user_by_id(db, USER_A)),
+    ("get_users_by_ids", lambda db: crud.get_users_by_ids(db, [USER_A, USER_B])),
+    ("get_user_profile", lambda db: crud.get_user_profile(db, USER_A, USER_B)),
+    ("create_user", lambda db: crud.create_user(db, "c")),
+    ("get_test_user", lambda db: crud.get_test_user(db)),
+    ("create_like", lambda db: crud.create_like(db, USER_A, 1)),
+    ("apply_like", lambda db: crud.apply_like(db, USER_A, 1, (0.5, 0.5, 0.5, 0.5))),
+    ("save_like_batch", lambda db: crud.save_like_batch(
+        db,
+        [{"user_id": USER_A, "song_id": 2, "timestamp": datetime.now()}],
+        [{"id": USER_A, "score_vc": 0.5, "score_ma": 0.5, "score_pr": 0.5, "score_hs": 0.5, "music_type_code": "VAPH"}],
+    )),
+    ("count_likes", lambda db: crud.count_likes(db, 1, USER_A)),
+    ("get_like_counts", lambda db: crud.get_like_counts(db, USER_A, [1, 2])),
+    ("get_favorite_song_ids", lambda db: crud.get_favorite_song_ids(db, USER_A)),
+    ("count_likes_by_hour", lambda db: crud.count_likes_by_hour(db, datetime(2000, 1, 1))),
+    ("delete_latest_likes", lambda db: crud.delete_latest_likes(db, USER_A, 1, 1)),
+    ("delete_like_log", lambda db: crud.delete_like_log(db, USER_A, 1)),
+    ("compact_like_logs", lambda db: crud.compact_like_logs(db, datetime(2100, 1, 1), 1000)),
+    ("delete_latest_likes(rollups)", lambda db: crud.delete_latest_likes(db, USER_A, 2, 3)),
+    ("rebuild_like_counts", lambda db: crud.rebuild_like_counts(db)),
+    ("create_post", lambda db: crud.create_post(db, USER_A, 1, "hello")),
+    ("post_exists", lambda db: crud.post_exists(db, 1)),
+    ("get_recent_post_rows", lambda db: crud.get_recent_post_rows(db, limit=10)),
+    ("get_recent_post_rows(cursor)", lambda db: crud.get_recent_post_rows(db, limit=10, before=(datetime.now(), 10))),
+    ("create_comment", lambda db: crud.create_comment(db, 1, USER_B, "nice")),
+    ("count_comments", lambda db: crud.count_comments(db, [1])),
+    ("get_comment_preview_rows", lambda db: crud.get_comment_preview_rows(db, [1], 3)),
+    ("get_comment_rows_by_post", lambda db: crud.get_comment_rows_by_post(db, 1)),
+    ("create_follow", lambda db: crud.create_follow(db, USER_B, USER_A)),
+    ("create_post(fan-out)", lambda db: crud.create_post(db, USER_A, 2, "for followers")),
+    ("get_timeline_post_rows", lambda db: crud.get_timeline_post_rows(db, USER_B, limit=10)),
+    ("get_timeline_post_rows(cursor)",
+     lambda db: crud.get_timeline_post_rows(db, USER_B, limit=10, before=(datetime.now(), 10))),
+    ("is_following", lambda db: crud.is_following(db, USER_B, USER_A)),
+    ("count_followers", lambda db: crud.count_followers(db, USER_A)),
+    ("count_followings", lambda db: crud.count_followings(db, USER_B)),
+    ("delete_follow", lambda db: crud.delete_follow(db, USER_B, USER_A)),
+    ("reconcile_follow_counts", lambda db: crud.reconcile_follow_counts(db)),
+]
+
+# 全件を読むのが目的の関数 (関数名 -> 全件走査してよいテーブル)
+FULL_SCAN_ALLOWED = {
+    "get_all_songs": {"songs"},
+    "rebuild_like_counts": {"like_logs", "like_counts", "like_rollups"},
+    "reconcile_follow_counts": {"users"},
+}
+
+WRITE_OR_READ = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*SELECT|WITH)", re.I)
+
+
+def seed(db):
+    db.add_all([
+        User(id=USER_A, name="a", score_vc=0.5, score_ma=0.5, score_pr=0.5, score_hs=0.5),
+        User(id=USER_B, name="b", score_vc=0.5, score_ma=0.5, score_pr=0.5, score_hs=0.5),
+        Song(id=1, title="s1", artist="x", url="/static/s1.mp3", valence=0.1),
+        Song(id=2, title="s2", artist="x", url="/static/s2.mp3", valence=0.9),
+    ])
+    db.commit()
+
+
+def full_scans(plan, table_names):
+    """プランの中でインデックスを使わずに走査しているテーブル名"""
+    scanned = set()
+    for detail in plan:
+        m = re.match(r"SCAN (\w+)(?: AS \w+)?$", detail)
+        if not m:
+            continue
+        # joinedload の別名 (users_1 など) も元のテーブルとして扱う
+        name = re.sub(r"_\d+$", "", m.group(1))
+        if name in table_names:
+            scanned.add(name)
+    return scanned
+
+
+def main():
+    missing = sorted(
+        name for name, fn in inspect.getmembers(crud, inspect.isfunction)
+        if fn.__module__ == crud.__name__ and not name.startswith("_")
+        and name not in {case.split("(")[0] for case, _ in CASES}
+    )
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        upgrade_schema(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        seed(db)
+        db.close()
+        table_names = set(Base.metadata.tables)
+
+        for case, fn in CASES:
+            captured = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if WRITE_OR_READ.match(statement):
+                    captured.append((statement, parameters[0] if executemany else parameters))
+
+            event.listen(engine, "before_cursor_execute", capture)
+            db = Session()
+            try:
+                fn(db)
+            finally:
+                db.close()
+                event.remove(engine, "before_cursor_execute", capture)
+
+            allowed = FULL_SCAN_ALLOWED.get(case, set())
+            with engine.connect() as conn:
+                for statement, parameters in captured:
+                    plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+                    scans = full_scans(plan, table_names) - allowed
+                    status = "NG" if scans else "ok"
+                    print(f"[{status}] {case}: {' / '.join(plan)}")
+                    if scans:
+                        failures.append((case, statement, scans))
+        engine.dispose()
+
+    for name in missing:
+        print(f"[NG] {name}: CASES に呼び出し方がありません")
+    for case, statement, scans in failures:
+        print(f"\n{case} が {', '.join(sorted(scans))} を全件走査しています:\n{statement}")
+
+    if failures or missing:
+        sys.exit(1)
+    print("\nすべてのクエリがインデックスを使っています")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+APIごとに1リクエストで実行するSQLの数を数え、上限 (BUDGETS) を超えたものがあれば失敗にする
+投稿・コメント・フォローを複数入れたDBで呼ぶので、件数に比例してSQLが増える処理 (N+1) は上限を超える
+
+python -m checks.statement_budget
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+# API ("メソッド パス") -> 1リクエストで実行してよいSQLの数
+# (書き込みは write_queue のセーブポイントも1つと数える)
+BUDGETS = {
+    "GET /songs": 2,
+    "POST /login": 4,
+    "POST /diagnosis": 3,
+    "GET /users/{user_id}": 1,
+    "GET /users/{user_id}/suggestions": 2,
+    "GET /users/{user_id}/similar": 1,
+    "POST /likes": 4,
+    # いいねバッファ (LIKE_BUFFER_MAX_LOSS_MS > 0) に残っている分を先に書き出すときは +4
+    "POST /likes/batch": 11,
+    "GET /favorites/{user_id}": 2,
+    "GET /recommendations/{user_id}": 3,
+    "GET /trending": 1,
+    "DELETE /likes": 7,
+    "POST /posts": 7,
+    "GET /posts": 3,
+    "GET /timeline/{user_id}": 4,
+    "GET /posts/{post_id}/comments": 2,
+    "POST /users/{target_id}/follow": 11,
+    "DELETE /users/{target_id}/follow": 8,
+    "POST /posts/{post_id}/comments": 5,
+    "GET /debug/sql-stats": 0,
+    "GET /metrics": 0,
+}
+
+USERS = 6
+POSTS_PER_USER = 3
+COMMENTS_PER_POST = 4
+
+
+def exercise(client, user_ids, song_ids):
+    """全APIを呼ぶ (一覧系は投稿・コメント・フォローが複数ある状態で呼ぶ)"""
+    me, *others = user_ids
+
+    def ok(response):
+        assert response.status_code < 400, f"{response.request.method} {response.request.url}: {response.text}"
+        return response.json()
+
+    ok(client.get("/songs"))
+    new_user = ok(client.post("/login", json={"name": "budget-new-user"}))["id"]
+    ok(client.post("/diagnosis", json={"user_id": me, "score_vc": 0.9, "score_ma": 0.2, "score_pr": 0.7, "score_hs": 0.4}))
+
+    for other in others:
+        ok(client.post(f"/users/{other}/follow", json={"user_id": me}))
+        ok(client.post(f"/users/{me}/follow", json={"user_id": other}))
+        # me がまだフォローしていないユーザー (おすすめのユーザーに出る)
+        ok(client.post(f"/users/{new_user}/follow", json={"user_id": other}))
+
+    post_ids = []
+    for user_id in user_ids:
+        for i in range(POSTS_PER_USER):
+            post = ok(client.post("/posts", json={"user_id": user_id, "song_id": song_ids[i % len(song_ids)], "comment": f"post {i}"}))
+            post_ids.append(post["id"])
+    for post_id in post_ids:
+        for i in range(COMMENTS_PER_POST):
+            ok(client.post(f"/posts/{post_id}/comments", json={"user_id": user_ids[i % len(user_ids)], "content": f"comment {i}"}))
+
+    for user_id in user_ids:
+        for song_id in song_ids[:4]:
+            ok(client.post("/likes", json={"song_id": song_id, "user_id": user_id}))
+    ok(client.post("/likes/batch", json={"user_id": me, "taps": [{"song_id": s, "count": 2} for s in song_ids[:5]]}))
+    ok(client.request("DELETE", "/likes", json={"song_id": song_ids[0], "user_id": me}))
+
+    ok(client.get(f"/users/{me}", params={"viewer_id": others[0]}))
+    ok(client.get(f"/users/{me}/suggestions"))
+    ok(client.get(f"/users/{me}/similar"))
+    ok(client.get(f"/favorites/{me}"))
+    ok(client.get(f"/recommendations/{me}"))
+    ok(client.get("/trending"))
+    ok(client.get("/trending", params={"window": "7d"}))
+    ok(client.get("/posts"))
+    ok(client.get(f"/timeline/{me}"))
+    ok(client.get(f"/posts/{post_ids[0]}/comments"))
+    ok(client.request("DELETE", f"/users/{others[0]}/follow", json={"user_id": me}))
+    ok(client.get("/debug/sql-stats"))
+    response = client.get("/metrics")
+    assert response.status_code == 200, (response.status_code, response.text)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.py がエンジンを作る前にDBの場所を差し替える
+        os.environ["TOMOTUNE_DB_PATH"] = os.path.join(tmp, "budget.db")
+        # GET /debug/sql-stats も数える
+        os.environ["DEBUG_ROUTES"] = "1"
+        from fastapi.routing import APIRoute
+        from fastapi.testclient import TestClient
+        import database
+        import init_db
+        import main as app_main
+        from models import Song, User
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_db.init_database()
+        db = database.SessionLocal()
+        try:
+            song_ids = [song.id for song in db.query(Song).order_by(Song.id)]
+            db.add_all(User(id=f"budget-user-{i}", name=f"budget-user-{i}") for i in range(USERS))
+            db.commit()
+        finally:
+            db.close()
+
+        with TestClient(app_main.app) as client:
+            database.reset_route_sql_stats()
+            exercise(client, [f"budget-user-{i}" for i in range(USERS)], song_ids)
+            stats = database.route_sql_stats()
+        database.engine.dispose()
+        database.read_engine.dispose()
+
+    routes = sorted(
+        f"{method} {route.path}"
+        for route in app_main.app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+    )
+    failures = []
+    for route in routes:
+        budget = BUDGETS.get(route)
+        measured = stats.get(route)
+        if budget is None:
+            failures.append(f"{route}: BUDGETS に上限がありません")
+        elif measured is None:
+            failures.append(f"{route}: 呼ばれていません (exercise に追加してください)")
+        else:
+            over = measured["max_statements"] > budget
+            repeated = measured["repeated_warnings"] > 0
+            status = "NG" if over or repeated else "ok"
+            print(f"[{status}] {route}: 最大 {measured['max_statements']} / 上限 {budget} "
+                  f"(平均 {measured['avg_statements']}, {measured['requests']} 回)")
+            if over:
+                failures.append(f"{route}: SQLが {measured['max_statements']} 回 (上限 {budget})")
+            if repeated:
+                failures.append(f"{route}: 同じSQLを何度も実行しています (N+1 の疑い)")
+
+    for failure in failures:
+        print(f"[NG] {failure}")
+    if failures:
+        sys.exit(1)
+    print("\nすべてのAPIがSQLの上限内です")
+
+
+if __name__ == "__main__":
+    main()
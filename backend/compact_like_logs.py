@@ -0,0 +1,33 @@
+from database import engine, SessionLocal
+from migrations import upgrade_schema
+from like_compaction import compact, LIKE_LOG_RETENTION_DAYS
+
+# 古いいいねログを日ごとの集計 (like_rollups) にまとめて削除するスクリプト
+# サーバーも定期的に実行しているが、すぐにDBを小さくしたいときに使う (何度実行してもよい)
+# python compact_like_logs.py [保存する日数]
+def run(fn, *args):
+    # チャンクごとに別のセッション・トランザクションで実行する
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def main():
+    import sys
+    retention_days = int(sys.argv[1]) if len(sys.argv) > 1 else LIKE_LOG_RETENTION_DAYS
+
+    # 集計テーブルが無ければ作る
+    upgrade_schema(engine)
+
+    try:
+        moved = compact(run, retention_days)
+        print(f"いいねログを日ごとの集計にまとめました ({moved}件)")
+    except Exception as e:
+        print(f"エラーが発生: {e}")
+
+if __name__ == "__main__":
+    main()
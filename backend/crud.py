@@ -1,8 +1,16 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func # 集計用(COUNTとか)
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, update, delete, select, case, tuple_, exists, false, literal, or_, union, union_all, cast, Integer, DateTime # 集計用(COUNTとか)・一括書き込み用
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import uuid
-from models import User, Song, LikeLog, Post, Comment, Follow
+from models import (
+    User, Song, LikeLog, LikeCount, LikeRollup, Post, Comment, Follow, TimelineEntry, TIMELINE_FANOUT_MAX_FOLLOWERS,
+)
+import typeCal
+
+# フォローしたときに、相手の最近の投稿をこの件数までタイムラインに入れる
+TIMELINE_BACKFILL_POSTS = 50
 
 # --- 曲の操作 ---
 
@@ -14,6 +22,12 @@ def get_song_by_id(db: Session, song_id: int):
     """IDで曲を探す"""
     return db.query(Song).filter(Song.id == song_id).first()
 
+def get_songs_by_ids(db: Session, song_ids: list[int]):
+    """IDの一覧で曲をまとめて取得する (順番は保証しない)"""
+    if not song_ids:
+        return []
+    return db.query(Song).filter(Song.id.in_(song_ids)).all()
+
 # --- ユーザーの操作 ---
 # 名前からユーザーを探す
 def get_user_by_name(db: Session, name: str):
@@ -34,10 +48,40 @@ def create_user(db: Session, name: str):
         music_type_code=None
     )
     db.add(new_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同じ名前で同時にログインされた場合は、先に作られた方を返す
+        db.rollback()
+        return get_user_by_name(db, name)
     db.refresh(new_user)
     return new_user
 
+def get_users_by_ids(db: Session, user_ids: list[str]):
+    """複数のユーザーをまとめて取得する (順番は保証しない)"""
+    if not user_ids:
+        return []
+    return db.execute(select(User).where(User.id.in_(user_ids))).scalars().all()
+
+def _user_profile_query(user_id: str, viewer_id: str | None):
+    """get_user_profile のクエリ (crud_async と共通)"""
+    if viewer_id:
+        viewer_is_following = exists().where(Follow.follower_id == viewer_id, Follow.followed_id == User.id)
+    else:
+        viewer_is_following = false()
+    return select(User, viewer_is_following.label("viewer_is_following")).where(User.id == user_id)
+
+def get_user_profile(db: Session, user_id: str, viewer_id: str | None = None):
+    """
+    プロフィール画面用に、ユーザー (フォロワー数・フォロー数を含む) と
+    viewer がそのユーザーをフォローしているかを1回のクエリで取得する
+    戻り値: (User, viewer_is_following)。ユーザーがいなければ None
+    """
+    row = db.execute(_user_profile_query(user_id, viewer_id)).first()
+    if row is None:
+        return None
+    return row[0], bool(row[1])
+
 def get_test_user(db: Session):
     """
     開発用のテストユーザーを取得する
@@ -48,104 +92,429 @@ def get_test_user(db: Session):
 
 # --- ❤️の操作 ---
 
+def _add_like_counts(db: Session, count_rows: list[dict]):
+    """
+    いいね数の集計テーブルに加算する (コミットは呼び出し側)
+    count_rows: {user_id, song_id, count, last_liked_at} の辞書リスト
+    """
+    stmt = sqlite_insert(LikeCount)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LikeCount.user_id, LikeCount.song_id],
+        set_={
+            "count": LikeCount.count + stmt.excluded.count,
+            "last_liked_at": stmt.excluded.last_liked_at,
+        },
+    )
+    db.execute(stmt, count_rows)
+
 def create_like(db: Session, user_id: str, song_id: int):
-    """ハートログをDBに保存する"""
+    """ハートログをDBに保存する (集計テーブルも同じトランザクションで更新)"""
+    now = datetime.now()
     new_like = LikeLog(
         user_id=user_id,
         song_id=song_id,
-        timestamp=datetime.now()
+        timestamp=now
     )
     db.add(new_like)
+    _add_like_counts(db, [{"user_id": user_id, "song_id": song_id, "count": 1, "last_liked_at": now}])
     db.commit()
     db.refresh(new_like) # 念のため最新情報を読み込む
     return new_like
 
+def _type_code_expr(vc, ma, pr, hs):
+    """typeCal.determine_music_type_code と同じ判定をSQLの式で組み立てる"""
+    t = typeCal.THRESHOLD
+    return (
+        case((vc >= t, "V"), else_="C")
+        + case((ma >= t, "A"), else_="M")
+        + case((pr >= t, "P"), else_="R")
+        + case((hs >= t, "H"), else_="S")
+    )
+
+def apply_like(db: Session, user_id: str, song_id: int, song_vector):
+    """
+    1回のいいねを1トランザクションで処理する (Pythonでの読み込み→書き戻しをしない)
+      1. UPDATE users ... RETURNING でスコアとタイプコードをDB上で更新
+      2. INSERT like_logs
+      3. like_counts に加算して RETURNING で累計を取得
+    同時に別の端末から押されても更新が失われない
+    song_vector: catalog.get_song_vector の4軸ベクトル
+    戻り値: (ユーザーの行, 累計いいね数)。ユーザーがいなければ None
+    """
+    a = typeCal.ALPHA
+    v_vc, v_ma, v_pr, v_hs = song_vector
+    new_vc = User.score_vc * (1 - a) + v_vc * a
+    new_ma = User.score_ma * (1 - a) + v_ma * a
+    new_pr = User.score_pr * (1 - a) + v_pr * a
+    new_hs = User.score_hs * (1 - a) + v_hs * a
+    # SETの右辺は更新前の値を参照するので、タイプコードも新しいスコアの式から求める
+    user_stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            score_vc=new_vc,
+            score_ma=new_ma,
+            score_pr=new_pr,
+            score_hs=new_hs,
+            music_type_code=_type_code_expr(new_vc, new_ma, new_pr, new_hs),
+        )
+    )
+
+    user_row = db.execute(
+        user_stmt.returning(
+            User.name, User.score_vc, User.score_ma, User.score_pr, User.score_hs, User.music_type_code
+        ),
+        execution_options={"synchronize_session": False},
+    ).first()
+    if user_row is None:
+        db.rollback()
+        return None
+
+    now = datetime.now()
+    db.execute(insert(LikeLog).values(user_id=user_id, song_id=song_id, timestamp=now))
+    count_stmt = sqlite_insert(LikeCount).values(user_id=user_id, song_id=song_id, count=1, last_liked_at=now)
+    total = db.execute(
+        count_stmt.on_conflict_do_update(
+            index_elements=[LikeCount.user_id, LikeCount.song_id],
+            set_={"count": LikeCount.count + 1, "last_liked_at": now},
+        ).returning(LikeCount.count)
+    ).scalar_one()
+    db.commit()
+    return user_row, total
+
+def save_like_batch(db: Session, like_rows: list[dict], score_rows: list[dict]):
+    """
+    まとめて受け付けたいいねを1トランザクションで保存する
+    like_rows: LikeLog の列 (user_id, song_id, timestamp) の辞書リスト
+    score_rows: User の主キー(id)と更新後スコア/タイプコードの辞書リスト
+    """
+    if like_rows:
+        db.execute(insert(LikeLog), like_rows)
+
+        # ユーザー×曲ごとにまとめて集計テーブルへ加算
+        counts = {}
+        for row in like_rows:
+            key = (row["user_id"], row["song_id"])
+            c, last = counts.get(key, (0, row["timestamp"]))
+            counts[key] = (c + 1, max(last, row["timestamp"]))
+        _add_like_counts(db, [
+            {"user_id": user_id, "song_id": song_id, "count": c, "last_liked_at": last}
+            for (user_id, song_id), (c, last) in counts.items()
+        ])
+    if score_rows:
+        db.execute(update(User), score_rows)
+    db.commit()
+
 def count_likes(db: Session, song_id: int, user_id: str) -> int:
     """
     特定のユーザーがその曲を何回ハートしたか数える
-    SQL: SELECT COUNT(*) FROM like_logs WHERE user_id=... AND song_id=...
+    SQL: SELECT count FROM like_counts WHERE user_id=... AND song_id=...
     """
-    return db.query(LikeLog).filter(
-        LikeLog.user_id == user_id,
-        LikeLog.song_id == song_id
-    ).count()
+    total = db.execute(
+        select(LikeCount.count).where(
+            LikeCount.user_id == user_id,
+            LikeCount.song_id == song_id
+        )
+    ).scalar()
+    return total or 0
+
+
+def get_like_counts(db: Session, user_id: str, song_ids: list[int]) -> dict:
+    """複数の曲について、ユーザーのいいね数をまとめて取得する (song_id -> 回数)"""
+    rows = db.execute(
+        select(LikeCount.song_id, LikeCount.count)
+        .where(LikeCount.user_id == user_id, LikeCount.song_id.in_(song_ids))
+    ).all()
+    return {song_id: count for song_id, count in rows}
 
 
 def get_favorite_song_ids(db: Session, user_id: str, threshold: int = 5):
     """
     特定ユーザーが、threshold回以上いいねした曲ID一覧を返す
     """
-    rows = (
-        db.query(LikeLog.song_id, func.count(LikeLog.id).label("c"))
-        .filter(LikeLog.user_id == user_id)
-        .group_by(LikeLog.song_id)
-        .having(func.count(LikeLog.id) >= threshold)
-        .all()
-    )
+    rows = db.execute(
+        select(LikeCount.song_id)
+        .where(LikeCount.user_id == user_id, LikeCount.count >= threshold)
+        .order_by(LikeCount.song_id)
+    ).all()
     return [row[0] for row in rows]
 
+def delete_latest_likes(db: Session, user_id: str, song_id: int, n: int) -> int:
+    """
+    特定の曲に対するユーザーの最新のいいねをn件削除し、集計テーブルも減らす
+    いいねログで足りない分は、日ごとの集計 (like_rollups) の新しい日から減らす
+    削除した件数を返す
+    """
+    latest_ids = (
+        select(LikeLog.id)
+        .where(LikeLog.user_id == user_id, LikeLog.song_id == song_id)
+        .order_by(LikeLog.timestamp.desc())
+        .limit(n)
+    )
+    deleted = db.execute(delete(LikeLog).where(LikeLog.id.in_(latest_ids))).rowcount
+    if deleted < n:
+        deleted += _delete_latest_rollups(db, user_id, song_id, n - deleted)
+    if deleted:
+        pair = (LikeCount.user_id == user_id, LikeCount.song_id == song_id)
+        db.execute(
+            update(LikeCount)
+            .where(*pair)
+            .values(
+                count=LikeCount.count - deleted,
+                # 残っているいいねの中で最新の時刻に戻す (集計だけなら、その日の0時)
+                last_liked_at=func.coalesce(
+                    select(func.max(LikeLog.timestamp))
+                    .where(LikeLog.user_id == user_id, LikeLog.song_id == song_id)
+                    .scalar_subquery(),
+                    select(func.datetime(func.max(LikeRollup.day)))
+                    .where(LikeRollup.user_id == user_id, LikeRollup.song_id == song_id)
+                    .scalar_subquery(),
+                ),
+            )
+        )
+        db.execute(delete(LikeCount).where(*pair, LikeCount.count <= 0))
+    db.commit()
+    return deleted
+
+def _delete_latest_rollups(db: Session, user_id: str, song_id: int, n: int) -> int:
+    """日ごとの集計から、新しい日の分を合計n件まで減らす (減らした件数を返す)"""
+    rollups = db.execute(
+        select(LikeRollup.day, LikeRollup.count)
+        .where(LikeRollup.user_id == user_id, LikeRollup.song_id == song_id)
+        .order_by(LikeRollup.day.desc())
+    ).all()
+    removed = 0
+    for day, count in rollups:
+        if removed >= n:
+            break
+        take = min(count, n - removed)
+        key = (LikeRollup.user_id == user_id, LikeRollup.song_id == song_id, LikeRollup.day == day)
+        if take == count:
+            db.execute(delete(LikeRollup).where(*key))
+        else:
+            db.execute(update(LikeRollup).where(*key).values(count=LikeRollup.count - take))
+        removed += take
+    return removed
+
 def delete_like_log(db: Session, user_id: str, song_id: int):
     """
     特定の曲に対するユーザーの最新のいいねログを1件削除する
     """
-    like_log = (
-        db.query(LikeLog)
-        .filter(LikeLog.user_id == user_id, LikeLog.song_id == song_id)
-        .order_by(LikeLog.timestamp.desc())
-        .first()
+    return delete_latest_likes(db, user_id, song_id, 1) > 0
+
+def count_likes_by_hour(db: Session, since: datetime, shift_seconds: int = 0):
+    """
+    since 以降のいいねを (song_id, 押した人の今のタイプコード, 時刻の1時間ごとの枠) でまとめ、
+    (song_id, タイプコード, 枠, 件数) で返す
+    枠は保存された時刻を UTC とみなし、shift_seconds 秒戻した時刻の 1970年からの時間数
+    急上昇の集計を起動時に作り直すときに使う (いいねの件数ではなく 曲 x タイプ x 時間 の数だけ返る)
+    """
+    hour = ((cast(func.strftime("%s", LikeLog.timestamp), Integer) - shift_seconds) // 3600).label("hour")
+    return db.execute(
+        select(LikeLog.song_id, User.music_type_code, hour, func.count())
+        .join(User, User.id == LikeLog.user_id)
+        .where(LikeLog.timestamp >= since)
+        .group_by(LikeLog.song_id, User.music_type_code, hour)
+    ).all()
+
+def compact_like_logs(db: Session, before: datetime, limit: int) -> int:
+    """
+    before より前のいいねログを古い順に最大 limit 件、日ごとの集計 (like_rollups) に足してから削除する
+    1回で扱う件数を limit に抑え、書き込みのロックを長く持たないようにする
+    移した件数を返す (limit より少なければ残りは無い)
+    """
+    ids = db.execute(
+        select(LikeLog.id)
+        .where(LikeLog.timestamp < before)
+        .order_by(LikeLog.timestamp)
+        .limit(limit)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    day = func.date(LikeLog.timestamp)
+    stmt = sqlite_insert(LikeRollup).from_select(
+        ["user_id", "song_id", "day", "count"],
+        select(LikeLog.user_id, LikeLog.song_id, day, func.count(LikeLog.id))
+        .where(LikeLog.id.in_(ids))
+        .group_by(LikeLog.user_id, LikeLog.song_id, day),
     )
-    if like_log:
-        db.delete(like_log)
-        db.commit()
-        return True
-    return False
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[LikeRollup.user_id, LikeRollup.song_id, LikeRollup.day],
+        set_={"count": LikeRollup.count + stmt.excluded.count},
+    ))
+    db.execute(delete(LikeLog).where(LikeLog.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
+def rebuild_like_counts(db: Session) -> int:
+    """
+    like_logs と like_rollups から集計テーブルを作り直す (ズレの修復用)
+    作成した行数を返す
+    """
+    per_source = union_all(
+        select(
+            LikeLog.user_id.label("user_id"),
+            LikeLog.song_id.label("song_id"),
+            func.count(LikeLog.id).label("count"),
+            func.max(LikeLog.timestamp).label("last_liked_at"),
+        ).group_by(LikeLog.user_id, LikeLog.song_id),
+        select(
+            LikeRollup.user_id,
+            LikeRollup.song_id,
+            func.sum(LikeRollup.count),
+            func.datetime(func.max(LikeRollup.day)),
+        ).group_by(LikeRollup.user_id, LikeRollup.song_id),
+    ).subquery()
+    db.execute(delete(LikeCount))
+    db.execute(
+        insert(LikeCount).from_select(
+            ["user_id", "song_id", "count", "last_liked_at"],
+            select(
+                per_source.c.user_id,
+                per_source.c.song_id,
+                func.sum(per_source.c.count),
+                func.max(per_source.c.last_liked_at),
+            ).group_by(per_source.c.user_id, per_source.c.song_id),
+        )
+    )
+    db.commit()
+    return db.query(LikeCount).count()
 
 
 # --- 投稿の操作 ---
 
 def create_post(db: Session, user_id: str, song_id: int, comment: str) -> Post:
-    """投稿を1件作成して保存する"""
+    """投稿を1件作成して保存する (フォロワーのタイムラインにも同じトランザクションで書き込む)"""
     new_post = Post(
         user_id=user_id,
         song_id=song_id,
         comment=comment,
     )
     db.add(new_post)
+    db.flush()
+    _fan_out_post(db, new_post)
     db.commit()
     db.refresh(new_post)
     return new_post
 
 
-def get_post_by_id(db: Session, post_id: int) -> Post:
-    """投稿をIDで取得する"""
-    return (
-        db.query(Post)
-        .options(
-            joinedload(Post.user).joinedload(User.music_type),
-            joinedload(Post.song),
-            joinedload(Post.comments).joinedload(Comment.user).joinedload(User.music_type),
+def _fans_out(db: Session, user_id: str) -> bool:
+    """このユーザーの投稿をフォロワーのタイムラインに書き込むか (フォロワーが多ければ読むときに集める)"""
+    followers = db.execute(select(User.follower_count).where(User.id == user_id)).scalar() or 0
+    return followers <= TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def _fan_out_post(db: Session, post: Post):
+    """投稿をフォロワー全員のタイムラインに追加する (fan-out-on-write)"""
+    if not _fans_out(db, post.user_id):
+        return
+    db.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "created_at"],
+            select(
+                Follow.follower_id,
+                literal(post.id),
+                literal(post.created_at, DateTime),
+            ).where(Follow.followed_id == post.user_id),
         )
-        .filter(Post.id == post_id)
-        .first()
     )
 
 
-def get_recent_posts(db: Session, limit: int = 50):
-    """最新の投稿を新しい順に取得する（ユーザー/曲/コメントも取得）"""
+def _timeline_query(user_id: str, limit: int, before: tuple | None):
+    """
+    get_timeline_post_rows のクエリ (crud_async と共通)
+    書き込み済みのタイムラインと、読むときに集める投稿 (自分・フォロワーが多いユーザー) を
+    それぞれ新しい順に limit 件取り、合わせて (post_id, created_at) を新しい順に limit 件返す
+    """
+    written = select(
+        TimelineEntry.post_id.label("post_id"), TimelineEntry.created_at.label("created_at")
+    ).where(TimelineEntry.user_id == user_id)
+
+    popular_followings = (
+        select(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .where(Follow.follower_id == user_id, User.follower_count > TIMELINE_FANOUT_MAX_FOLLOWERS)
+    )
+    pulled = select(
+        Post.id.label("post_id"), Post.created_at.label("created_at")
+    ).where(or_(Post.user_id == user_id, Post.user_id.in_(popular_followings)))
+
+    if before is not None:
+        written = written.where(tuple_(TimelineEntry.created_at, TimelineEntry.post_id) < tuple_(*before))
+        pulled = pulled.where(tuple_(Post.created_at, Post.id) < tuple_(*before))
+
+    written = written.order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()).limit(limit).subquery()
+    pulled = pulled.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit).subquery()
+    # フォロワー数が閾値をまたいだユーザーの投稿は両方に出てくるので UNION で重複を消す
+    merged = union(select(written.c.post_id, written.c.created_at), select(pulled.c.post_id, pulled.c.created_at)).subquery()
     return (
-        db.query(Post)
-        .options(
-            # 関連オブジェクトを一度に取得してN+1を避ける
-            joinedload(Post.user).joinedload(User.music_type),
-            joinedload(Post.song),
-            joinedload(Post.comments).joinedload(Comment.user).joinedload(User.music_type),
-        )
-        .order_by(Post.created_at.desc())
+        select(merged.c.post_id, merged.c.created_at)
+        .order_by(merged.c.created_at.desc(), merged.c.post_id.desc())
         .limit(limit)
-        .all()
     )
 
 
+def _in_order(posts, post_ids: list[int]):
+    """post_ids の順に並べ直す (IN で読んだ行は順番が決まらないので)"""
+    by_id = {p.id: p for p in posts}
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+
+def post_exists(db: Session, post_id: int) -> bool:
+    """投稿があるか (コメントなどは読み込まない)"""
+    return db.query(Post.id).filter(Post.id == post_id).first() is not None
+
+
+# 一覧のAPI用: レスポンスに使う列だけを選び、ORMオブジェクトを作らずに行 (Row) のまま返す
+# (Post / User / Song を組み立てて identity map に入れる手間がかからない)
+
+def _post_rows_select():
+    """投稿・投稿者・曲の列 (投稿者・曲が無ければ user_id / song_id が None)"""
+    return (
+        select(
+            Post.id, Post.comment, Post.created_at,
+            User.id.label("user_id"), User.name.label("user_name"), User.music_type_code,
+            Song.id.label("song_id"), Song.title, Song.artist, Song.url,
+        )
+        .select_from(Post)
+        .outerjoin(User, User.id == Post.user_id)
+        .outerjoin(Song, Song.id == Post.song_id)
+    )
+
+
+def _recent_post_rows_query(limit: int, before: tuple | None):
+    """get_recent_post_rows のクエリ (crud_async と共通)"""
+    query = _post_rows_select()
+    if before is not None:
+        query = query.where(tuple_(Post.created_at, Post.id) < tuple_(*before))
+    return query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+
+
+def get_recent_post_rows(db: Session, limit: int = 50, before: tuple | None = None):
+    """
+    最新の投稿を新しい順に、_post_rows_select の列の行で返す
+    before: 前のページの最後の投稿の (created_at, id)。これより古い投稿を返す (キーセット方式)
+    コメントは件数が多くなりうるので、get_comment_preview_rows で別に取得する
+    """
+    return db.execute(_recent_post_rows_query(limit, before)).all()
+
+
+def _post_rows_by_ids_query(post_ids: list[int]):
+    return _post_rows_select().where(Post.id.in_(post_ids))
+
+
+def get_timeline_post_rows(db: Session, user_id: str, limit: int = 50, before: tuple | None = None):
+    """
+    フォロー中のユーザー (と自分) の投稿を新しい順に、_post_rows_select の列の行で返す
+    before: get_recent_post_rows と同じ (created_at, id) のカーソル
+    """
+    post_ids = [row.post_id for row in db.execute(_timeline_query(user_id, limit, before))]
+    if not post_ids:
+        return []
+    return _in_order(db.execute(_post_rows_by_ids_query(post_ids)).all(), post_ids)
+
+
 # --- コメントの操作 ---
 
 def create_comment(db: Session, post_id: int, user_id: str, content: str) -> Comment:
@@ -161,16 +530,80 @@ def create_comment(db: Session, post_id: int, user_id: str, content: str) -> Com
     return new_comment
 
 
-def get_comments_by_post(db: Session, post_id: int):
-    """特定の投稿に紐づくコメント一覧を取得（新しい順）"""
+def _latest_comments(stmt, post_ids: list[int], k: int):
+    """stmt (Comment を読む select) を、投稿ごとに最新k件のコメントだけに絞る (古い順に並べる)"""
+    ranked = (
+        select(
+            Comment.id,
+            func.row_number().over(
+                partition_by=Comment.post_id,
+                order_by=(Comment.created_at.desc(), Comment.id.desc()),
+            ).label("rn"),
+        )
+        .where(Comment.post_id.in_(post_ids))
+        .subquery()
+    )
+    return (
+        stmt
+        .join(ranked, Comment.id == ranked.c.id)
+        .where(ranked.c.rn <= k)
+        .order_by(Comment.post_id, Comment.created_at.asc(), Comment.id.asc())
+    )
+
+
+def _group_by_post(comments) -> dict:
+    previews = {}
+    for c in comments:
+        previews.setdefault(c.post_id, []).append(c)
+    return previews
+
+
+def count_comments(db: Session, post_ids: list[int]) -> dict:
+    """投稿ごとのコメント数 (post_id -> 件数)"""
+    if not post_ids:
+        return {}
+    rows = db.execute(
+        select(Comment.post_id, func.count(Comment.id))
+        .where(Comment.post_id.in_(post_ids))
+        .group_by(Comment.post_id)
+    ).all()
+    return {post_id: count for post_id, count in rows}
+
+
+def _comment_rows_select():
+    """コメント・書いた人の列 (ORMオブジェクトを作らない。書いた人が無ければ user_id が None)"""
     return (
-        db.query(Comment)
-        .filter(Comment.post_id == post_id)
-        .order_by(Comment.created_at.asc())
-        .all()
+        select(
+            Comment.id, Comment.post_id, Comment.content, Comment.created_at,
+            User.id.label("user_id"), User.name.label("user_name"), User.music_type_code,
+        )
+        .select_from(Comment)
+        .outerjoin(User, User.id == Comment.user_id)
     )
 
 
+def _comment_preview_rows_query(post_ids: list[int], k: int):
+    """get_comment_preview_rows のクエリ (crud_async と共通)"""
+    return _latest_comments(_comment_rows_select(), post_ids, k)
+
+
+def get_comment_preview_rows(db: Session, post_ids: list[int], k: int) -> dict:
+    """投稿ごとに最新k件のコメントを、_comment_rows_select の列の行で返す (post_id -> 古い順のリスト)"""
+    if not post_ids or k <= 0:
+        return {}
+    return _group_by_post(db.execute(_comment_preview_rows_query(post_ids, k)).all())
+
+
+def _comment_rows_by_post_query(post_id: int):
+    """get_comment_rows_by_post のクエリ (crud_async と共通)"""
+    return _comment_rows_select().where(Comment.post_id == post_id).order_by(Comment.created_at.asc())
+
+
+def get_comment_rows_by_post(db: Session, post_id: int):
+    """特定の投稿に紐づくコメント一覧を、_comment_rows_select の列の行で返す (古い順)"""
+    return db.execute(_comment_rows_by_post_query(post_id)).all()
+
+
 # --- フォローの操作 ---
 
 def create_follow(db: Session, follower_id: str, followed_id: str):
@@ -186,6 +619,19 @@ def create_follow(db: Session, follower_id: str, followed_id: str):
         return existing
     follow = Follow(follower_id=follower_id, followed_id=followed_id)
     db.add(follow)
+    # ユーザーのフォロワー数・フォロー数も同じトランザクションで更新する
+    _add_follow_counts(db, follower_id, followed_id, 1)
+    # 相手の最近の投稿をタイムラインに入れる
+    if _fans_out(db, followed_id):
+        db.execute(
+            insert(TimelineEntry).prefix_with("OR IGNORE").from_select(
+                ["user_id", "post_id", "created_at"],
+                select(literal(follower_id), Post.id, Post.created_at)
+                .where(Post.user_id == followed_id)
+                .order_by(Post.created_at.desc())
+                .limit(TIMELINE_BACKFILL_POSTS),
+            )
+        )
     db.commit()
     db.refresh(follow)
     return follow
@@ -193,12 +639,31 @@ def create_follow(db: Session, follower_id: str, followed_id: str):
 
 def delete_follow(db: Session, follower_id: str, followed_id: str):
     """フォロー解除"""
-    db.query(Follow).filter(
+    deleted = db.query(Follow).filter(
         Follow.follower_id == follower_id, Follow.followed_id == followed_id
     ).delete()
+    if deleted:
+        _add_follow_counts(db, follower_id, followed_id, -deleted)
+        # タイムラインから相手の投稿を外す
+        db.execute(
+            delete(TimelineEntry).where(
+                TimelineEntry.user_id == follower_id,
+                TimelineEntry.post_id.in_(select(Post.id).where(Post.user_id == followed_id)),
+            )
+        )
     db.commit()
 
 
+def _add_follow_counts(db: Session, follower_id: str, followed_id: str, n: int):
+    """users のフォロワー数・フォロー数に n を足す (DB上で加算するので同時に更新されても失われない)"""
+    db.execute(
+        update(User).where(User.id == followed_id).values(follower_count=User.follower_count + n)
+    )
+    db.execute(
+        update(User).where(User.id == follower_id).values(following_count=User.following_count + n)
+    )
+
+
 def is_following(db: Session, follower_id: str, followed_id: str) -> bool:
     return (
         db.query(Follow)
@@ -209,9 +674,26 @@ def is_following(db: Session, follower_id: str, followed_id: str) -> bool:
 
 
 def count_followers(db: Session, user_id: str) -> int:
-    return db.query(Follow).filter(Follow.followed_id == user_id).count()
+    return db.execute(select(User.follower_count).where(User.id == user_id)).scalar() or 0
 
 
 def count_followings(db: Session, user_id: str) -> int:
-    return db.query(Follow).filter(Follow.follower_id == user_id).count()
+    return db.execute(select(User.following_count).where(User.id == user_id)).scalar() or 0
+
+
+def reconcile_follow_counts(db: Session) -> int:
+    """
+    users のフォロワー数・フォロー数を follows から数え直す (ズレの修復用)
+    直したユーザーの数を返す
+    """
+    followers = select(func.count(Follow.id)).where(Follow.followed_id == User.id).scalar_subquery()
+    followings = select(func.count(Follow.id)).where(Follow.follower_id == User.id).scalar_subquery()
+    fixed = db.execute(
+        update(User)
+        .where((User.follower_count != followers) | (User.following_count != followings))
+        .values(follower_count=followers, following_count=followings),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.commit()
+    return fixed
 
@@ -0,0 +1,85 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Song, User, LikeCount, Post, Comment
+import crud
+
+# --- crud.py の読み込み関数の非同期版 (async def のAPI用) ---
+# 関数名・引数・戻り値は crud.py と同じ。書き込みは write_queue で crud.py の関数を使う
+# AsyncSession では遅延読み込みができないので、使う関連オブジェクトは必ず一緒に読み込む
+
+
+# --- 曲 ---
+
+async def get_songs_by_ids(db: AsyncSession, song_ids: list[int]):
+    if not song_ids:
+        return []
+    return (await db.execute(select(Song).where(Song.id.in_(song_ids)))).scalars().all()
+
+
+# --- ユーザー ---
+
+async def get_user_by_id(db: AsyncSession, user_id: str):
+    return (await db.execute(select(User).where(User.id == user_id))).scalars().first()
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids: list[str]):
+    if not user_ids:
+        return []
+    return (await db.execute(select(User).where(User.id.in_(user_ids)))).scalars().all()
+
+
+async def get_user_profile(db: AsyncSession, user_id: str, viewer_id: str | None = None):
+    row = (await db.execute(crud._user_profile_query(user_id, viewer_id))).first()
+    if row is None:
+        return None
+    return row[0], bool(row[1])
+
+
+# --- ❤️ ---
+
+async def get_favorite_song_ids(db: AsyncSession, user_id: str, threshold: int = 5):
+    rows = (await db.execute(
+        select(LikeCount.song_id)
+        .where(LikeCount.user_id == user_id, LikeCount.count >= threshold)
+        .order_by(LikeCount.song_id)
+    )).all()
+    return [row[0] for row in rows]
+
+
+# --- 投稿・コメント ---
+
+async def post_exists(db: AsyncSession, post_id: int) -> bool:
+    return (await db.execute(select(Post.id).where(Post.id == post_id))).first() is not None
+
+
+async def get_recent_post_rows(db: AsyncSession, limit: int = 50, before: tuple | None = None):
+    return (await db.execute(crud._recent_post_rows_query(limit, before))).all()
+
+
+async def get_timeline_post_rows(db: AsyncSession, user_id: str, limit: int = 50, before: tuple | None = None):
+    post_ids = [row.post_id for row in await db.execute(crud._timeline_query(user_id, limit, before))]
+    if not post_ids:
+        return []
+    return crud._in_order((await db.execute(crud._post_rows_by_ids_query(post_ids))).all(), post_ids)
+
+
+async def get_comment_preview_rows(db: AsyncSession, post_ids: list[int], k: int) -> dict:
+    if not post_ids or k <= 0:
+        return {}
+    return crud._group_by_post((await db.execute(crud._comment_preview_rows_query(post_ids, k))).all())
+
+
+async def count_comments(db: AsyncSession, post_ids: list[int]) -> dict:
+    if not post_ids:
+        return {}
+    rows = (await db.execute(
+        select(Comment.post_id, func.count(Comment.id))
+        .where(Comment.post_id.in_(post_ids))
+        .group_by(Comment.post_id)
+    )).all()
+    return {post_id: count for post_id, count in rows}
+
+
+async def get_comment_rows_by_post(db: AsyncSession, post_id: int):
+    return (await db.execute(crud._comment_rows_by_post_query(post_id))).all()
@@ -1,7 +1,6 @@
 from datetime import datetime
 import csv
 import uuid
-import json
 import os
 import unicodedata
 
@@ -89,8 +88,8 @@ def scan_static_files():
                 "title": title,
                 "artist": artist,
                 "url": f"/static/{filename_clean}",
-                # 辞書をJSON文字列に変換して保存
-                "parameters": json.dumps(params)
+                # 特徴量 (Songの各列にそのまま入れる)
+                "features": params
             }
             songs.append(song)
     
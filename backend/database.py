@@ -1,20 +1,300 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from contextvars import ContextVar
+from collections import Counter
+import logging
 import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger("uvicorn")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# SQLiteのファイル名
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'tomoTune.db')}"
+# SQLiteのファイル名 (環境変数 TOMOTUNE_DB_PATH で差し替え可能)
+DB_PATH = os.environ.get("TOMOTUNE_DB_PATH", os.path.join(BASE_DIR, "tomoTune.db"))
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+
+# --- エンジンの設定 (プロファイル) ---
+# production: WAL + 各種PRAGMA。読み込み専用の接続プールを別に持つ
+# compat:     以前と同じ既定の設定 (rollback journal、読み書き同じ接続)
+DB_PROFILE = os.environ.get("DB_PROFILE", "production")
+
+# production プロファイルで接続ごとに設定するPRAGMA (環境変数で上書き可能)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    # WALなら NORMAL でもDBは壊れない (電源断時に直近のコミットが失われうるだけ)
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # ロック中なら最大この時間(ms)待つ
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # 負の値はKB単位 (-20000 = 約20MB)
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-20000")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+# 読み込み専用の接続プールの大きさ
+READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", "10"))
+
+# 読み込み専用の接続では変更できない (DBファイル側の設定) PRAGMA
+_WRITE_ONLY_PRAGMAS = {"journal_mode", "synchronous"}
+
+
+def _pragma_listener(pragmas: dict):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_pragmas
+
+
+# --- リクエストごとのSQLの計測 ---
+# エンジンのイベントで、実行したSQLの数・DBの時間を今のリクエストの SqlStats に足す
+# リクエストの範囲は main.py のミドルウェアが sql_stats_scope() で決める
+# (write_queue のジョブは、登録したリクエストのものとして数える)
+
+# 同じSQLが1リクエストでこの回数以上実行されたら警告する (N+1 の疑い)
+SQL_REPEAT_WARNING = int(os.environ.get("SQL_REPEAT_WARNING", "5"))
+
+
+class SqlStats:
+    """1リクエスト分のSQLの計測結果"""
+
+    __slots__ = ("statements", "seconds", "shapes")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes = Counter()  # SQL文 (パラメータは ? のまま) -> 実行回数
+
+    def repeated(self, threshold: int = SQL_REPEAT_WARNING):
+        """threshold 回以上実行された SQL文と回数"""
+        return [(statement, n) for statement, n in self.shapes.items() if n >= threshold]
+
+
+_current_sql_stats: ContextVar[SqlStats | None] = ContextVar("current_sql_stats", default=None)
+
+
+class sql_stats_scope:
+    """with の中で実行されたSQLを数える (with sql_stats_scope() as stats: ...)"""
+
+    def __enter__(self) -> SqlStats:
+        self.stats = SqlStats()
+        self._token = _current_sql_stats.set(self.stats)
+        return self.stats
+
+    def __exit__(self, *exc):
+        _current_sql_stats.reset(self._token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", {})[id(cursor)] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop(id(cursor))
+    stats = _current_sql_stats.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.seconds += elapsed
+    stats.shapes[statement] += 1
+
+
+def _handle_error(exception_context):
+    # 失敗したSQLは after_cursor_execute が呼ばれないので、ここで開始時刻を捨てる
+    conn, context = exception_context.connection, exception_context.execution_context
+    if conn is not None and context is not None:
+        conn.info.get("query_started", {}).pop(id(context.cursor), None)
+
+
+def instrument_engine(engine):
+    """エンジンにSQLの計測用のイベントを付ける (非同期エンジンは sync_engine を渡す)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ルートごとの集計 ("GET /posts" -> RouteSqlStats)
+class RouteSqlStats:
+    __slots__ = ("requests", "statements", "max_statements", "seconds", "repeated_warnings")
+
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.seconds = 0.0
+        self.repeated_warnings = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "statements": self.statements,
+            "max_statements": self.max_statements,
+            "avg_statements": round(self.statements / self.requests, 2) if self.requests else 0,
+            "db_ms": round(self.seconds * 1000, 3),
+            "avg_db_ms": round(self.seconds * 1000 / self.requests, 3) if self.requests else 0,
+            "repeated_warnings": self.repeated_warnings,
+        }
+
+
+_route_stats_lock = threading.Lock()
+_route_stats = {}
+
+
+def record_request_sql(route: str, stats: SqlStats):
+    """1リクエスト分の計測結果をルートごとの集計に足し、同じSQLの繰り返しを警告する"""
+    repeated = stats.repeated()
+    for statement, n in repeated:
+        logger.warning(f"N+1 の疑い: {route} で同じSQLを{n}回実行しました: {' '.join(statement.split())[:300]}")
+    with _route_stats_lock:
+        total = _route_stats.get(route)
+        if total is None:
+            total = _route_stats[route] = RouteSqlStats()
+        total.requests += 1
+        total.statements += stats.statements
+        total.max_statements = max(total.max_statements, stats.statements)
+        total.seconds += stats.seconds
+        total.repeated_warnings += len(repeated)
+
+
+def route_sql_stats() -> dict:
+    """ルートごとの集計 ({"GET /posts": {...}})"""
+    with _route_stats_lock:
+        return {route: total.as_dict() for route, total in sorted(_route_stats.items())}
+
+
+def reset_route_sql_stats():
+    with _route_stats_lock:
+        _route_stats.clear()
+
+
+# --- 接続プールのメトリクス ---
+# プール名 (pool_logging_name) ごとに、接続を借りるまでの時間とロックのエラーを数える
+
+class _TimedQueuePool(QueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - started, self._orig_logging_name)
+
+
+class _TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - started, self._orig_logging_name)
+
+
+def _count_lock_errors(context):
+    # busy_timeout を過ぎても書き込みロックが取れなかった ("database is locked")
+    if isinstance(context.original_exception, sqlite3.OperationalError) and "locked" in str(context.original_exception):
+        metrics.db_lock_errors.inc(context.engine.pool._orig_logging_name)
+
+
+def instrument_pool(engine):
+    event.listen(engine, "handle_error", _count_lock_errors)
+
+
+def create_engines(db_path: str = DB_PATH, profile: str = DB_PROFILE):
+    """
+    (書き込み用エンジン, 読み込み用エンジン) を作る
+    check_same_thread: False はSQLiteの設定
+    """
+    write_engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False},
+        poolclass=_TimedQueuePool,
+        pool_logging_name="write",
+    )
+    instrument_engine(write_engine)
+    instrument_pool(write_engine)
+    if profile == "compat":
+        return write_engine, write_engine
+
+    event.listen(write_engine, "connect", _pragma_listener(SQLITE_PRAGMAS))
+
+    # 読み込み専用で開く (WALなので書き込み中でも待たされない)
+    read_engine = create_engine(
+        f"sqlite:///file:{db_path}?mode=ro&uri=true",
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE,
+        poolclass=_TimedQueuePool,
+        pool_logging_name="read",
+    )
+    instrument_engine(read_engine)
+    instrument_pool(read_engine)
+    read_pragmas = {k: v for k, v in SQLITE_PRAGMAS.items() if k not in _WRITE_ONLY_PRAGMAS}
+    event.listen(read_engine, "connect", _pragma_listener(read_pragmas))
+    return write_engine, read_engine
+
+
+def create_async_read_engine(db_path: str = DB_PATH, profile: str = DB_PROFILE):
+    """
+    async def のAPI用の読み込みエンジン (aiosqlite)
+    書き込みは write_queue のスレッドで行うので、非同期版は読み込みだけ
+    """
+    if profile == "compat":
+        async_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}", poolclass=_TimedAsyncQueuePool, pool_logging_name="async_read",
+        )
+        instrument_engine(async_engine.sync_engine)
+        instrument_pool(async_engine.sync_engine)
+        return async_engine
+
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///file:{db_path}?mode=ro&uri=true",
+        pool_size=READ_POOL_SIZE,
+        poolclass=_TimedAsyncQueuePool,
+        pool_logging_name="async_read",
+    )
+    instrument_engine(async_engine.sync_engine)
+    instrument_pool(async_engine.sync_engine)
+    read_pragmas = {k: v for k, v in SQLITE_PRAGMAS.items() if k not in _WRITE_ONLY_PRAGMAS}
+    event.listen(async_engine.sync_engine, "connect", _pragma_listener(read_pragmas))
+    return async_engine
+
 
 # エンジン
-# check_same_thread: False はSQLiteの設定
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine, read_engine = create_engines()
+async_read_engine = create_async_read_engine()
+
+
+def _pools_checked_out():
+    pools = [("write", engine), ("async_read", async_read_engine.sync_engine)]
+    # compat では読み込みも書き込みと同じエンジン
+    if read_engine is not engine:
+        pools.insert(1, ("read", read_engine))
+    return [((name,), e.pool.checkedout()) for name, e in pools]
+
+
+def _route_sql_samples(field: str, scale: float = 1):
+    return lambda: [((route,), stats[field] * scale) for route, stats in route_sql_stats().items()]
+
+
+metrics.registry.callback_gauge(
+    "tomotune_db_pool_checked_out", "貸し出し中の接続の数", ("pool",), _pools_checked_out)
+metrics.registry.callback_counter(
+    "tomotune_sql_statements_total", "APIごとに実行したSQLの数 (GET /debug/sql-stats と同じ集計)",
+    ("route",), _route_sql_samples("statements"))
+metrics.registry.callback_counter(
+    "tomotune_sql_seconds_total", "APIごとにSQLにかかった時間 (秒)", ("route",), _route_sql_samples("db_ms", 0.001))
 
 # セッションメーカー
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # autocommit=False: 明示的にコミットしないと変更が保存されない(安全なトランザクション処理のため)
+# 読み込み専用 (GETのAPI用)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# 非同期の読み込み専用 (async def のGETのAPI用)
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_read_engine)
 
 # テーブルの親クラス
 Base = declarative_base()
@@ -26,4 +306,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# async def のAPI用 (待っている間スレッドプールを占有しない)
+async def get_async_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
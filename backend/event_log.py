@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import queue
+import random
+import time
+from datetime import datetime
+from logging.handlers import QueueListener
+
+import metrics
+
+# --- イベントログ (いいね・ログインなどの記録) ---
+# リクエストを処理するスレッドでは文字列を作らず、イベント名と値をキューに入れるだけにする
+# 整形 (1行のJSON) と書き出しはバックグラウンドのスレッドで行う
+# キューがいっぱいのときは待たずに捨て、捨てた数を数える (GET /metrics の tomotune_log_events_dropped_total)
+
+# イベントごとの記録する割合 ("like=0.01,login=1" の形。書かれていないイベントは全て記録する)
+EVENT_LOG_SAMPLE_RATES = os.environ.get("EVENT_LOG_SAMPLE_RATES", "like=0.01,like_batch=0.01")
+# 書き出し待ちのイベントの最大数
+EVENT_LOG_QUEUE_SIZE = int(os.environ.get("EVENT_LOG_QUEUE_SIZE", "10000"))
+
+
+def parse_sample_rates(text: str) -> dict[str, float]:
+    rates = {}
+    for item in text.split(","):
+        if item.strip():
+            event, rate = item.split("=")
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class _JsonFormatter(logging.Formatter):
+    """1イベント1行のJSON (間引いたイベントには sample_rate を付ける)"""
+
+    def format(self, record):
+        event = {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                 "event": record.msg, **record.fields}
+        if record.sample_rate < 1:
+            event["sample_rate"] = record.sample_rate
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _make_record(item) -> logging.LogRecord:
+    created, event, fields, rate = item
+    record = logging.makeLogRecord({
+        "name": "tomotune.events", "levelno": logging.INFO, "levelname": "INFO",
+        "msg": event, "fields": fields, "sample_rate": rate,
+    })
+    record.created = created
+    return record
+
+
+class _Listener(QueueListener):
+    """キューの (時刻, イベント名, 値, 割合) を LogRecord にして書き出す"""
+
+    def prepare(self, item):
+        # LogRecord を作るのも数マイクロ秒かかるので、リクエストのスレッドではなくここで作る
+        return _make_record(item)
+
+    def enqueue_sentinel(self):
+        # 止めるときはキューが空くのを待ってでも終わりの印を入れる (残りは全て書き出す)
+        self.queue.put(self._sentinel)
+
+
+class EventLog:
+    """
+    構造化したイベントを記録する
+
+    - emit("like", user_id=..., song_id=...) はキューに入れるだけで、すぐに戻る
+    - イベントごとに sample_rates の割合だけ記録する (いいねは1%など)
+    - start() 前や stop() 後は、呼び出したスレッドでそのまま書き出す
+    """
+
+    def __init__(self, sample_rates=None, max_queue=EVENT_LOG_QUEUE_SIZE, handler=None):
+        if sample_rates is None:
+            sample_rates = parse_sample_rates(EVENT_LOG_SAMPLE_RATES)
+        self.sample_rates = sample_rates
+        self._queue = queue.Queue(max_queue)
+        self._writer = handler or logging.StreamHandler()
+        self._writer.setFormatter(_JsonFormatter())
+        self._listener = None
+
+    def emit(self, event: str, **fields):
+        rate = self.sample_rates.get(event, 1.0)
+        if rate < 1 and random.random() >= rate:
+            return
+        item = (time.time(), event, fields, rate)
+        if self._listener is None:
+            self._writer.handle(_make_record(item))
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.log_events_dropped.inc(event)
+
+    def start(self):
+        if self._listener is not None:
+            return
+        self._listener = _Listener(self._queue, self._writer)
+        self._listener.start()
+
+    def stop(self):
+        """書き出しスレッドを止める (キューに残っているイベントは書き出してから)"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+
+event_log = EventLog()
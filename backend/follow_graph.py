@@ -0,0 +1,217 @@
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+from sqlalchemy import select
+
+from models import User, Follow
+
+logger = logging.getLogger("uvicorn")
+
+# --- フォローグラフ (友だちの友だち候補用) ---
+# follows をメモリ上の配列 (CSR形式) に読み込んでおき、2ホップ先のユーザーを数える
+#   indptr[i]:indptr[i+1] の範囲の indices が、ユーザー i がフォローしているユーザー
+# フォロー/解除は差分 (_added / _removed) に記録し、溜まったら配列を作り直す
+
+# 差分がこの件数を超えたら配列を作り直す
+COMPACT_THRESHOLD = int(os.environ.get("FOLLOW_GRAPH_COMPACT_EDGES", "10000"))
+# 共通のフォロー数で絞り込んだあと、好みの近さで並べ替える候補の数
+CANDIDATE_POOL = 200
+# 並べ替えのときの好みの近さの重み (0: 共通のフォロー数だけ, 1: 好みの近さだけ)
+TASTE_WEIGHT = 0.5
+
+
+class FollowGraph:
+    """
+    フォロー関係をユーザー番号 (0, 1, 2, ...) の配列で持つグラフ
+
+    - candidates(user_id) で「フォロー中のユーザーがフォローしている人」を共通のフォロー数つきで返す
+    - add_edge / remove_edge はコミット後に呼ぶ (DBと同じ状態を保つ)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = []        # 番号 -> user_id
+        self._index = {}      # user_id -> 番号
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._added = {}      # 番号 -> 追加されたフォロー先の番号の集合
+        self._removed = set() # 削除された (フォロー元, フォロー先) の番号
+        self._delta_count = 0
+
+    # --- 構築 ---
+
+    def load(self, db):
+        """follows を全件読み込んで作り直す (起動時)"""
+        user_ids = db.execute(select(User.id)).scalars().all()
+        edges = db.execute(select(Follow.follower_id, Follow.followed_id)).all()
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        src = np.fromiter((index[f] for f, _ in edges), dtype=np.int32, count=len(edges))
+        dst = np.fromiter((index[t] for _, t in edges), dtype=np.int32, count=len(edges))
+        self.build(user_ids, src, dst)
+        logger.info(f"follow graph loaded: {len(user_ids)} users, {len(edges)} follows")
+
+    def build(self, user_ids, src, dst):
+        """ユーザーID一覧と、番号で表したフォロー (src -> dst) から作り直す"""
+        indptr, indices = _to_csr(len(user_ids), src, dst)
+        with self._lock:
+            self._ids = list(user_ids)
+            self._index = {user_id: i for i, user_id in enumerate(self._ids)}
+            self._indptr = indptr
+            self._indices = indices
+            self._added = {}
+            self._removed = set()
+            self._delta_count = 0
+
+    # --- フォロー/解除の反映 ---
+
+    def add_edge(self, follower_id: str, followed_id: str):
+        """フォローを追加する (既にあれば何もしない)"""
+        with self._lock:
+            src, dst = self._number(follower_id), self._number(followed_id)
+            if (src, dst) in self._removed:
+                self._removed.discard((src, dst))
+            elif dst in self._added.get(src, ()) or dst in self._csr_row(src):
+                return
+            else:
+                self._added.setdefault(src, set()).add(dst)
+            self._delta_count += 1
+            self._compact_if_needed()
+
+    def remove_edge(self, follower_id: str, followed_id: str):
+        """フォローを削除する (無ければ何もしない)"""
+        with self._lock:
+            src, dst = self._index.get(follower_id), self._index.get(followed_id)
+            if src is None or dst is None:
+                return
+            added = self._added.get(src)
+            if added is not None and dst in added:
+                added.discard(dst)
+            elif (src, dst) not in self._removed and dst in self._csr_row(src):
+                self._removed.add((src, dst))
+            else:
+                return
+            self._delta_count += 1
+            self._compact_if_needed()
+
+    def _number(self, user_id: str) -> int:
+        """ユーザーの番号 (新しいユーザーなら末尾に追加する)"""
+        i = self._index.get(user_id)
+        if i is None:
+            i = self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+        return i
+
+    def _compact_if_needed(self):
+        if self._delta_count < COMPACT_THRESHOLD:
+            return
+        n = len(self._ids)
+        src, dst = self._edges_locked()
+        self._indptr, self._indices = _to_csr(n, src, dst)
+        self._added = {}
+        self._removed = set()
+        self._delta_count = 0
+
+    def _edges_locked(self):
+        """差分を反映した全フォローを (src, dst) の配列で返す"""
+        rows = len(self._indptr) - 1
+        src = np.repeat(np.arange(rows, dtype=np.int32), np.diff(self._indptr))
+        dst = self._indices
+        if self._removed:
+            keep = ~np.isin(_pair_keys(src, dst), _pair_keys_of(self._removed))
+            src, dst = src[keep], dst[keep]
+        if self._added:
+            add_src = [s for s, targets in self._added.items() for _ in targets]
+            add_dst = [t for targets in self._added.values() for t in targets]
+            src = np.concatenate([src, np.array(add_src, dtype=np.int32)])
+            dst = np.concatenate([dst, np.array(add_dst, dtype=np.int32)])
+        return src, dst
+
+    # --- 読み取り ---
+
+    def _csr_row(self, i: int) -> np.ndarray:
+        """配列に入っている分のフォロー先 (差分は含まない)"""
+        if i + 1 < len(self._indptr):
+            return self._indices[self._indptr[i]:self._indptr[i + 1]]
+        return self._indices[:0]
+
+    def _followings_locked(self, i: int) -> np.ndarray:
+        row = self._csr_row(i)
+        if self._removed:
+            row = np.array([t for t in row if (i, t) not in self._removed], dtype=np.int32)
+        added = self._added.get(i)
+        if added:
+            row = np.concatenate([row, np.fromiter(added, dtype=np.int32, count=len(added))])
+        return row
+
+    def candidates(self, user_id: str, pool: int = CANDIDATE_POOL):
+        """
+        フォロー中のユーザーがフォローしている人 (自分・フォロー済みを除く) を
+        共通のフォロー数の多い順に最大 pool 人返す
+        戻り値: (user_id のリスト, 共通のフォロー数の配列)
+        """
+        with self._lock:
+            me = self._index.get(user_id)
+            if me is None:
+                return [], np.zeros(0, dtype=np.int64)
+            followings = self._followings_locked(me)
+            if len(followings) == 0:
+                return [], np.zeros(0, dtype=np.int64)
+
+            # フォロー中の人たちの行 (CSR) をまとめて取り出す
+            in_csr = followings[followings + 1 < len(self._indptr)]
+            starts = self._indptr[in_csr]
+            lengths = self._indptr[in_csr + 1] - starts
+            # 各行の開始位置 + 行内の位置 で、全行の要素の位置を一度に作る
+            row_offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            positions = np.repeat(starts, lengths) + (np.arange(lengths.sum()) - row_offsets)
+            hop2 = self._indices[positions]
+
+            if self._removed:
+                owners = np.repeat(in_csr, lengths)
+                hop2 = hop2[~np.isin(_pair_keys(owners, hop2), _pair_keys_of(self._removed))]
+            extra = [t for f in followings.tolist() for t in self._added.get(f, ())]
+            if extra:
+                hop2 = np.concatenate([hop2, np.array(extra, dtype=np.int32)])
+
+            found, mutual = np.unique(hop2, return_counts=True)
+            keep = ~np.isin(found, followings) & (found != me)
+            found, mutual = found[keep], mutual[keep]
+            if len(found) > pool:
+                top = np.argpartition(-mutual, pool)[:pool]
+                found, mutual = found[top], mutual[top]
+            return [self._ids[i] for i in found.tolist()], mutual
+
+
+def rank(mutual: np.ndarray, my_scores, candidate_scores: np.ndarray, taste_weight: float = TASTE_WEIGHT):
+    """
+    共通のフォロー数と好みの近さ (4軸スコアのコサイン類似度) を合わせた点数を返す (0〜1)
+    スコアは 0.5 を中心にしてから比べる (タイプの判定と同じく 0.5 より上か下かが意味を持つため)
+    """
+    me = np.asarray(my_scores, dtype=np.float32) - 0.5
+    others = np.asarray(candidate_scores, dtype=np.float32) - 0.5
+    norms = np.linalg.norm(others, axis=1) * np.linalg.norm(me)
+    cosine = np.divide(others @ me, norms, out=np.zeros(len(others), dtype=np.float32), where=norms > 0)
+    similarity = (cosine + 1) / 2
+    closeness = np.log1p(mutual) / math.log1p(max(int(mutual.max()), 1)) if len(mutual) else mutual
+    return (1 - taste_weight) * closeness + taste_weight * similarity, cosine
+
+
+def _to_csr(n: int, src: np.ndarray, dst: np.ndarray):
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+
+def _pair_keys(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    return src.astype(np.int64) << 32 | dst.astype(np.int64)
+
+
+def _pair_keys_of(pairs) -> np.ndarray:
+    return np.fromiter((s << 32 | d for s, d in pairs), dtype=np.int64, count=len(pairs))
+
+
+follow_graph = FollowGraph()
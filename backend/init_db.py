@@ -1,6 +1,7 @@
 from database import engine, SessionLocal, Base
 from models import User, Song, MusicType, Post
 from data import songs, users, music_types
+from migrations import upgrade_schema
 import os
 
 # BASE_URL = "http://127.0.0.1:8000"
@@ -10,6 +11,8 @@ def init_database():
     # テーブルを全部作る (CREATE TABLE文の発行)
     # models.py で定義した User, Songの箱が作られる
     Base.metadata.create_all(bind=engine)
+    # 既存のDBを今のモデルに合わせる
+    upgrade_schema(engine)
     print("テーブル作成完了")
 
     # DBを開く
@@ -40,7 +43,7 @@ def init_database():
                     title=s["title"],
                     artist=s["artist"],
                     url=s["url"],
-                    parameters=s["parameters"]
+                    **s["features"]
                 )
                 db.add(new_song)
                 print(f"曲追加: {s['title']}")
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import NamedTuple
+
+import crud
+import typeCal
+from write_queue import write_queue
+
+logger = logging.getLogger("uvicorn")
+
+# --- 設定 ---
+# 最大でこの時間(ms)分のいいねが、プロセスの異常終了時に失われうる (= 書き込み間隔)
+# 0 のときはバッファを使わず、今まで通り1タップごとにDBへ書き込む
+LIKE_BUFFER_MAX_LOSS_MS = int(os.environ.get("LIKE_BUFFER_MAX_LOSS_MS", "0"))
+# これだけ溜まったら時間を待たずに書き込む
+LIKE_BUFFER_MAX_EVENTS = int(os.environ.get("LIKE_BUFFER_MAX_EVENTS", "200"))
+# 書き込みがこの回数続けて失敗したら、その分はあきらめてログに残す (いつまでも溜め続けない)
+LIKE_BUFFER_MAX_RETRIES = int(os.environ.get("LIKE_BUFFER_MAX_RETRIES", "5"))
+
+
+class UserSnapshot(NamedTuple):
+    """ある時点のユーザー状態 (ロックの外で読んでも他のいいねで変わらない)"""
+
+    id: str
+    name: str
+    score_vc: float
+    score_ma: float
+    score_pr: float
+    score_hs: float
+    music_type_code: str | None
+
+
+class _UserState:
+    """バッファ内で保持するユーザーの最新スコア (typeCal にそのまま渡せる形)"""
+
+    __slots__ = ("id", "name", "score_vc", "score_ma", "score_pr", "score_hs", "music_type_code")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.name = user.name
+        self.score_vc = user.score_vc
+        self.score_ma = user.score_ma
+        self.score_pr = user.score_pr
+        self.score_hs = user.score_hs
+        self.music_type_code = user.music_type_code
+
+    def snapshot(self) -> UserSnapshot:
+        return UserSnapshot(self.id, self.name, self.score_vc, self.score_ma, self.score_pr, self.score_hs,
+                            self.music_type_code)
+
+
+class LikeBuffer:
+    """
+    いいねをメモリ上で受け付け、まとめてDBへ書き込むバッファ (write-behind)
+
+    - 累計数・スコア・タイプコードはメモリ上の値で即座に返す
+    - max_loss_ms ごと、または max_events 件溜まったら LikeLog とスコアを1トランザクションで保存
+    - stop() で残りを必ず書き込む (write_queue より先に止めること)
+    - 書き込みが終わったユーザーの状態は捨てる (保持するのは未保存のいいねがあるユーザーだけ)
+    """
+
+    def __init__(self, max_loss_ms=LIKE_BUFFER_MAX_LOSS_MS, max_events=LIKE_BUFFER_MAX_EVENTS,
+                 writer=write_queue, max_retries=LIKE_BUFFER_MAX_RETRIES):
+        self.max_loss_ms = max_loss_ms
+        self.max_events = max_events
+        self.writer = writer
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()        # メモリ上の状態を守る
+        self._released = threading.Condition(self._lock)  # bypass_user が終わったことを知らせる
+        self._flush_lock = threading.Lock()  # DBへの書き込みを1本にする
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+        self._users = {}         # user_id -> _UserState
+        self._totals = {}        # user_id -> {song_id: 累計いいね数}
+        self._pending = []       # [(user_id, song_id, timestamp)]
+        self._dirty_users = set()
+        self._bypassing = {}     # user_id -> bypass_user の中にいる数 (その間はいいねを待たせる)
+        self._generation = 0     # ユーザーの状態を捨てるたびに増やす (ロックの外で読んだ値が古くないかの確認用)
+        self._failed_flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_loss_ms > 0
+
+    # --- ライフサイクル ---
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="like-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """書き込みスレッドを止め、残っているいいねを全て保存する"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        interval = self.max_loss_ms / 1000
+        while not self._stopping:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self.flush()
+
+    # --- 受け付け ---
+
+    def add(self, db, user_id: str, song_id: int, song_vector):
+        """
+        いいねを1件受け付け、(累計数, このいいねを反映したユーザー状態 UserSnapshot) を返す
+        song_vector: catalog.get_song_vector の4軸ベクトル
+        ユーザーが存在しなければ None
+        """
+        while True:
+            with self._lock:
+                while user_id in self._bypassing:
+                    self._released.wait()
+                generation = self._generation
+                cached = user_id in self._users and song_id in self._totals.get(user_id, ())
+
+            user = count = None
+            if not cached:
+                # 初めてのユーザー・曲だけDBから読む (ロックの外で読み、遅い読み込みで他のいいねを待たせない)
+                user = crud.get_user_by_id(db, user_id)
+                if user is None:
+                    return None
+                count = crud.count_likes(db, song_id, user_id)
+
+            with self._lock:
+                if self._generation != generation or user_id in self._bypassing:
+                    # 読んでいる間に状態が捨てられた・直接書き換えが始まった (書き込み後の値で読み直す)
+                    continue
+                state = self._users.get(user_id)
+                if state is None:
+                    state = self._users[user_id] = _UserState(user)
+                totals = self._totals.setdefault(user_id, {})
+                # 読んでいる間に他のいいねが入っていれば、バッファの値を使う
+                total = totals.get(song_id, count)
+
+                new_vc, new_ma, new_pr, new_hs = typeCal.calculate_new_scores(state, song_vector)
+                state.score_vc = new_vc
+                state.score_ma = new_ma
+                state.score_pr = new_pr
+                state.score_hs = new_hs
+                state.music_type_code = typeCal.determine_music_type_code(new_vc, new_ma, new_pr, new_hs)
+                self._dirty_users.add(user_id)
+
+                total += 1
+                totals[song_id] = total
+                self._pending.append((user_id, song_id, datetime.now()))
+                pending_count = len(self._pending)
+                snapshot = state.snapshot()
+                break
+
+        if pending_count >= self.max_events:
+            self._wakeup.set()
+        return total, snapshot
+
+    # --- 読み取り (まだ書き込まれていない分を反映するため) ---
+
+    def peek_user(self, user_id: str):
+        """バッファが持っている最新のユーザー状態 UserSnapshot (無ければ None)"""
+        with self._lock:
+            state = self._users.get(user_id)
+            return state.snapshot() if state is not None else None
+
+    def cached_totals(self, user_id: str) -> dict:
+        """バッファが把握しているユーザーの曲ごとの累計いいね数"""
+        with self._lock:
+            return dict(self._totals.get(user_id, ()))
+
+    @contextmanager
+    def bypass_user(self, user_id: str):
+        """
+        ユーザーのスコアやいいねを他の処理で直接書き換える間、with で囲む
+        未保存の分を書き込んでからキャッシュを捨て、with を抜ける (書き換えが保存される) まで
+        そのユーザーのいいねを待たせる (書き換え前の値を読み直してバッファに入れないように)
+        """
+        if not self.enabled:
+            yield
+            return
+        with self._flush_lock:
+            self._flush_locked()
+            with self._lock:
+                self._bypassing[user_id] = self._bypassing.get(user_id, 0) + 1
+                self._dirty_users.discard(user_id)
+                self._forget_locked([user_id])
+                self._generation += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._bypassing[user_id] == 1:
+                    del self._bypassing[user_id]
+                else:
+                    self._bypassing[user_id] -= 1
+                self._released.notify_all()
+
+    # --- 書き込み ---
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            if not self._pending and not self._dirty_users:
+                return
+            pending, self._pending = self._pending, []
+            dirty, self._dirty_users = self._dirty_users, set()
+            like_rows = [
+                {"user_id": user_id, "song_id": song_id, "timestamp": ts}
+                for user_id, song_id, ts in pending
+            ]
+            score_rows = [
+                {
+                    "id": s.id,
+                    "score_vc": s.score_vc,
+                    "score_ma": s.score_ma,
+                    "score_pr": s.score_pr,
+                    "score_hs": s.score_hs,
+                    "music_type_code": s.music_type_code,
+                }
+                for s in (self._users[uid] for uid in dirty)
+            ]
+
+        try:
+            self.writer.run(crud.save_like_batch, like_rows, score_rows)
+        except Exception as e:
+            self._failed_flushes += 1
+            if self._failed_flushes < self.max_retries:
+                logger.error(f"like buffer flush failed ({len(like_rows)} likes, "
+                             f"{self._failed_flushes}/{self.max_retries}): {e}")
+                # 失敗した分は次回に持ち越す
+                with self._lock:
+                    self._pending[:0] = pending
+                    self._dirty_users |= dirty
+                return
+            # 何度やっても保存できない分はあきらめ、あとで入れ直せるよう中身をログに残す
+            logger.error(
+                f"like buffer flush failed {self._failed_flushes} times, dropping {len(like_rows)} likes: {e}\n"
+                + json.dumps({"likes": like_rows, "scores": score_rows}, default=str, ensure_ascii=False)
+            )
+
+        self._failed_flushes = 0
+        with self._lock:
+            # 未保存の分が残っていないユーザーの状態は捨てる (次はDBから読む)
+            # 書き込めた分はDBと同じ値になり、あきらめた分はメモリ上の累計・スコアが保存されていないため
+            active = {user_id for user_id, _, _ in self._pending} | self._dirty_users
+            self._forget_locked([user_id for user_id in self._users if user_id not in active])
+
+    def _forget_locked(self, user_ids):
+        forgot = False
+        for user_id in user_ids:
+            forgot |= self._users.pop(user_id, None) is not None
+            forgot |= self._totals.pop(user_id, None) is not None
+        if forgot:
+            self._generation += 1
+
+
+like_buffer = LikeBuffer()
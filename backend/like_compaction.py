@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import crud
+from trending import DAYS as TRENDING_DAYS
+from write_queue import write_queue
+
+logger = logging.getLogger("uvicorn")
+
+# --- いいねログの圧縮 ---
+# like_logs はタップ1回ごとに1行増えるので、古い分は日ごとの集計 (like_rollups) にまとめて削除する
+# 累計数 (like_counts) はそのままなので、表示されるいいね数は変わらない
+# 1回の書き込みは LIKE_COMPACTION_CHUNK 件までにして、他の書き込みを長く待たせない
+
+# この日数より古いいいねログをまとめる (0 のときは圧縮しない)
+# 急上昇 (trending.py) は起動時に直近7日のログを読むので、それより短くはしない
+LIKE_LOG_RETENTION_DAYS = int(os.environ.get("LIKE_LOG_RETENTION_DAYS", "30"))
+# 1回のトランザクションで移す件数
+LIKE_COMPACTION_CHUNK = int(os.environ.get("LIKE_COMPACTION_CHUNK", "1000"))
+# 圧縮を実行する間隔 (時間)
+LIKE_COMPACTION_INTERVAL_HOURS = float(os.environ.get("LIKE_COMPACTION_INTERVAL_HOURS", "6"))
+
+
+def compact(run, retention_days: int = LIKE_LOG_RETENTION_DAYS, chunk: int = LIKE_COMPACTION_CHUNK,
+            should_stop=lambda: False) -> int:
+    """
+    保存期間より古いいいねログを、chunk 件ずつ別のトランザクションで集計に移す
+    run: run(crud.compact_like_logs, before, chunk) を実行する関数 (write_queue.run など)
+    移した件数を返す
+    """
+    before = datetime.now() - timedelta(days=max(retention_days, TRENDING_DAYS))
+    total = 0
+    while not should_stop():
+        moved = run(crud.compact_like_logs, before, chunk)
+        total += moved
+        if moved < chunk:
+            break
+    return total
+
+
+class LikeCompactor:
+    """
+    いいねログの圧縮を定期的に実行するスレッド
+    stop() は write_queue より先に呼ぶこと (途中のチャンクで止まり、残りは次回に回す)
+    """
+
+    def __init__(self, retention_days=LIKE_LOG_RETENTION_DAYS, interval_hours=LIKE_COMPACTION_INTERVAL_HOURS,
+                 writer=write_queue):
+        self.retention_days = retention_days
+        self.interval_hours = interval_hours
+        self.writer = writer
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="like-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                moved = compact(self.writer.run, self.retention_days, should_stop=self._stopping.is_set)
+                if moved:
+                    logger.info(f"like logs compacted: {moved} rows")
+            except Exception as e:
+                logger.error(f"like log compaction failed: {e}")
+            self._stopping.wait(self.interval_hours * 3600)
+
+
+like_compactor = LikeCompactor()
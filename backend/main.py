@@ -1,21 +1,51 @@
 import logging
-import json
-from fastapi import FastAPI, Depends, status, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Query, status, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session, joinedload
-from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from pydantic import BaseModel, ConfigDict, Field
+import pydantic_core
+from datetime import datetime
 import os
+import time
+
+import numpy as np
 
-import models
 import crud
-from database import get_db
+import crud_async
+import metrics
+from event_log import event_log
+from database import (
+    get_async_db, engine, SessionLocal, ReadSessionLocal, async_read_engine,
+    sql_stats_scope, record_request_sql, route_sql_stats,
+)
+from like_buffer import like_buffer
+from like_compaction import like_compactor
+from write_queue import write_queue
+from migrations import upgrade_schema
+import catalog
+from follow_graph import follow_graph, rank as rank_suggestions
+from taste_index import taste_index
+from recommendations import recommendation_cache
+from trending import trending, TYPE_GROUPS, WINDOWS as TRENDING_WINDOWS
+import type_registry
 
 import typeCal
 
 
 LIKE_MILESTONE = 5
 
+# /posts の1ページあたりの最大件数と、各投稿に付けるコメントの件数
+MAX_POSTS_PER_PAGE = 100
+COMMENT_PREVIEW_LIMIT = 3
+
+# 1 のときだけ調査用のAPI (GET /debug/sql-stats) を公開する (本番では公開しない)
+DEBUG_ROUTES = os.environ.get("DEBUG_ROUTES", "0") == "1"
+
 # How to run
 # cd backend
 # uvicorn main:app --reload
@@ -25,7 +55,48 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 既存のDBを今のモデルに合わせ、曲ベクトルを読み込んでおく
+    upgrade_schema(engine)
+    db = SessionLocal()
+    try:
+        catalog.load_song_vectors(db)
+        follow_graph.load(db)
+        taste_index.load(db)
+        trending.load(db)
+    finally:
+        db.close()
+    type_registry.load()
+    type_registry.start()
+
+    # DBへの書き込みはすべて write_queue のスレッドで行う
+    # いいねバッファの書き込みスレッドを起動し、終了時に残りを必ず保存する
+    # 古いいいねログは定期的に日ごとの集計にまとめる
+    # いいね・ログインなどのイベントログは別スレッドで書き出す
+    event_log.start()
+    write_queue.start()
+    like_buffer.start()
+    like_compactor.start()
+    yield
+    like_compactor.stop()
+    like_buffer.stop()
+    write_queue.stop()
+    event_log.stop()
+    type_registry.stop()
+    await async_read_engine.dispose()
+
+class FastJSONResponse(JSONResponse):
+    """
+    pydantic-core (Rust) でJSONにする。json.dumps より速く、出力は JSONResponse と同じ (UTF-8・空白なし)
+    レスポンスモデルのあるAPIは、FastAPI がモデルで検証・変換した値がここに来る
+    """
+
+    def render(self, content) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # ngrok用にCORSを全許可
 app.add_middleware(
@@ -34,8 +105,73 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],    
     allow_headers=["*"],
+    # ページング用のカーソルをフロントから読めるようにする
+    expose_headers=["X-Next-Cursor"],
 )
 
+
+class SqlStatsMiddleware:
+    """
+    APIごとに、1リクエストで実行したSQLの数・DBの時間を数える (database.py の計測)
+    集計は "GET /posts/{post_id}/comments" のようにパスのテンプレート単位 (GET /metrics、DEBUG_ROUTES=1 なら GET /debug/sql-stats で見られる)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with sql_stats_scope() as stats:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # ルーティング後に scope["route"] が入る (静的ファイルなど API 以外は数えない)
+                route = scope.get("route")
+                if route is not None:
+                    record_request_sql(f"{scope['method']} {route.path}", stats)
+
+
+app.add_middleware(SqlStatsMiddleware)
+
+
+class MetricsMiddleware:
+    """
+    APIごとのリクエスト数 (ステータス別)・処理時間のヒストグラムと、処理中のリクエスト数を数える (GET /metrics)
+    SqlStatsMiddleware の外側に置くので、処理時間にはSQLの集計も含まれる
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        started = time.perf_counter()
+        metrics.http_in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.http_in_flight.dec()
+            # ラベルはパスのテンプレート (ユーザーIDなどで種類が増えないように)。API 以外はまとめて数える
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.http_requests.inc(scope["method"], path, str(status_code))
+            metrics.http_duration.observe(time.perf_counter() - started, scope["method"], path)
+
+
+app.add_middleware(MetricsMiddleware)
+
 # --- パス設定 ---
 # backendディレクトリの場所
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -57,6 +193,14 @@ class LikeRequest(BaseModel):
     song_id: int
     user_id: str
 
+class LikeTap(BaseModel):
+    song_id: int
+    count: int = Field(1, ge=1, le=100)
+
+class LikeBatchRequest(BaseModel):
+    user_id: str
+    taps: list[LikeTap] = Field(..., min_length=1)
+
 
 class PostCreateRequest(BaseModel):
     user_id: str
@@ -76,27 +220,170 @@ class UnlikeRequest(BaseModel):
     user_id: str
 
 
+# レスポンスモデル: FastAPI が jsonable_encoder で辞書を1つずつたどる代わりに、
+# pydantic-core の型付きの検証・変換 (コンパイル済み) でまとめてJSONにする
+class MusicTypeResponse(BaseModel):
+    code: str
+    name: str
+    description: str | None
+
+class ScoresResponse(BaseModel):
+    VC: float
+    MA: float
+    PR: float
+    HS: float
+
+class UserResponse(BaseModel):
+    """ログインしたユーザー (User をそのまま返す)"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    name: str
+    score_vc: float | None
+    score_ma: float | None
+    score_pr: float | None
+    score_hs: float | None
+    music_type_code: str | None
+    follower_count: int
+    following_count: int
+
+class UserNameResponse(BaseModel):
+    id: str
+    name: str
+
+class UserSummaryResponse(UserNameResponse):
+    music_type: MusicTypeResponse | None
+
+class UserDetailResponse(BaseModel):
+    id: str
+    name: str
+    scores: ScoresResponse
+    music_type: MusicTypeResponse | None
+    music_type_code: str | None
+    follower_count: int
+    following_count: int
+    viewer_is_following: bool
+
+class SuggestionResponse(UserSummaryResponse):
+    mutual_follow_count: int
+    taste_similarity: float
+
+class SimilarUserResponse(UserSummaryResponse):
+    music_type_code: str | None
+    distance: float
+
+class DiagnosisResponse(BaseModel):
+    status: str
+    music_type_code: str
+
+class LikeResponse(BaseModel):
+    status: str
+    total_likes: int
+    is_milestone: bool
+    is_favorite: bool
+    user_music_type: str | None
+    scores: ScoresResponse
+
+class LikeTapResult(BaseModel):
+    song_id: int
+    total_likes: int
+    is_milestone: bool
+    is_favorite: bool
+
+class LikeBatchResponse(LikeResponse):
+    results: list[LikeTapResult]
+
+class UnlikeResponse(BaseModel):
+    status: str
+    total_likes: int
+    is_favorite: bool
+
+class FavoritesResponse(BaseModel):
+    song_ids: list[int]
+
+class SongSummaryResponse(BaseModel):
+    id: int
+    title: str
+    artist: str | None
+    url: str | None
+
+class SongResponse(SongSummaryResponse):
+    # key・mode などは整数のまま返す
+    features: dict[str, int | float | None]
+
+class RecommendedSongResponse(SongResponse):
+    distance: float
+
+class TrendingSongResponse(SongResponse):
+    like_count: int
+    score: float
+
+class CommentResponse(BaseModel):
+    id: int
+    content: str
+    created_at: str
+    user: UserSummaryResponse | None
+
+class PostResponse(BaseModel):
+    id: int
+    comment: str
+    created_at: str
+    user: UserSummaryResponse | None
+    song: SongSummaryResponse | None
+    comment_count: int
+    comments: list[CommentResponse]
+
+class CreatedPostResponse(BaseModel):
+    id: int
+    comment: str
+    created_at: str
+    user: UserNameResponse
+    song: SongSummaryResponse
+
+class FollowResponse(BaseModel):
+    status: str
+    follower_count: int
+
+
 # --- API ---
+# よく呼ばれるAPIは async def にしている (DBを待つ間スレッドプールを占有しない)
+#   読み込み: get_async_db + crud_async
+#   書き込み: await write_queue.run_async(...)
+# いいねバッファを使う処理など、ブロックする処理が残るAPIは通常の def のまま
 
 # 全曲取得API
+# エンコード済みの曲一覧を返す。If-None-Match が一致すれば 304 (DBアクセス・変換なし)
 @app.get("/songs")
-def read_songs(db: Session = Depends(get_db)):
-    return crud.get_all_songs(db)
+def read_songs(request: Request):
+    body, etag = catalog.get_encoded_catalog()
+    headers = {"ETag": etag, "Cache-Control": catalog.CACHE_CONTROL}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        client_etags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if etag in client_etags or "*" in client_etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.post("/login", response_model=UserResponse)
+async def login(req: LoginRequest):
+    user, created = await write_queue.run_async(_login, req)
+    # イベントは保存が確定してから記録する
+    event_log.emit("user_created" if created else "login", user_id=user.id, user=user.name)
+    return user
 
-@app.post("/login")
-def login(req: LoginRequest, db: Session = Depends(get_db)):
+def _login(db: Session, req: LoginRequest):
     # その名前の人がいるか探す
     user = crud.get_user_by_name(db, req.name)
     
     # いなければ新しく作る
-    if not user:
+    created = not user
+    if created:
         user = crud.create_user(db, req.name)
-        logger.info(f"✨ New User Created: {user.name} ({user.id})")
-    else:
-        logger.info(f"🔙 Login: {user.name} ({user.id})")
     
-    # ユーザー情報を返す
-    return user
+    # ユーザー情報と、新しく作ったかを返す
+    return user, created
 
 # 診断結果受け取り用モデル
 class DiagnosisRequest(BaseModel):
@@ -107,8 +394,17 @@ class DiagnosisRequest(BaseModel):
     score_hs: float
 
 # 診断結果保存API
-@app.post("/diagnosis")
-def save_diagnosis(req: DiagnosisRequest, db: Session = Depends(get_db)):
+@app.post("/diagnosis", response_model=DiagnosisResponse)
+def save_diagnosis(req: DiagnosisRequest):
+    # バッファに残っているスコアで上書きされないよう先に書き出し、保存し終わるまでいいねを待たせる
+    with like_buffer.bypass_user(req.user_id):
+        user, result = write_queue.run(_save_diagnosis, req)
+        scores_changed(req.user_id, (req.score_vc, req.score_ma, req.score_pr, req.score_hs))
+    metrics.diagnoses.inc()
+    event_log.emit("diagnosis", user_id=user.id, user=user.name, music_type_code=result["music_type_code"])
+    return result
+
+def _save_diagnosis(db: Session, req: DiagnosisRequest):
     user = crud.get_user_by_id(db, req.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -127,93 +423,164 @@ def save_diagnosis(req: DiagnosisRequest, db: Session = Depends(get_db)):
 
     db.add(user)
     db.commit()
-    
-    logger.info(f"📝 Diagnosis Updated: {user.name} -> {new_code}")
 
-    return {"status": "ok", "music_type_code": new_code}
+    return user, {"status": "ok", "music_type_code": new_code}
 
 # 詳細取得用API (Profile画面用)
-@app.get("/users/{user_id}")
-def get_user_detail(user_id: str, viewer_id: str | None = None, db: Session = Depends(get_db)):
-    # joinedloadでMusicType情報も結合して取得
-    user = db.query(models.User).options(joinedload(models.User.music_type)).filter(models.User.id == user_id).first()
+@app.get("/users/{user_id}", response_model=UserDetailResponse)
+async def get_user_detail(user_id: str, viewer_id: str | None = None, db: AsyncSession = Depends(get_async_db)):
+    # ユーザー・フォロワー数・フォロー数・viewer がフォロー中か を1回のクエリで取得
+    profile = await crud_async.get_user_profile(db, user_id, viewer_id)
     
-    if not user:
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
+    user, viewer_is_following = profile
     
-    # 診断結果データの整形
-    music_type_data = None
-    if user.music_type:
-        music_type_data = {
-            "code": user.music_type.code,
-            "name": user.music_type.name,
-            "description": user.music_type.description
-        }
+    # まだDBに書き込まれていないいいねのスコアを反映
+    scores_src = like_buffer.peek_user(user.id) or user
+    music_type_code = scores_src.music_type_code
 
-    follower_count = crud.count_followers(db, user.id)
-    following_count = crud.count_followings(db, user.id)
-    viewer_is_following = False
-    if viewer_id:
-        viewer_is_following = crud.is_following(db, viewer_id, user.id)
+    # 診断結果データ (起動時に読み込んだMusicTypeを使う)
+    music_type_data = type_registry.get(music_type_code)
 
     return {
         "id": user.id,
         "name": user.name,
         "scores": {
-            "VC": user.score_vc,
-            "MA": user.score_ma,
-            "PR": user.score_pr,
-            "HS": user.score_hs
+            "VC": scores_src.score_vc,
+            "MA": scores_src.score_ma,
+            "PR": scores_src.score_pr,
+            "HS": scores_src.score_hs
         },
         "music_type": music_type_data,
-        "music_type_code": user.music_type_code,
-        "follower_count": follower_count,
-        "following_count": following_count,
+        "music_type_code": music_type_code,
+        "follower_count": user.follower_count,
+        "following_count": user.following_count,
         "viewer_is_following": viewer_is_following,
     }
 
-@app.post("/likes", status_code=status.HTTP_201_CREATED)
-def create_like(like: LikeRequest, db: Session = Depends(get_db)):
-    # 曲の存在チェック
-    target_song = crud.get_song_by_id(db, like.song_id)
-    if target_song is None:
+@app.get("/users/{user_id}/suggestions", response_model=list[SuggestionResponse])
+async def get_suggestions(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    友だち候補: フォロー中の人がフォローしている人を、
+    共通のフォロー数と好みの近さ (4軸スコア) で並べて返す
+    """
+    candidate_ids, mutual = follow_graph.candidates(user_id)
+    if not candidate_ids:
+        if not await crud_async.get_user_by_id(db, user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        return []
+
+    users = {u.id: u for u in await crud_async.get_users_by_ids(db, [user_id, *candidate_ids])}
+    if user_id not in users:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    def scores_of(user_id):
+        # まだDBに書き込まれていないいいねのスコアを反映
+        u = like_buffer.peek_user(user_id) or users[user_id]
+        return (u.score_vc, u.score_ma, u.score_pr, u.score_hs)
+
+    found = [i for i, candidate_id in enumerate(candidate_ids) if candidate_id in users]
+    candidate_ids = [candidate_ids[i] for i in found]
+    mutual = mutual[found]
+    points, similarity = rank_suggestions(
+        mutual, scores_of(user_id), [scores_of(c) for c in candidate_ids]
+    )
+
+    results = []
+    for i in np.argsort(-points)[:limit].tolist():
+        candidate = users[candidate_ids[i]]
+        results.append({
+            "id": candidate.id,
+            "name": candidate.name,
+            "music_type": type_registry.get(candidate.music_type_code),
+            "mutual_follow_count": int(mutual[i]),
+            "taste_similarity": round(float(similarity[i]), 3),
+        })
+    return results
+
+@app.get("/users/{user_id}/similar", response_model=list[SimilarUserResponse])
+async def get_similar_users(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    好みの近いユーザー: 4軸スコアの距離が近い順に返す (タイプ診断前のユーザーは空)
+    """
+    nearest = taste_index.nearest(user_id, limit)
+    if nearest is None:
+        if not await crud_async.get_user_by_id(db, user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        return []
+
+    users = {u.id: u for u in await crud_async.get_users_by_ids(db, [uid for uid, _ in nearest])}
+    results = []
+    for other_id, distance in nearest:
+        other = users.get(other_id)
+        if other is None:
+            continue
+        # インデックス上のタイプ (まだDBに書き込まれていないいいねを含む)
+        music_type_code = taste_index.type_code(other_id) or other.music_type_code
+        results.append({
+            "id": other.id,
+            "name": other.name,
+            "music_type": type_registry.get(music_type_code),
+            "music_type_code": music_type_code,
+            "distance": round(distance, 4),
+        })
+    return results
+
+def scores_changed(user_id: str, scores):
+    """
+    スコア (VC, MA, PR, HS) が変わったあとに呼ぶ
+    好みの近いユーザーの検索に反映し、おすすめ曲のキャッシュを捨てる
+    """
+    taste_index.update(user_id, scores)
+    recommendation_cache.invalidate(user_id)
+
+def response_scores(result: dict):
+    """いいねのレスポンスの scores ({"VC": ..., ...}) を (VC, MA, PR, HS) にする"""
+    scores = result["scores"]
+    return scores["VC"], scores["MA"], scores["PR"], scores["HS"]
+
+@app.post("/likes", status_code=status.HTTP_201_CREATED, response_model=LikeResponse)
+async def create_like(like: LikeRequest):
+    if like_buffer.enabled:
+        result = await run_in_threadpool(create_like_buffered, like)
+    else:
+        user, result = await write_queue.run_async(_create_like, like)
+        scores_changed(like.user_id, response_scores(result))
+        trending.record(like.song_id, result["user_music_type"])
+        event_log.emit("like", user_id=like.user_id, user=user.name, song_id=like.song_id,
+                       total=result["total_likes"])
+    metrics.likes.inc()
+    if result["is_milestone"]:
+        metrics.like_milestones.inc()
+    return result
+
+def _create_like(db: Session, like: LikeRequest):
+    # 曲の存在チェック (起動時に読み込んだ曲ベクトルを使う)
+    song_vector = catalog.get_song_vector(db, like.song_id)
+    if song_vector is None:
         raise HTTPException(status_code=404, detail="曲が見つかりません")
 
-    # テストユーザー取得 (DBから)
-    user = crud.get_user_by_id(db, like.user_id)
-    if not user:
+    # スコア更新・いいね保存・集計を1トランザクションで行う
+    applied = crud.apply_like(db, like.user_id, like.song_id, song_vector)
+    if applied is None:
         raise HTTPException(status_code=500, detail="テストユーザーがいません")
-    
-    if target_song.parameters:
-        # 新しいスコアを計算
-        new_vc, new_ma, new_pr, new_hs = typeCal.calculate_new_scores(user, target_song.parameters)
-        
-        # 新しいタイプコードを決定
-        new_type_code = typeCal.determine_music_type_code(new_vc, new_ma, new_pr, new_hs)
-        
-        # ユーザー情報を更新
-        user.score_vc = new_vc
-        user.score_ma = new_ma
-        user.score_pr = new_pr
-        user.score_hs = new_hs
-        user.music_type_code = new_type_code
-        
-        db.add(user)
-
-    # いいね保存 (DBへ)
-    crud.create_like(db, user.id, like.song_id)
-    
-    # 集計
-    total = crud.count_likes(db, like.song_id, user.id)
+    user, total = applied
     
     # 5回以上押されていれば「お気に入り扱い」
     is_favorite = (total >= LIKE_MILESTONE)
     # ちょうど5回目のときだけ「マイルストーン達成」とする（トースト用）
     just_reached_milestone = (total == LIKE_MILESTONE)
 
-    logger.info(f"[❤️]: User: {user.name} | SongID: {like.song_id} | Total: {total}")
-
-    return {
+    return user, {
         "status": "ok", 
         "total_likes": total, 
         "is_milestone": just_reached_milestone,
@@ -228,27 +595,223 @@ def create_like(like: LikeRequest, db: Session = Depends(get_db)):
     }
 
 
-@app.get("/favorites/{user_id}")
-def get_favorites(user_id: str, db: Session = Depends(get_db)):
+def create_like_buffered(like: LikeRequest):
+    """
+    いいねをメモリ上のバッファで受け付ける (LIKE_BUFFER_MAX_LOSS_MS > 0 のとき)
+    DBへの保存はバッファがまとめて行う (ここでは読み込みだけ)
+    """
+    db = ReadSessionLocal()
+    try:
+        song_vector = catalog.get_song_vector(db, like.song_id)
+        if song_vector is None:
+            raise HTTPException(status_code=404, detail="曲が見つかりません")
+        acked = like_buffer.add(db, like.user_id, like.song_id, song_vector)
+    finally:
+        db.close()
+    if acked is None:
+        raise HTTPException(status_code=500, detail="テストユーザーがいません")
+    total, user = acked
+    scores_changed(user.id, (user.score_vc, user.score_ma, user.score_pr, user.score_hs))
+    trending.record(like.song_id, user.music_type_code)
+
+    is_favorite = (total >= LIKE_MILESTONE)
+    just_reached_milestone = (total == LIKE_MILESTONE)
+
+    event_log.emit("like", user_id=like.user_id, user=user.name, song_id=like.song_id, total=total)
+
+    return {
+        "status": "ok",
+        "total_likes": total,
+        "is_milestone": just_reached_milestone,
+        "is_favorite": is_favorite,
+        "user_music_type": user.music_type_code,
+        "scores": {
+            "VC": user.score_vc,
+            "MA": user.score_ma,
+            "PR": user.score_pr,
+            "HS": user.score_hs
+        }
+    }
+
+
+@app.post("/likes/batch", status_code=status.HTTP_201_CREATED, response_model=LikeBatchResponse)
+def create_likes_batch(req: LikeBatchRequest):
+    """
+    連打されたいいねをまとめて受け付けるAPI
+    taps を順番に適用し、ログ・集計・スコアを1トランザクションで保存する
+    """
+    # バッファに残っているスコア・回数を先に書き出し、保存し終わるまで1件ずつのいいねを待たせる
+    with like_buffer.bypass_user(req.user_id):
+        user, result = write_queue.run(_create_likes_batch, req)
+        scores_changed(req.user_id, response_scores(result))
+    event_log.emit("like_batch", user_id=user.id, user=user.name,
+                   song_ids=[r["song_id"] for r in result["results"]], taps=sum(tap.count for tap in req.taps))
+    for tap in req.taps:
+        trending.record(tap.song_id, result["user_music_type"], tap.count)
+    metrics.likes.inc(amount=sum(tap.count for tap in req.taps))
+    metrics.like_milestones.inc(amount=sum(r["is_milestone"] for r in result["results"]))
+    return result
+
+def _create_likes_batch(db: Session, req: LikeBatchRequest):
+    song_ids = list({t.song_id for t in req.taps})
+    song_vectors = {song_id: catalog.get_song_vector(db, song_id) for song_id in song_ids}
+    if None in song_vectors.values():
+        raise HTTPException(status_code=404, detail="曲が見つかりません")
+
+    user = crud.get_user_by_id(db, req.user_id)
+    if not user:
+        raise HTTPException(status_code=500, detail="テストユーザーがいません")
+
+    # 新しいスコアを閉じた式でまとめて計算
+    new_vc, new_ma, new_pr, new_hs = typeCal.calculate_batch_scores(
+        user, [(song_vectors[t.song_id], t.count) for t in req.taps]
+    )
+    new_type_code = typeCal.determine_music_type_code(new_vc, new_ma, new_pr, new_hs)
+
+    # 曲ごとの累計 (保存前 -> 保存後)
+    before = crud.get_like_counts(db, user.id, song_ids)
+    totals = dict(before)
+    now = datetime.now()
+    like_rows = []
+    for t in req.taps:
+        totals[t.song_id] = totals.get(t.song_id, 0) + t.count
+        like_rows.extend({"user_id": user.id, "song_id": t.song_id, "timestamp": now} for _ in range(t.count))
+
+    score_rows = [{
+        "id": user.id,
+        "score_vc": new_vc,
+        "score_ma": new_ma,
+        "score_pr": new_pr,
+        "score_hs": new_hs,
+        "music_type_code": new_type_code,
+    }]
+    crud.save_like_batch(db, like_rows, score_rows)
+    db.refresh(user)
+
+    results = []
+    for song_id in dict.fromkeys(t.song_id for t in req.taps):
+        total = totals[song_id]
+        results.append({
+            "song_id": song_id,
+            "total_likes": total,
+            # このバッチの中で5回目をまたいだら「マイルストーン達成」
+            "is_milestone": before.get(song_id, 0) < LIKE_MILESTONE <= total,
+            "is_favorite": total >= LIKE_MILESTONE,
+        })
+
+    # /likes と同じ形 (最後に押した曲の結果) + 曲ごとの結果
+    last = next(r for r in results if r["song_id"] == req.taps[-1].song_id)
+    return user, {
+        "status": "ok",
+        "total_likes": last["total_likes"],
+        "is_milestone": last["is_milestone"],
+        "is_favorite": last["is_favorite"],
+        "user_music_type": user.music_type_code,
+        "scores": {
+            "VC": user.score_vc,
+            "MA": user.score_ma,
+            "PR": user.score_pr,
+            "HS": user.score_hs
+        },
+        "results": results,
+    }
+
+
+@app.get("/favorites/{user_id}", response_model=FavoritesResponse)
+async def get_favorites(user_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     ログインユーザーのお気に入り曲ID一覧を返すAPI
     """
-    user = crud.get_user_by_id(db, user_id)
+    user = await crud_async.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    song_ids = crud.get_favorite_song_ids(db, user_id, threshold=LIKE_MILESTONE)
-    return {"song_ids": song_ids}
+    return {"song_ids": await favorite_song_ids(db, user_id)}
+
+async def favorite_song_ids(db: AsyncSession, user_id: str):
+    song_ids = await crud_async.get_favorite_song_ids(db, user_id, threshold=LIKE_MILESTONE)
+
+    # バッファ上の累計数 (未保存分を含む) を優先する
+    cached = like_buffer.cached_totals(user_id)
+    if cached:
+        favorites = set(song_ids)
+        for song_id, total in cached.items():
+            if total >= LIKE_MILESTONE:
+                favorites.add(song_id)
+            else:
+                favorites.discard(song_id)
+        song_ids = sorted(favorites)
+    return song_ids
+
+@app.get("/recommendations/{user_id}", response_model=list[RecommendedSongResponse])
+async def get_recommendations(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    おすすめ曲: ユーザーの4軸スコアに近い曲を、お気に入り以外から似すぎないように選んで返す
+    """
+    user = await crud_async.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-@app.delete("/likes", status_code=status.HTTP_200_OK)
-def delete_like(req: UnlikeRequest, db: Session = Depends(get_db)):
+    # まだDBに書き込まれていないいいねのスコアを反映
+    scores_src = like_buffer.peek_user(user_id) or user
+    scores = (scores_src.score_vc, scores_src.score_ma, scores_src.score_pr, scores_src.score_hs)
+    favorites = await favorite_song_ids(db, user_id)
+
+    ranked = recommendation_cache.get(user_id, scores, favorites, limit)
+    songs = {s.id: s for s in await crud_async.get_songs_by_ids(db, [song_id for song_id, _ in ranked])}
+    return [
+        {**catalog.song_payload(songs[song_id]), "distance": round(distance, 4)}
+        for song_id, distance in ranked
+        if song_id in songs
+    ]
+
+@app.get("/trending", response_model=list[TrendingSongResponse])
+async def get_trending(
+    window: str = Query("24h", description="24h または 7d"),
+    music_type: str | None = Query(None, description="タイプコード (VMPH など)。指定するとそのタイプの人のいいねだけで数える"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    急上昇の曲: 直近の期間のいいね数を、新しいいいねほど重くして並べる
+    """
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=422, detail="window は 24h か 7d を指定してください")
+    if music_type is not None and music_type not in TYPE_GROUPS:
+        raise HTTPException(status_code=404, detail="Music type not found")
+
+    ranked = trending.top(window, music_type, limit)
+    songs = {s.id: s for s in await crud_async.get_songs_by_ids(db, [song_id for song_id, _, _ in ranked])}
+    return [
+        {**catalog.song_payload(songs[song_id]), "like_count": count, "score": round(score, 3)}
+        for song_id, count, score in ranked
+        if song_id in songs
+    ]
+
+@app.delete("/likes", status_code=status.HTTP_200_OK, response_model=UnlikeResponse)
+def delete_like(req: UnlikeRequest):
     """
     特定の曲に対するユーザーのいいねを1件削除するAPI
     """
+    # バッファに残っているいいねを先に書き出してから削除する (削除し終わるまでいいねを待たせる)
+    with like_buffer.bypass_user(req.user_id):
+        user, deleted, result = write_queue.run(_delete_like, req)
+    event_log.emit("unlike", user_id=user.id, user=user.name, song_id=req.song_id,
+                   deleted=deleted, total=result["total_likes"])
+    # お気に入りが減るので、おすすめ曲を作り直す
+    recommendation_cache.invalidate(req.user_id)
+    metrics.unlikes.inc()
+    return result
+
+def _delete_like(db: Session, req: UnlikeRequest):
     user = crud.get_user_by_id(db, req.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # 現在のいいね数を取得
     current_total = crud.count_likes(db, req.song_id, req.user_id)
     
@@ -263,30 +826,14 @@ def delete_like(req: UnlikeRequest, db: Session = Depends(get_db)):
     delete_count = max(0, current_total - target_count)
     
     if delete_count > 0:
-        # 最新のいいねログを削除する件数分取得して削除
-        like_logs = (
-            db.query(models.LikeLog)
-            .filter(
-                models.LikeLog.user_id == req.user_id,
-                models.LikeLog.song_id == req.song_id
-            )
-            .order_by(models.LikeLog.timestamp.desc())
-            .limit(delete_count)
-            .all()
-        )
-        
-        for like_log in like_logs:
-            db.delete(like_log)
-        
-        db.commit()
+        # 最新のいいねログを削除する件数分削除 (集計テーブルも同時に更新)
+        crud.delete_latest_likes(db, req.user_id, req.song_id, delete_count)
     
     # 削除後のいいね数を取得
     total = crud.count_likes(db, req.song_id, req.user_id)
     is_favorite = (total >= LIKE_MILESTONE)
     
-    logger.info(f"[💔]: User: {user.name} | SongID: {req.song_id} | Deleted: {delete_count} | Remaining: {total}")
-    
-    return {
+    return user, delete_count, {
         "status": "ok",
         "total_likes": total,
         "is_favorite": is_favorite,
@@ -295,8 +842,15 @@ def delete_like(req: UnlikeRequest, db: Session = Depends(get_db)):
 
 # --- 投稿API ---
 
-@app.post("/posts", status_code=status.HTTP_201_CREATED)
-def create_post(req: PostCreateRequest, db: Session = Depends(get_db)):
+@app.post("/posts", status_code=status.HTTP_201_CREATED, response_model=CreatedPostResponse)
+async def create_post(req: PostCreateRequest):
+    result = await write_queue.run_async(_create_post, req)
+    metrics.posts.inc()
+    event_log.emit("post", user_id=req.user_id, user=result["user"]["name"], song_id=req.song_id,
+                   post_id=result["id"])
+    return result
+
+def _create_post(db: Session, req: PostCreateRequest):
     # ユーザー・曲の存在チェック
     user = crud.get_user_by_id(db, req.user_id)
     if not user:
@@ -307,7 +861,6 @@ def create_post(req: PostCreateRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Song not found")
 
     post = crud.create_post(db, req.user_id, req.song_id, req.comment)
-    logger.info(f"📝 New Post: user={user.name}, song_id={song.id}")
 
     return {
         "id": post.id,
@@ -326,103 +879,116 @@ def create_post(req: PostCreateRequest, db: Session = Depends(get_db)):
     }
 
 
-@app.get("/posts")
-def list_posts(limit: int = 50, db: Session = Depends(get_db)):
+def encode_post_cursor(post) -> str:
+    return f"{post.created_at.isoformat()}_{post.id}"
+
+def decode_post_cursor(cursor: str):
+    try:
+        created_at, post_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/posts", response_model=list[PostResponse])
+async def list_posts(
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_POSTS_PER_PAGE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     最新の投稿を取得（Homeページ用）
+    cursor: 前のページのレスポンスヘッダー X-Next-Cursor の値。次のページを返す
+    コメントは最新 COMMENT_PREVIEW_LIMIT 件と総数のみ (全件は /posts/{id}/comments)
+    """
+    before = decode_post_cursor(cursor) if cursor else None
+    posts = await crud_async.get_recent_post_rows(db, limit=limit, before=before)
+    return await posts_page(db, posts, limit, response)
+
+
+@app.get("/timeline/{user_id}", response_model=list[PostResponse])
+async def list_timeline(
+    user_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_POSTS_PER_PAGE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    posts = crud.get_recent_posts(db, limit=limit)
+    フォロー中のユーザーと自分の投稿を取得（Homeページの「フォロー中」用）
+    レスポンスとカーソルは /posts と同じ形
+    """
+    before = decode_post_cursor(cursor) if cursor else None
+    posts = await crud_async.get_timeline_post_rows(db, user_id, limit=limit, before=before)
+    return await posts_page(db, posts, limit, response)
 
-    results = []
-    for p in posts:
-        user = p.user
-        song = p.song
-
-        # ユーザーのMusic Type情報
-        music_type_data = None
-        if user and user.music_type:
-            music_type_data = {
-                "code": user.music_type.code,
-                "name": user.music_type.name,
-                "description": user.music_type.description,
-            }
-
-        # コメント一覧
-        comments_payload = []
-        for c in p.comments:
-            comment_user = c.user
-            comment_music_type = None
-            if comment_user and comment_user.music_type:
-                comment_music_type = {
-                    "code": comment_user.music_type.code,
-                    "name": comment_user.music_type.name,
-                    "description": comment_user.music_type.description,
-                }
-            comments_payload.append({
-                "id": c.id,
-                "content": c.content,
-                "created_at": c.created_at.isoformat(),
-                "user": {
-                    "id": comment_user.id,
-                    "name": comment_user.name,
-                    "music_type": comment_music_type,
-                } if comment_user else None,
-            })
 
-        results.append({
+def user_summary(user_id: str | None, name: str | None, music_type_code: str | None):
+    """投稿者・コメントした人 ({id, name, music_type})。ユーザーがいなければ None"""
+    if user_id is None:
+        return None
+    return {"id": user_id, "name": name, "music_type": type_registry.get(music_type_code)}
+
+def comment_payload(row):
+    """crud の _comment_rows_select の行をレスポンスの形にする"""
+    return {
+        "id": row.id,
+        "content": row.content,
+        "created_at": row.created_at.isoformat(),
+        "user": user_summary(row.user_id, row.user_name, row.music_type_code),
+    }
+
+async def posts_page(db: AsyncSession, posts, limit: int, response: Response):
+    """
+    投稿一覧のレスポンスを作る (コメントは最新数件と総数、続きがあれば X-Next-Cursor)
+    posts は crud の _post_rows_select の行 (ORMオブジェクトを作らずに、列の値をそのまま詰める)
+    """
+    post_ids = [p.id for p in posts]
+    comment_previews = await crud_async.get_comment_preview_rows(db, post_ids, COMMENT_PREVIEW_LIMIT)
+    comment_counts = await crud_async.count_comments(db, post_ids)
+
+    # 続きがありそうなら次のページのカーソルを返す
+    if len(posts) == limit:
+        response.headers["X-Next-Cursor"] = encode_post_cursor(posts[-1])
+
+    return [
+        {
             "id": p.id,
             "comment": p.comment,
             "created_at": p.created_at.isoformat(),
-            "user": {
-                "id": user.id,
-                "name": user.name,
-                "music_type": music_type_data,
-            } if user else None,
+            "user": user_summary(p.user_id, p.user_name, p.music_type_code),
             "song": {
-                "id": song.id,
-                "title": song.title,
-                "artist": song.artist,
-                "url": song.url,
-            } if song else None,
-            "comments": comments_payload,
-        })
-
-    return results
+                "id": p.song_id,
+                "title": p.title,
+                "artist": p.artist,
+                "url": p.url,
+            } if p.song_id is not None else None,
+            "comment_count": comment_counts.get(p.id, 0),
+            "comments": [comment_payload(c) for c in comment_previews.get(p.id, [])],
+        }
+        for p in posts
+    ]
 
 
-@app.get("/posts/{post_id}/comments")
-def list_comments(post_id: int, db: Session = Depends(get_db)):
-    post = crud.get_post_by_id(db, post_id)
-    if not post:
+@app.get("/posts/{post_id}/comments", response_model=list[CommentResponse])
+async def list_comments(post_id: int, db: AsyncSession = Depends(get_async_db)):
+    # 存在の確認だけなので、投稿のコメント一覧までは読み込まない
+    if not await crud_async.post_exists(db, post_id):
         raise HTTPException(status_code=404, detail="Post not found")
 
-    comments = crud.get_comments_by_post(db, post_id)
-
-    payload = []
-    for c in comments:
-        comment_user = c.user
-        comment_music_type = None
-        if comment_user and comment_user.music_type:
-            comment_music_type = {
-                "code": comment_user.music_type.code,
-                "name": comment_user.music_type.name,
-                "description": comment_user.music_type.description,
-            }
-        payload.append({
-            "id": c.id,
-            "content": c.content,
-            "created_at": c.created_at.isoformat(),
-            "user": {
-                "id": comment_user.id,
-                "name": comment_user.name,
-                "music_type": comment_music_type,
-            } if comment_user else None,
-        })
-    return payload
+    return [comment_payload(c) for c in await crud_async.get_comment_rows_by_post(db, post_id)]
 
 
-@app.post("/users/{target_id}/follow", status_code=status.HTTP_201_CREATED)
-def follow_user(target_id: str, req: FollowRequest, db: Session = Depends(get_db)):
+@app.post("/users/{target_id}/follow", status_code=status.HTTP_201_CREATED, response_model=FollowResponse)
+async def follow_user(target_id: str, req: FollowRequest):
+    result = await write_queue.run_async(_follow_user, target_id, req)
+    # 配列を作り直すことがある (辺の数に比例する) ので、イベントループでは行わない
+    await run_in_threadpool(follow_graph.add_edge, req.user_id, target_id)
+    metrics.follows.inc()
+    return result
+
+def _follow_user(db: Session, target_id: str, req: FollowRequest):
     if target_id == req.user_id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     follower = crud.get_user_by_id(db, req.user_id)
@@ -434,8 +1000,13 @@ def follow_user(target_id: str, req: FollowRequest, db: Session = Depends(get_db
     return {"status": "ok", "follower_count": follower_count}
 
 
-@app.delete("/users/{target_id}/follow", status_code=status.HTTP_200_OK)
-def unfollow_user(target_id: str, req: FollowRequest, db: Session = Depends(get_db)):
+@app.delete("/users/{target_id}/follow", status_code=status.HTTP_200_OK, response_model=FollowResponse)
+async def unfollow_user(target_id: str, req: FollowRequest):
+    result = await write_queue.run_async(_unfollow_user, target_id, req)
+    await run_in_threadpool(follow_graph.remove_edge, req.user_id, target_id)
+    return result
+
+def _unfollow_user(db: Session, target_id: str, req: FollowRequest):
     follower = crud.get_user_by_id(db, req.user_id)
     target = crud.get_user_by_id(db, target_id)
     if not follower or not target:
@@ -443,10 +1014,17 @@ def unfollow_user(target_id: str, req: FollowRequest, db: Session = Depends(get_
     crud.delete_follow(db, req.user_id, target_id)
     follower_count = crud.count_followers(db, target_id)
     return {"status": "ok", "follower_count": follower_count}
-@app.post("/posts/{post_id}/comments", status_code=status.HTTP_201_CREATED)
-def create_comment(post_id: int, req: CommentCreateRequest, db: Session = Depends(get_db)):
-    post = crud.get_post_by_id(db, post_id)
-    if not post:
+
+
+@app.post("/posts/{post_id}/comments", status_code=status.HTTP_201_CREATED, response_model=CommentResponse)
+async def create_comment(post_id: int, req: CommentCreateRequest):
+    result = await write_queue.run_async(_create_comment, post_id, req)
+    metrics.comments.inc()
+    return result
+
+def _create_comment(db: Session, post_id: int, req: CommentCreateRequest):
+    # 存在の確認だけなので、投稿のコメント一覧までは読み込まない
+    if not crud.post_exists(db, post_id):
         raise HTTPException(status_code=404, detail="Post not found")
 
     user = crud.get_user_by_id(db, req.user_id)
@@ -455,13 +1033,7 @@ def create_comment(post_id: int, req: CommentCreateRequest, db: Session = Depend
 
     comment = crud.create_comment(db, post_id, req.user_id, req.content)
 
-    music_type_data = None
-    if user.music_type:
-        music_type_data = {
-            "code": user.music_type.code,
-            "name": user.music_type.name,
-            "description": user.music_type.description,
-        }
+    music_type_data = type_registry.get(user.music_type_code)
 
     return {
         "id": comment.id,
@@ -474,6 +1046,17 @@ def create_comment(post_id: int, req: CommentCreateRequest, db: Session = Depend
         }
     }
 
+if DEBUG_ROUTES:
+    @app.get("/debug/sql-stats", response_model=dict[str, dict[str, int | float]])
+    def read_sql_stats():
+        """APIごとのSQLの実行数・DBの時間の集計 (起動してから)"""
+        return route_sql_stats()
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus 用のメトリクス (テキスト形式)"""
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ルートURL ("/") にアクセスが来たら、distフォルダの中身(index.html)を返す
 if os.path.exists(DIST_DIR):
     app.mount("/", StaticFiles(directory=DIST_DIR, html=True), name="dist")
@@ -0,0 +1,192 @@
+import threading
+from bisect import bisect_left
+
+# --- メトリクス (Prometheus のテキスト形式で GET /metrics から返す) ---
+# 値はスレッドごとの辞書に足していき、読むとき (/metrics) に全スレッド分を合計する
+# 書き込みはロックを取らないので、いいねなどのよく呼ばれる処理に足しても数マイクロ秒で済む
+# (ロックを取るのは、スレッドが初めて書き込むときと /metrics を読むときだけ)
+
+# 待ち時間のヒストグラムの区切り (秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _PerThread:
+    """スレッドごとの {ラベル: 値} (書き込むのはそのスレッドだけ)"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def mine(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def shards(self) -> list:
+        with self._lock:
+            shards = list(self._shards)
+        # dict のコピーは GIL の下で一度に行われるので、書き込み中のスレッドがあっても壊れない
+        return [dict(shard) for shard in shards]
+
+
+class Counter:
+    """増えるだけの値 (ラベルごと)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = _PerThread()
+
+    def inc(self, *label_values, amount: float = 1):
+        values = self._values.mine()
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def collect(self):
+        merged = {}
+        for shard in self._values.shards():
+            for key, value in shard.items():
+                merged[key] = merged.get(key, 0) + value
+        return [(self.name, key, value) for key, value in sorted(merged.items())]
+
+
+class Gauge(Counter):
+    """増減する値 (処理中のリクエスト数など)。inc / dec は別のスレッドから呼んでもよい"""
+
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class CallbackMetric:
+    """読むときに関数を呼んで値を作る (キューの長さなど)。fn は [(ラベルの値のタプル, 値)] を返す"""
+
+    def __init__(self, name: str, help: str, labels: tuple, fn, kind: str = "gauge"):
+        self.name, self.help, self.labels, self.fn, self.kind = name, help, labels, fn, kind
+
+    def collect(self):
+        return [(self.name, key, value) for key, value in self.fn()]
+
+
+class Histogram:
+    """値の分布 (区切りごとの件数・合計・件数)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._values = _PerThread()
+
+    def observe(self, value: float, *label_values):
+        values = self._values.mine()
+        slots = values.get(label_values)
+        if slots is None:
+            # [区切りごとの件数..., +Inf の件数, 合計]
+            slots = values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def collect(self):
+        merged = {}
+        for shard in self._values.shards():
+            for key, slots in shard.items():
+                total = merged.setdefault(key, [0] * len(slots))
+                for i, v in enumerate(list(slots)):
+                    total[i] += v
+
+        samples = []
+        for key, slots in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), slots):
+                cumulative += count
+                samples.append((self.name + "_bucket", key + (_format_bound(bound),), cumulative))
+            samples.append((self.name + "_sum", key, slots[-1]))
+            samples.append((self.name + "_count", key, cumulative))
+        return samples
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def callback_gauge(self, name, help, labels, fn):
+        return self.register(CallbackMetric(name, help, labels, fn))
+
+    def callback_counter(self, name, help, labels, fn):
+        return self.register(CallbackMetric(name, help, labels, fn, kind="counter"))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式 (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            names = metric.labels + (("le",) if metric.kind == "histogram" else ())
+            for sample_name, key, value in metric.collect():
+                if key:
+                    labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, key))
+                    lines.append(f"{sample_name}{{{labels}}} {value}")
+                else:
+                    lines.append(f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+http_requests = registry.counter(
+    "tomotune_http_requests_total", "APIごとのリクエスト数", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "tomotune_http_request_duration_seconds", "APIごとの処理時間 (秒)", ("method", "route"))
+http_in_flight = registry.gauge(
+    "tomotune_http_requests_in_flight", "処理中のリクエスト数")
+
+# --- DB ---
+db_pool_wait = registry.histogram(
+    "tomotune_db_pool_wait_seconds", "接続プールから接続を借りるまでの時間 (秒)。件数が借りた回数", ("pool",))
+db_lock_errors = registry.counter(
+    "tomotune_db_lock_errors_total", "busy_timeout を待っても SQLite のロックが取れなかった回数", ("pool",))
+write_lock_wait = registry.histogram(
+    "tomotune_write_lock_wait_seconds", "書き込みスレッドが BEGIN IMMEDIATE で書き込みロックを待った時間 (秒)")
+write_batch_size = registry.histogram(
+    "tomotune_write_batch_jobs", "1回のコミットにまとめた書き込みの数", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+# --- アプリ ---
+likes = registry.counter("tomotune_likes_total", "保存したいいね (タップ) の数")
+like_milestones = registry.counter("tomotune_like_milestones_total", "同じ曲に5回目のいいねをした (お気に入りになった) 回数")
+unlikes = registry.counter("tomotune_unlikes_total", "いいねの取り消しの回数")
+diagnoses = registry.counter("tomotune_diagnoses_total", "診断結果を保存した回数")
+posts = registry.counter("tomotune_posts_total", "投稿の数")
+comments = registry.counter("tomotune_comments_total", "コメントの数")
+follows = registry.counter("tomotune_follows_total", "フォローした回数")
+
+# --- ログ ---
+log_events_dropped = registry.counter(
+    "tomotune_log_events_dropped_total", "書き出しが追いつかず捨てたイベントログの数", ("event",))
@@ -0,0 +1,281 @@
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import TIMELINE_FANOUT_MAX_FOLLOWERS
+
+logger = logging.getLogger("uvicorn")
+
+# --- スキーマのマイグレーション ---
+# 既存の tomoTune.db を今のモデルに合わせるための処理
+# 適用済みのバージョンを schema_migrations テーブルに記録し、未適用のものだけを順番に実行する
+# 起動時 (main.py) と init_db.py の両方から呼ばれる
+#
+# 新しく追加するときは MIGRATIONS の末尾に (次の番号, 名前, 関数) を足す
+# 途中で失敗したときに再実行できるよう、各処理は何度実行しても同じ結果になるように書く
+# 各バージョンのDDLはそのときのテーブルの形で書いておく (models.py を後から変えても、
+# 空のDBに最初から適用したときの結果が変わらないように。models.py から作らない)
+
+
+def _create_missing_tables(conn, tables):
+    """tables: [(テーブル名, [CREATE TABLE, CREATE INDEX ...])]。DBに無いテーブルだけインデックスごと作る"""
+    existing = set(inspect(conn).get_table_names())
+    for name, statements in tables:
+        if name in existing:
+            continue
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+# バージョン1の時点のテーブル (それより前からあるテーブルと like_counts)
+_V1_TABLES = [
+    ("music_types", [
+        "CREATE TABLE music_types ("
+        "code VARCHAR NOT NULL, name VARCHAR, description VARCHAR, "
+        "PRIMARY KEY (code))",
+        "CREATE INDEX ix_music_types_code ON music_types (code)",
+    ]),
+    ("songs", [
+        "CREATE TABLE songs ("
+        "id INTEGER NOT NULL, title VARCHAR, artist VARCHAR, url VARCHAR, "
+        "acousticness FLOAT, danceability FLOAT, energy FLOAT, instrumentalness FLOAT, "
+        "liveness FLOAT, loudness FLOAT, speechiness FLOAT, valence FLOAT, "
+        "tempo FLOAT, \"key\" INTEGER, mode INTEGER, time_signature INTEGER, "
+        "PRIMARY KEY (id))",
+        "CREATE INDEX ix_songs_id ON songs (id)",
+        "CREATE INDEX ix_songs_title ON songs (title)",
+    ]),
+    ("users", [
+        "CREATE TABLE users ("
+        "id VARCHAR NOT NULL, name VARCHAR, "
+        "score_vc FLOAT, score_ma FLOAT, score_pr FLOAT, score_hs FLOAT, music_type_code VARCHAR, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(music_type_code) REFERENCES music_types (code))",
+        "CREATE INDEX ix_users_id ON users (id)",
+        "CREATE UNIQUE INDEX ix_users_name ON users (name)",
+    ]),
+    ("follows", [
+        "CREATE TABLE follows ("
+        "id INTEGER NOT NULL, follower_id VARCHAR NOT NULL, followed_id VARCHAR NOT NULL, created_at DATETIME, "
+        "PRIMARY KEY (id), "
+        "CONSTRAINT uq_follower_followed UNIQUE (follower_id, followed_id), "
+        "FOREIGN KEY(follower_id) REFERENCES users (id), "
+        "FOREIGN KEY(followed_id) REFERENCES users (id))",
+        "CREATE INDEX ix_follows_followed_follower ON follows (followed_id, follower_id)",
+        "CREATE INDEX ix_follows_id ON follows (id)",
+    ]),
+    ("like_counts", [
+        "CREATE TABLE like_counts ("
+        "user_id VARCHAR NOT NULL, song_id INTEGER NOT NULL, count INTEGER NOT NULL, last_liked_at DATETIME, "
+        "PRIMARY KEY (user_id, song_id), "
+        "FOREIGN KEY(user_id) REFERENCES users (id), "
+        "FOREIGN KEY(song_id) REFERENCES songs (id))",
+    ]),
+    ("like_logs", [
+        "CREATE TABLE like_logs ("
+        "id INTEGER NOT NULL, user_id VARCHAR, song_id INTEGER, timestamp DATETIME, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(user_id) REFERENCES users (id), "
+        "FOREIGN KEY(song_id) REFERENCES songs (id))",
+        "CREATE INDEX ix_like_logs_id ON like_logs (id)",
+        "CREATE INDEX ix_like_logs_user_song_ts ON like_logs (user_id, song_id, timestamp)",
+    ]),
+    ("posts", [
+        "CREATE TABLE posts ("
+        "id INTEGER NOT NULL, user_id VARCHAR NOT NULL, song_id INTEGER NOT NULL, "
+        "comment VARCHAR NOT NULL, created_at DATETIME, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(user_id) REFERENCES users (id), "
+        "FOREIGN KEY(song_id) REFERENCES songs (id))",
+        "CREATE INDEX ix_posts_created ON posts (created_at)",
+        "CREATE INDEX ix_posts_id ON posts (id)",
+    ]),
+    ("comments", [
+        "CREATE TABLE comments ("
+        "id INTEGER NOT NULL, post_id INTEGER NOT NULL, user_id VARCHAR NOT NULL, "
+        "content VARCHAR NOT NULL, created_at DATETIME, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(post_id) REFERENCES posts (id), "
+        "FOREIGN KEY(user_id) REFERENCES users (id))",
+        "CREATE INDEX ix_comments_id ON comments (id)",
+        "CREATE INDEX ix_comments_post_created ON comments (post_id, created_at)",
+    ]),
+]
+
+
+def _create_tables(conn):
+    """DBに無いテーブルを作る (like_counts など)"""
+    _create_missing_tables(conn, _V1_TABLES)
+
+
+# バージョン2で songs に加えた特徴量の列と型
+_SONG_FEATURE_TYPES = {
+    "acousticness": "FLOAT", "danceability": "FLOAT", "energy": "FLOAT", "instrumentalness": "FLOAT",
+    "liveness": "FLOAT", "loudness": "FLOAT", "speechiness": "FLOAT", "valence": "FLOAT",
+    "tempo": "FLOAT", "key": "INTEGER", "mode": "INTEGER", "time_signature": "INTEGER",
+}
+
+
+def _song_feature_columns(conn):
+    """
+    songs.parameters (JSON文字列) から型付きの特徴量列へ移行する
+    列が無ければ追加し、parameters の値で埋める
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("songs")}
+
+    for name, col_type in _SONG_FEATURE_TYPES.items():
+        if name not in columns:
+            conn.execute(text(f'ALTER TABLE songs ADD COLUMN "{name}" {col_type}'))
+
+    if "parameters" not in columns:
+        return
+
+    rows = conn.execute(
+        text("SELECT id, parameters FROM songs WHERE parameters IS NOT NULL AND valence IS NULL")
+    ).all()
+    for song_id, parameters in rows:
+        params = json.loads(parameters)
+        values = {name: params[name] for name in _SONG_FEATURE_TYPES if name in params}
+        if not values:
+            continue
+        assignments = ", ".join(f'"{name}" = :{name}' for name in values)
+        conn.execute(text(f"UPDATE songs SET {assignments} WHERE id = :id"), {**values, "id": song_id})
+
+
+def _fill_like_counts(conn):
+    """集計テーブル導入前のいいねを like_counts に反映する"""
+    if conn.execute(text("SELECT 1 FROM like_counts LIMIT 1")).first():
+        return
+    conn.execute(text(
+        "INSERT INTO like_counts (user_id, song_id, count, last_liked_at) "
+        "SELECT user_id, song_id, COUNT(id), MAX(timestamp) FROM like_logs GROUP BY user_id, song_id"
+    ))
+
+
+def _composite_indexes(conn):
+    """よく使う検索条件に合わせた複合インデックス (名前は models.py と同じ)"""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_like_logs_user_song_ts ON like_logs (user_id, song_id, timestamp)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_follows_followed_follower ON follows (followed_id, follower_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_comments_post_created ON comments (post_id, created_at)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_posts_created ON posts (created_at)"
+    ))
+
+
+def _unique_user_name(conn):
+    """users.name を一意にする (同名ユーザーが既にいる場合は通常のインデックスのまま)"""
+    duplicated = conn.execute(text(
+        "SELECT name FROM users GROUP BY name HAVING COUNT(*) > 1 LIMIT 1"
+    )).first()
+    if duplicated:
+        logger.warning(f"users.name に重複があるため一意インデックスを作成しません: {duplicated[0]}")
+        return
+    conn.execute(text("DROP INDEX IF EXISTS ix_users_name"))
+    conn.execute(text("CREATE UNIQUE INDEX ix_users_name ON users (name)"))
+
+
+def _follow_counters(conn):
+    """users にフォロワー数・フォロー数の列を追加し、follows から数えて埋める"""
+    columns = {c["name"] for c in inspect(conn).get_columns("users")}
+    for name in ("follower_count", "following_count"):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(
+        "UPDATE users SET "
+        "follower_count = (SELECT COUNT(id) FROM follows WHERE follows.followed_id = users.id), "
+        "following_count = (SELECT COUNT(id) FROM follows WHERE follows.follower_id = users.id)"
+    ))
+
+
+def _timelines(conn):
+    """timeline_entries を作り、今あるフォロー関係から埋める"""
+    _create_missing_tables(conn, [
+        ("timeline_entries", [
+            "CREATE TABLE timeline_entries ("
+            "user_id VARCHAR NOT NULL, post_id INTEGER NOT NULL, created_at DATETIME NOT NULL, "
+            "PRIMARY KEY (user_id, post_id), "
+            "FOREIGN KEY(user_id) REFERENCES users (id), "
+            "FOREIGN KEY(post_id) REFERENCES posts (id))",
+            "CREATE INDEX ix_timeline_user_created ON timeline_entries (user_id, created_at, post_id)",
+        ]),
+    ])
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_posts_user_created ON posts (user_id, created_at)"
+    ))
+    # 読むときに集めるユーザー (フォロワーが多い) の投稿は入れない
+    conn.execute(
+        text(
+            "INSERT OR IGNORE INTO timeline_entries (user_id, post_id, created_at) "
+            "SELECT follows.follower_id, posts.id, posts.created_at FROM follows "
+            "JOIN users ON users.id = follows.followed_id "
+            "JOIN posts ON posts.user_id = follows.followed_id "
+            "WHERE users.follower_count <= :max_followers"
+        ),
+        {"max_followers": TIMELINE_FANOUT_MAX_FOLLOWERS},
+    )
+
+
+def _like_logs_timestamp_index(conn):
+    """直近のいいねを読むためのインデックス (名前は models.py と同じ)"""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_like_logs_timestamp ON like_logs (timestamp)"
+    ))
+
+
+def _like_rollups(conn):
+    """like_rollups (古いいいねログの日ごとの集計) を作る"""
+    _create_missing_tables(conn, [
+        ("like_rollups", [
+            "CREATE TABLE like_rollups ("
+            "user_id VARCHAR NOT NULL, song_id INTEGER NOT NULL, day DATE NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (user_id, song_id, day), "
+            "FOREIGN KEY(user_id) REFERENCES users (id), "
+            "FOREIGN KEY(song_id) REFERENCES songs (id))",
+        ]),
+    ])
+
+
+MIGRATIONS = [
+    (1, "create_tables", _create_tables),
+    (2, "song_feature_columns", _song_feature_columns),
+    (3, "fill_like_counts", _fill_like_counts),
+    (4, "composite_indexes", _composite_indexes),
+    (5, "unique_user_name", _unique_user_name),
+    (6, "follow_counters", _follow_counters),
+    (7, "timelines", _timelines),
+    (8, "like_logs_timestamp_index", _like_logs_timestamp_index),
+    (9, "like_rollups", _like_rollups),
+]
+
+
+def _applied_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade_schema(engine):
+    """未適用のマイグレーションを順番に適用する (1つずつ別トランザクション)"""
+    with engine.begin() as conn:
+        applied = _applied_versions(conn)
+
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.now()},
+            )
+        logger.info(f"migration applied: {version} {name}")
@@ -1,14 +1,25 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Float, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import os
 from database import Base
 
+# Song の特徴量の列名 (data.py の辞書キー・songs.csv のヘッダーと同じ)
+SONG_FEATURE_COLUMNS = [
+    "acousticness", "danceability", "energy", "instrumentalness",
+    "liveness", "loudness", "speechiness", "valence",
+    "tempo", "key", "mode", "time_signature",
+]
+
+# フォロワーがこれより多いユーザーの投稿はタイムラインに書き込まず、読むときに集める (TimelineEntry)
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get("TIMELINE_FANOUT_MAX_FOLLOWERS", "1000"))
+
 # ユーザーテーブル
 class User(Base):
     __tablename__ = "users"
 
     id = Column(String, primary_key=True, index=True)   # UUIDを使うのでString型
-    name = Column(String, index=True)
+    name = Column(String, index=True, unique=True)  # ログインは名前で行うので重複させない
 
     # MBTI スコア (0.0 〜 1.0)
     # 初期値は 0.5
@@ -31,6 +42,11 @@ class User(Base):
 
     music_type = relationship("MusicType")
 
+    # フォロワー数・フォロー数 (プロフィール表示のたびに follows を数えないよう、フォロー時に一緒に更新する)
+    # ズレたときは reconcile_follow_counts.py で直す
+    follower_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # リレーション: ユーザーはたくさんの「いいねログ」と「投稿」を持つ
     like_logs = relationship("LikeLog", back_populates="user")
     posts = relationship("Post", back_populates="user")
@@ -66,8 +82,19 @@ class Song(Base):
     artist = Column(String)
     url = Column(String) # mp3ファイルのパス
 
-    # パラメータを保存する列 (JSON文字列として入れる)
-    parameters = Column(String, nullable=True)
+    # 曲の特徴量 (songs.csv の値をそのまま型付きで保存)
+    acousticness = Column(Float, nullable=True)
+    danceability = Column(Float, nullable=True)
+    energy = Column(Float, nullable=True)
+    instrumentalness = Column(Float, nullable=True)
+    liveness = Column(Float, nullable=True)
+    loudness = Column(Float, nullable=True)
+    speechiness = Column(Float, nullable=True)
+    valence = Column(Float, nullable=True)
+    tempo = Column(Float, nullable=True)
+    key = Column(Integer, nullable=True)
+    mode = Column(Integer, nullable=True)
+    time_signature = Column(Integer, nullable=True)
 
     # リレーション: 曲もたくさんの「いいねログ」を持つ
     like_logs = relationship("LikeLog", back_populates="song")
@@ -93,6 +120,35 @@ class LikeLog(Base):
     user = relationship("User", back_populates="like_logs")
     song = relationship("Song", back_populates="like_logs")
 
+    __table_args__ = (
+        # 「このユーザーがこの曲に押したいいね (新しい順)」を引くため
+        Index("ix_like_logs_user_song_ts", "user_id", "song_id", "timestamp"),
+        # 直近のいいねだけを読むため (急上昇の集計を起動時に作るとき)
+        Index("ix_like_logs_timestamp", "timestamp"),
+    )
+
+
+# いいねの日ごとの集計 (古い like_logs をまとめたもの)
+# 一定期間より古いいいねログは1日分を1行にして like_logs から削除する (like_compaction.py)
+class LikeRollup(Base):
+    __tablename__ = "like_rollups"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    song_id = Column(Integer, ForeignKey("songs.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# いいね数の集計テーブル (ユーザー×曲ごとの累計)
+# like_logs を毎回 COUNT しないよう、いいね/取り消しと同じトランザクションで更新する
+class LikeCount(Base):
+    __tablename__ = "like_counts"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    song_id = Column(Integer, ForeignKey("songs.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    last_liked_at = Column(DateTime, nullable=True)
+
 
 # 投稿テーブル
 class Post(Base):
@@ -117,6 +173,29 @@ class Post(Base):
     song = relationship("Song", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all,delete")
 
+    __table_args__ = (
+        # 新しい順の一覧・カーソルでのページング用
+        Index("ix_posts_created", "created_at"),
+        # ユーザーごとの新しい順 (タイムラインを読むときに集める投稿) 用
+        Index("ix_posts_user_created", "user_id", "created_at"),
+    )
+
+
+# ホームのタイムライン (フォロー中のユーザーの投稿を、読む側のユーザーごとに並べたもの)
+# 投稿したときにフォロワー全員分を書き込んでおく (fan-out-on-write)
+# フォロワーが多いユーザーの投稿は書き込まず、読むときに posts から集める (crud.get_timeline_post_rows)
+class TimelineEntry(Base):
+    __tablename__ = "timeline_entries"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)   # 読む側
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True)
+    # 投稿の作成日時 (並べ替え・カーソル用に posts からコピー)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_timeline_user_created", "user_id", "created_at", "post_id"),
+    )
+
 
 # 投稿へのコメント
 class Comment(Base):
@@ -132,6 +211,11 @@ class Comment(Base):
     post = relationship("Post", back_populates="comments")
     user = relationship("User", back_populates="comments")
 
+    __table_args__ = (
+        # 投稿ごとのコメント一覧 (時系列) 用
+        Index("ix_comments_post_created", "post_id", "created_at"),
+    )
+
 
 # フォロー関係テーブル
 class Follow(Base):
@@ -146,5 +230,8 @@ class Follow(Base):
     followed = relationship("User", foreign_keys=[followed_id], back_populates="followers")
 
     __table_args__ = (
+        # follower_id から引くとき (フォロー中の一覧・数) はこの制約のインデックスを使う
         UniqueConstraint("follower_id", "followed_id", name="uq_follower_followed"),
+        # followed_id から引くとき (フォロワーの一覧・数) 用
+        Index("ix_follows_followed_follower", "followed_id", "follower_id"),
     )
\ No newline at end of file
@@ -0,0 +1,23 @@
+from database import engine, SessionLocal
+from migrations import upgrade_schema
+import crud
+
+# like_logs から like_counts (ユーザー×曲ごとのいいね数) を作り直すスクリプト
+# 集計テーブル導入前のDBや、ズレが疑われるときに実行する
+# python rebuild_like_counts.py
+def main():
+    # 集計テーブルが無ければ作る
+    upgrade_schema(engine)
+
+    db = SessionLocal()
+    try:
+        rows = crud.rebuild_like_counts(db)
+        print(f"いいね数の集計を作り直しました ({rows}件)")
+    except Exception as e:
+        print(f"エラーが発生: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
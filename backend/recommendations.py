@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import catalog
+
+# --- おすすめ曲 ---
+# ユーザーの4軸スコアと曲の4軸ベクトルの距離が近い曲を、お気に入りを除いて選ぶ
+# 近い順に並べるだけだと似た曲ばかりになるので、選んだ曲と似すぎない曲を優先する (MMR)
+
+# 距離で絞り込んだあと、似すぎないように並べ直す候補の数
+CANDIDATE_POOL = 200
+# 並べ直すときの「選んだ曲と似ていないこと」の重み (0: 距離だけ)
+DIVERSITY_WEIGHT = 0.3
+# 4軸とも 0〜1 なので、距離の最大値は 2
+MAX_DISTANCE = 2.0
+# キャッシュするユーザー数 (古いものから捨てる)
+CACHE_SIZE = int(os.environ.get("RECOMMEND_CACHE_SIZE", "10000"))
+
+
+def rank(matrix: catalog.SongMatrix, scores, exclude_song_ids, limit: int):
+    """
+    曲行列を1回で採点し、おすすめ順の [(song_id, 距離)] を返す
+    exclude_song_ids: 除く曲 (お気に入り)
+    """
+    if len(matrix.song_ids) == 0:
+        return []
+    me = np.asarray(scores, dtype=np.float32)
+    # |v - u|^2 = |v|^2 - 2 v・u + |u|^2 (|v|^2 は曲行列を作るときに計算済み)
+    squared = matrix.squared_norms - 2 * (matrix.vectors @ me) + me @ me
+
+    # お気に入りを除いても CANDIDATE_POOL 曲以上残るように多めに取ってから除く
+    exclude = np.fromiter(exclude_song_ids, dtype=np.int64) if exclude_song_ids else None
+    pool = min(CANDIDATE_POOL + (len(exclude) if exclude is not None else 0), len(squared))
+    candidates = np.argpartition(squared, pool - 1)[:pool]
+    if exclude is not None:
+        candidates = candidates[~np.isin(matrix.song_ids[candidates], exclude)]
+    distances = np.sqrt(np.maximum(squared[candidates], 0))
+    chosen = diversify(matrix.vectors[candidates], distances, limit)
+    rows = candidates[chosen]
+    return list(zip(matrix.song_ids[rows].tolist(), distances[chosen].tolist()))
+
+
+def diversify(vectors: np.ndarray, distances: np.ndarray, limit: int, weight: float = DIVERSITY_WEIGHT):
+    """
+    近さ (1 - 距離/2) と、選んだ曲との似ていなさを合わせた点数が高い順に選ぶ
+    戻り値: 選んだ行番号のリスト (選んだ順)
+    """
+    closeness = 1 - distances / MAX_DISTANCE
+    # 各候補と、選んだ曲の中で一番似ている曲との近さ
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    chosen = []
+    for _ in range(min(limit, len(vectors))):
+        points = np.where(available, (1 - weight) * closeness - weight * redundancy, -np.inf)
+        best = int(np.argmax(points))
+        chosen.append(best)
+        available[best] = False
+        similarity = 1 - np.sqrt(((vectors - vectors[best]) ** 2).sum(axis=1)) / MAX_DISTANCE
+        np.maximum(redundancy, similarity, out=redundancy)
+    return chosen
+
+
+class RecommendationCache:
+    """
+    ユーザーごとのおすすめ順のキャッシュ
+
+    スコア・お気に入り・曲行列のどれかが変わっていれば作り直す。
+    スコアが変わる処理 (いいね・診断) のあとは invalidate(user_id) で先に捨てておく
+    """
+
+    def __init__(self, max_users: int = CACHE_SIZE):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (キー, おすすめ順)
+
+    def get(self, user_id: str, scores, favorite_song_ids, limit: int):
+        matrix = catalog.song_matrix()
+        key = (tuple(scores), frozenset(favorite_song_ids), matrix.version, limit)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        ranked = rank(matrix, scores, favorite_song_ids, limit)
+        with self._lock:
+            self._entries[user_id] = (key, ranked)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return ranked
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,23 @@
+from database import engine, SessionLocal
+from migrations import upgrade_schema
+import crud
+
+# users のフォロワー数・フォロー数を follows から数え直すスクリプト
+# 手作業でDBを書き換えたときなど、ズレが疑われるときに実行する (何度実行してもよい)
+# python reconcile_follow_counts.py
+def main():
+    # カウンターの列が無ければ作る
+    upgrade_schema(engine)
+
+    db = SessionLocal()
+    try:
+        fixed = crud.reconcile_follow_counts(db)
+        print(f"フォロワー数・フォロー数を数え直しました (修正したユーザー: {fixed}人)")
+    except Exception as e:
+        print(f"エラーが発生: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
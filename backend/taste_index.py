@@ -0,0 +1,206 @@
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import select
+
+from models import User
+import typeCal
+
+logger = logging.getLogger("uvicorn")
+
+# --- 好みの近いユーザーの検索用インデックス ---
+# 全ユーザーの4軸スコア (VC, MA, PR, HS) を float32 の配列で持ち、
+# 16タイプ (= 各軸が THRESHOLD 以上か未満か) ごとに分けておく
+# タイプ診断前 (music_type_code が無い) のユーザーは入れない
+
+AXES = 4
+# バケットの番号: 各軸が THRESHOLD 以上なら 1 のビット (VC が最上位)
+AXIS_BITS = np.array([8, 4, 2, 1], dtype=np.int64)
+BUCKET_COUNT = 16
+INITIAL_CAPACITY = 64
+
+
+class _Bucket:
+    """1タイプ分のスコア行列 (行の順番に意味はなく、削除は末尾の行で埋める)"""
+
+    def __init__(self, vectors=None, members=None):
+        if vectors is None:
+            vectors = np.zeros((0, AXES), dtype=np.float32)
+            members = np.zeros(0, dtype=np.int32)
+        self.size = len(members)
+        capacity = max(INITIAL_CAPACITY, self.size)
+        self.vectors = np.zeros((capacity, AXES), dtype=np.float32)
+        self.members = np.zeros(capacity, dtype=np.int32)  # 行 -> ユーザー番号
+        self.vectors[:self.size] = vectors
+        self.members[:self.size] = members
+
+    def append(self, number: int, vector) -> int:
+        if self.size == len(self.members):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.members = np.concatenate([self.members, np.zeros_like(self.members)])
+        row = self.size
+        self.vectors[row] = vector
+        self.members[row] = number
+        self.size += 1
+        return row
+
+    def remove(self, row: int) -> int | None:
+        """行を削除し、空いた行に移したユーザーの番号を返す (移していなければ None)"""
+        self.size -= 1
+        last = self.size
+        if row == last:
+            return None
+        self.vectors[row] = self.vectors[last]
+        self.members[row] = self.members[last]
+        return int(self.members[row])
+
+
+class TasteIndex:
+    """
+    4軸スコアが近い (ユークリッド距離が小さい) ユーザーを探すインデックス
+
+    - nearest(user_id, k) で近い順に k 人を返す
+    - 近い人はほとんど同じタイプにいるので、同じタイプから探し、
+      他のタイプは「そのタイプの人との距離の下限」が k 番目の距離より小さいときだけ調べる
+    - update はスコアが変わったとき (いいね・診断のあと) に呼ぶ
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = []        # 番号 -> user_id
+        self._index = {}      # user_id -> 番号
+        self._bucket_of = np.full(0, -1, dtype=np.int8)  # 番号 -> バケット (-1: 入っていない)
+        self._row_of = np.zeros(0, dtype=np.int32)        # 番号 -> バケット内の行
+        self._buckets = [_Bucket() for _ in range(BUCKET_COUNT)]
+
+    # --- 構築 ---
+
+    def load(self, db):
+        """タイプ診断済みのユーザーのスコアを全件読み込んで作り直す (起動時)"""
+        rows = db.execute(
+            select(User.id, User.score_vc, User.score_ma, User.score_pr, User.score_hs)
+            .where(
+                User.music_type_code.is_not(None),
+                User.score_vc.is_not(None), User.score_ma.is_not(None),
+                User.score_pr.is_not(None), User.score_hs.is_not(None),
+            )
+        ).all()
+        vectors = np.array([row[1:] for row in rows], dtype=np.float32).reshape(-1, AXES)
+        self.build([row[0] for row in rows], vectors)
+        logger.info(f"taste index loaded: {len(rows)} users")
+
+    def build(self, user_ids, vectors: np.ndarray):
+        """ユーザーID一覧と、同じ順番のスコア行列 (n x 4) から作り直す"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, AXES)
+        buckets_of = bucket_numbers(vectors)
+        rows = np.zeros(len(vectors), dtype=np.int32)
+        buckets = []
+        for b in range(BUCKET_COUNT):
+            members = np.flatnonzero(buckets_of == b).astype(np.int32)
+            rows[members] = np.arange(len(members), dtype=np.int32)
+            buckets.append(_Bucket(vectors[members], members))
+        with self._lock:
+            self._ids = list(user_ids)
+            self._index = {user_id: i for i, user_id in enumerate(self._ids)}
+            self._bucket_of = buckets_of.astype(np.int8)
+            self._row_of = rows
+            self._buckets = buckets
+
+    # --- 更新 ---
+
+    def update(self, user_id: str, scores):
+        """ユーザーのスコア (VC, MA, PR, HS) を反映する (新しいユーザーなら追加する)"""
+        vector = np.asarray(scores, dtype=np.float32)
+        bucket = int(bucket_numbers(vector[None])[0])
+        with self._lock:
+            number = self._number(user_id)
+            current = int(self._bucket_of[number])
+            if current == bucket:
+                self._buckets[bucket].vectors[self._row_of[number]] = vector
+                return
+            if current >= 0:
+                self._remove_locked(number)
+            self._row_of[number] = self._buckets[bucket].append(number, vector)
+            self._bucket_of[number] = bucket
+
+    def _number(self, user_id: str) -> int:
+        """ユーザーの番号 (新しいユーザーなら末尾に追加する)"""
+        i = self._index.get(user_id)
+        if i is None:
+            i = self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+            if i >= len(self._bucket_of):
+                grow = max(INITIAL_CAPACITY, len(self._bucket_of))
+                self._bucket_of = np.concatenate([self._bucket_of, np.full(grow, -1, dtype=np.int8)])
+                self._row_of = np.concatenate([self._row_of, np.zeros(grow, dtype=np.int32)])
+        return i
+
+    def _remove_locked(self, number: int):
+        bucket = self._buckets[self._bucket_of[number]]
+        moved = bucket.remove(int(self._row_of[number]))
+        if moved is not None:
+            self._row_of[moved] = self._row_of[number]
+        self._bucket_of[number] = -1
+
+    # --- 検索 ---
+
+    def type_code(self, user_id: str) -> str | None:
+        """インデックス上のタイプコード (入っていなければ None)"""
+        number = self._index.get(user_id)
+        if number is None or self._bucket_of[number] < 0:
+            return None
+        return type_code_of(int(self._bucket_of[number]))
+
+    def nearest(self, user_id: str, k: int):
+        """
+        スコアが近い順に最大 k 人 (自分を除く) を返す
+        戻り値: [(user_id, 距離)] (ユーザーがインデックスに無ければ None)
+        """
+        with self._lock:
+            me = self._index.get(user_id)
+            if me is None or self._bucket_of[me] < 0:
+                return None
+            my_bucket = int(self._bucket_of[me])
+            query = self._buckets[my_bucket].vectors[self._row_of[me]].copy()
+
+            # 他のタイプの人とは、タイプが違う軸で少なくとも |スコア - THRESHOLD| 離れている
+            margins = (query - typeCal.THRESHOLD) ** 2
+            differs = (np.arange(BUCKET_COUNT)[:, None] ^ my_bucket) & AXIS_BITS != 0
+            lower_bounds = differs @ margins
+
+            found = np.zeros(0, dtype=np.int32)
+            distances = np.zeros(0, dtype=np.float32)
+            for b in np.argsort(lower_bounds, kind="stable").tolist():
+                if len(found) >= k and lower_bounds[b] > distances.max():
+                    break
+                bucket = self._buckets[b]
+                if bucket.size == 0:
+                    continue
+                members = bucket.members[:bucket.size]
+                d = ((bucket.vectors[:bucket.size] - query) ** 2).sum(axis=1)
+                others = members != me
+                found = np.concatenate([found, members[others]])
+                distances = np.concatenate([distances, d[others]])
+                if len(found) > k:
+                    top = np.argpartition(distances, k)[:k]
+                    found, distances = found[top], distances[top]
+
+            order = np.argsort(distances, kind="stable")
+            return [(self._ids[i], float(np.sqrt(distances[j]))) for j, i in zip(order.tolist(), found[order].tolist())]
+
+
+def bucket_numbers(vectors: np.ndarray) -> np.ndarray:
+    """スコア行列 (n x 4) の各行のバケット番号 (typeCal.determine_music_type_code と同じ判定)"""
+    return (vectors >= typeCal.THRESHOLD) @ AXIS_BITS
+
+
+def type_code_of(bucket: int) -> str:
+    """バケット番号 -> タイプコード ('VAPH' など)"""
+    return "".join(
+        high if bucket & bit else low
+        for bit, high, low in zip(AXIS_BITS.tolist(), "VAPH", "CMRS")
+    )
+
+
+taste_index = TasteIndex()
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from taste_index import BUCKET_COUNT, type_code_of
+import crud
+
+logger = logging.getLogger("uvicorn")
+
+# --- 急上昇の曲 ---
+# いいねの数を「1時間ごと (直近24時間)」と「1日ごと (直近7日)」の枠に分けて曲ごとに数えておく
+# 枠は輪のように使い回し (リングバッファ)、時間が進んだら一番古い枠を0に戻す
+# 集計は「全員」と「タイプ (VMPH など) ごと」の 1 + 16 グループ
+# 1回の集計は 枠の数 x 曲数 の計算だけで、like_logs の件数には関係しない
+#
+# 押した人のタイプは押した直後のタイプ (起動時の読み込みでは今のタイプ) で数える
+# いいねの取り消しは差し引かない (急上昇は「最近どれだけ押されたか」なので)
+
+HOURS = 24
+DAYS = 7
+# 新しい枠ほど重くする: この時間 (日) 前の枠の重みは半分
+HALF_LIFE_HOURS = 6
+HALF_LIFE_DAYS = 2
+WINDOWS = ("24h", "7d")
+
+GROUP_ALL = 0
+TYPE_GROUPS = {type_code_of(b): 1 + b for b in range(BUCKET_COUNT)}  # タイプコード -> グループ
+GROUP_COUNT = 1 + BUCKET_COUNT
+INITIAL_SONGS = 64
+
+
+class TrendingCounter:
+    """
+    曲ごとのいいね数を時間の枠ごとに持つカウンター
+
+    - record はいいねが保存されたあとに呼ぶ
+    - top(window, music_type_code) で、新しいいいねほど重くした点数の高い順に曲を返す
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}  # song_id -> 列番号
+        self._song_ids = np.zeros(INITIAL_SONGS, dtype=np.int64)  # 列番号 -> song_id
+        self._hourly = np.zeros((GROUP_COUNT, HOURS, INITIAL_SONGS), dtype=np.int32)
+        self._daily = np.zeros((GROUP_COUNT, DAYS, INITIAL_SONGS), dtype=np.int32)
+        self._hour = _hour_of(time.time())  # 最後に進めた時刻 (1970年からの時間数)
+
+    # --- 記録 ---
+
+    def load(self, db):
+        """直近7日のいいねを like_logs から数え直す (起動時。DBで 曲 x タイプ x 1時間 ごとに数えたものを読む)"""
+        now = time.time()
+        # like_logs の時刻はタイムゾーン無しの現地時刻なので、UTC との差の1時間未満の分 (+5:30 の30分など) をずらして数える
+        shift = _utc_offset_seconds(now) % 3600
+        rows = crud.count_likes_by_hour(db, datetime.fromtimestamp(now) - timedelta(days=DAYS), shift)
+        with self._lock:
+            self._hourly[:] = 0
+            self._daily[:] = 0
+            self._hour = _hour_of(now)
+            if rows:
+                columns = np.array([self._column(song_id) for song_id, _, _, _ in rows], dtype=np.int64)
+                groups = np.array([TYPE_GROUPS.get(code, -1) for _, code, _, _ in rows], dtype=np.int64)
+                hours = np.array([_local_hour(hour, shift) for _, _, hour, _ in rows], dtype=np.int64)
+                counts = np.array([count for _, _, _, count in rows], dtype=np.int32)
+                self._add_locked(columns, groups, hours, counts)
+        logger.info(f"trending loaded: {sum(count for _, _, _, count in rows)} likes")
+
+    def record(self, song_id: int, music_type_code: str | None, count: int = 1):
+        """いいね count 回を今の枠に足す"""
+        with self._lock:
+            self._advance_locked(_hour_of(time.time()))
+            column = self._column(song_id)
+            hour_slot, day_slot = self._hour % HOURS, (self._hour // 24) % DAYS
+            group = TYPE_GROUPS.get(music_type_code)
+            for g in (GROUP_ALL,) if group is None else (GROUP_ALL, group):
+                self._hourly[g, hour_slot, column] += count
+                self._daily[g, day_slot, column] += count
+
+    def _column(self, song_id: int) -> int:
+        """曲の列番号 (新しい曲なら列を追加する)"""
+        column = self._rows.get(song_id)
+        if column is None:
+            column = self._rows[song_id] = len(self._rows)
+            if column == len(self._song_ids):
+                self._song_ids = np.concatenate([self._song_ids, np.zeros_like(self._song_ids)])
+                self._hourly = np.concatenate([self._hourly, np.zeros_like(self._hourly)], axis=2)
+                self._daily = np.concatenate([self._daily, np.zeros_like(self._daily)], axis=2)
+            self._song_ids[column] = song_id
+        return column
+
+    def _add_locked(self, columns, groups, hours, counts):
+        """(列, グループ, 時刻) ごとに回数を足す (グループ -1 は全員の分だけ)"""
+        hour_age = self._hour - hours
+        day_age = self._hour // 24 - hours // 24
+        for ages, limit, slots, table in (
+            (hour_age, HOURS, hours % HOURS, self._hourly),
+            (day_age, DAYS, (hours // 24) % DAYS, self._daily),
+        ):
+            inside = (ages >= 0) & (ages < limit)
+            np.add.at(table, (GROUP_ALL, slots[inside], columns[inside]), counts[inside])
+            typed = inside & (groups >= 0)
+            np.add.at(table, (groups[typed], slots[typed], columns[typed]), counts[typed])
+
+    def _advance_locked(self, hour: int):
+        """時刻を進め、期間外になった枠を0に戻す"""
+        if hour <= self._hour:
+            return
+        for h in range(max(self._hour + 1, hour - HOURS + 1), hour + 1):
+            self._hourly[:, h % HOURS, :] = 0
+        day, last_day = hour // 24, self._hour // 24
+        for d in range(max(last_day + 1, day - DAYS + 1), day + 1):
+            self._daily[:, d % DAYS, :] = 0
+        self._hour = hour
+
+    # --- 集計 ---
+
+    def top(self, window: str = "24h", music_type_code: str | None = None, limit: int = 20):
+        """
+        急上昇の曲を [(song_id, 期間内のいいね数, 点数)] で返す (点数の高い順)
+        点数: 枠ごとのいいね数に、新しい枠ほど大きい重み (半減期 HALF_LIFE_*) を掛けた合計
+        """
+        group = GROUP_ALL if music_type_code is None else TYPE_GROUPS[music_type_code]
+        with self._lock:
+            self._advance_locked(_hour_of(time.time()))
+            songs = len(self._rows)
+            if window == "24h":
+                counts = self._hourly[group, :, :songs]
+                ages = (self._hour - np.arange(HOURS)) % HOURS  # 枠 -> 何時間前か
+                weights = 0.5 ** (ages / HALF_LIFE_HOURS)
+            else:
+                counts = self._daily[group, :, :songs]
+                ages = (self._hour // 24 - np.arange(DAYS)) % DAYS
+                weights = 0.5 ** (ages / HALF_LIFE_DAYS)
+            totals = counts.sum(axis=0)
+            scores = weights @ counts
+            song_ids = self._song_ids[:songs]
+
+        liked = np.flatnonzero(totals)
+        if len(liked) > limit:
+            liked = liked[np.argpartition(-scores[liked], limit - 1)[:limit]]
+        liked = liked[np.argsort(-scores[liked], kind="stable")]
+        return [
+            (int(song_ids[i]), int(totals[i]), float(scores[i]))
+            for i in liked.tolist()
+        ]
+
+
+def _hour_of(timestamp: float) -> int:
+    return int(timestamp // 3600)
+
+
+def _utc_offset_seconds(timestamp: float) -> int:
+    return int(datetime.fromtimestamp(timestamp).astimezone().utcoffset().total_seconds())
+
+
+def _local_hour(naive_hour: int, shift: int) -> int:
+    """count_likes_by_hour の枠 (現地時刻を UTC とみなして数えたもの) を _hour_of の枠に直す"""
+    naive = datetime.fromtimestamp(naive_hour * 3600 + shift, timezone.utc).replace(tzinfo=None)
+    return _hour_of(naive.timestamp())
+
+
+trending = TrendingCounter()
@@ -1,66 +1,87 @@
-import json
+# 学習率 (0.03 = 過去97% : 新曲3% の割合で変化)
+# 10回程度押したらタイプが変わる程度の変化になるように調整
+ALPHA = 0.03
 
-def calculate_new_scores(current_user, song_params_json: str):
+# 各軸の判定基準
+THRESHOLD = 0.5
+
+def calculate_new_scores(current_user, song_vector):
     """
-    ユーザーの現在のスコアと、曲のパラメータ(JSON文字列)を受け取り、
+    ユーザーの現在のスコアと、曲の4軸ベクトル (catalog.get_song_vector) を受け取り、
     新しいスコア(4軸)を計算して返します。
     """
-    
-    # DBの parameters カラムは文字列(JSON)で入っているので辞書に変換
-    if isinstance(song_params_json, str):
-        song_params = json.loads(song_params_json)
-    else:
-        song_params = song_params_json # すでに辞書用
+    val_v, val_a, val_p, val_h = song_vector
 
-    # 学習率 (0.03 = 過去97% : 新曲3% の割合で変化)
-    # 10回程度押したらタイプが変わる程度の変化になるように調整
-    alpha = 0.03
+    alpha = ALPHA
 
     # --- 1. V vs C (Valence) ---
     # High Valence = V (1.0), Low = C (0.0)
-    val_v = float(song_params.get('valence', 0.5))
     new_vc = (current_user.score_vc * (1 - alpha)) + (val_v * alpha)
 
     # --- 2. M vs A (Melody vs Atmosphere) ---
     # Instrumentalnessが高い = A (Atmosphere/1.0)
     # Instrumentalnessが低い = M (Melody/0.0)
-    val_a = float(song_params.get('instrumentalness', 0.0))
     new_ma = (current_user.score_ma * (1 - alpha)) + (val_a * alpha)
 
     # --- 3. P vs R (Passion vs Relax) ---
     # Energyが高い = P (Passion/1.0)
-    val_p = float(song_params.get('energy', 0.5))
     new_pr = (current_user.score_pr * (1 - alpha)) + (val_p * alpha)
 
     # --- 4. H vs S (Human vs Synth) ---
     # Acousticnessが高い = H (Human/1.0)
     # Acousticnessが低い = S (Synth/0.0)
     # ここでは Acousticness をそのまま H度(1.0)
-    val_h = float(song_params.get('acousticness', 0.0))
     new_hs = (current_user.score_hs * (1 - alpha)) + (val_h * alpha)
 
     return new_vc, new_ma, new_pr, new_hs
 
+def calculate_batch_scores(current_user, taps):
+    """
+    同じ曲へのn回連続いいねをまとめて計算します。
+    taps: [(曲の4軸ベクトル, 回数), ...] を順番に適用
+
+    1回ずつ new = s*(1-a) + v*a を繰り返すのと同じ結果を、閉じた式
+    s*(1-a)^n + v*(1-(1-a)^n) で一度に求めます。
+    """
+    alpha = ALPHA
+
+    vc, ma, pr, hs = current_user.score_vc, current_user.score_ma, current_user.score_pr, current_user.score_hs
+
+    for song_vector, count in taps:
+        if count <= 0:
+            continue
+        val_v, val_a, val_p, val_h = song_vector
+
+        # 過去のスコアが残る割合
+        keep = (1 - alpha) ** count
+
+        vc = vc * keep + val_v * (1 - keep)
+        ma = ma * keep + val_a * (1 - keep)
+        pr = pr * keep + val_p * (1 - keep)
+        hs = hs * keep + val_h * (1 - keep)
+
+    return vc, ma, pr, hs
+
 def determine_music_type_code(vc, ma, pr, hs):
     """
     4つのスコア(0.0-1.0)から、'VMPH' のような4文字のコードを生成します。
-    基準値はすべて 0.5 です。
+    基準値はすべて THRESHOLD (0.5) です。
     """
     code = ""
 
     # 1文字目: V or C
-    code += "V" if vc >= 0.5 else "C"
+    code += "V" if vc >= THRESHOLD else "C"
 
     # 2文字目: A or M (注意: スコアは Atmosphere(1.0)寄りか判定)
     # スコアが高い(>0.5)ならAtmosphere(A)、低いならMelody(M)
-    # Instrumentalnessが低い(0.0) = Melody(M) 
-    code += "A" if ma >= 0.5 else "M"
+    # Instrumentalnessが低い(0.0) = Melody(M)
+    code += "A" if ma >= THRESHOLD else "M"
 
     # 3文字目: P or R
-    code += "P" if pr >= 0.5 else "R"
+    code += "P" if pr >= THRESHOLD else "R"
 
     # 4文字目: H or S
     # Acousticnessが高い(1.0) = Human(H)
-    code += "H" if hs >= 0.5 else "S"
+    code += "H" if hs >= THRESHOLD else "S"
 
-    return code
\ No newline at end of file
+    return code
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+
+from sqlalchemy import func, select
+
+from database import read_engine
+from models import MusicType
+
+# --- Music Type のキャッシュ ---
+# music_types は16行しかなく、init_db.py を実行したときしか変わらないので
+# 起動時に読み込み、レスポンスに埋め込む {code, name, description} を作っておく
+# (各APIで User.music_type を結合して辞書を作り直さない)
+
+# テーブルが変わっていないか確認する間隔(秒)
+# 確認はバックグラウンドのスレッドで行い、get() は辞書を引くだけにする (イベントループでDBを読まない)
+CHECK_INTERVAL = float(os.environ.get("TYPE_REGISTRY_CHECK_SECONDS", "10"))
+
+logger = logging.getLogger("uvicorn")
+
+_lock = threading.Lock()
+_payloads = {}          # code -> {code, name, description} (書き換えないこと)
+_fingerprint = None     # 読み込んだときのテーブルの状態
+_stopping = threading.Event()
+_thread = None
+
+
+def _table_fingerprint(conn):
+    """テーブルの中身が変わったら変わる値 (16行なので全体を連結しても軽い)"""
+    return conn.execute(
+        select(
+            func.count(),
+            # NULL の列があっても行ごと抜けないよう空文字にし、区切り文字で列の境目を残す
+            func.group_concat(
+                func.coalesce(MusicType.code, "") + "\x1f" + func.coalesce(MusicType.name, "") + "\x1f"
+                + func.coalesce(MusicType.description, ""),
+                "\x1e",
+            ),
+        ).select_from(MusicType)
+    ).one()
+
+
+def load():
+    """music_types を読み込み直す (起動時・変更を検知したとき)"""
+    global _payloads, _fingerprint
+    with read_engine.connect() as conn:
+        fingerprint = _table_fingerprint(conn)
+        rows = conn.execute(select(MusicType.code, MusicType.name, MusicType.description)).all()
+    payloads = {
+        code: {"code": code, "name": name, "description": description}
+        for code, name, description in rows
+    }
+    with _lock:
+        _payloads = payloads
+        _fingerprint = fingerprint
+
+
+def _reload_if_changed():
+    with read_engine.connect() as conn:
+        fingerprint = _table_fingerprint(conn)
+    if fingerprint != _fingerprint:
+        load()
+
+
+def _run():
+    while not _stopping.wait(CHECK_INTERVAL):
+        try:
+            _reload_if_changed()
+        except Exception as e:
+            logger.error(f"music type reload failed: {e}")
+
+
+def start():
+    """テーブルの変更を確認するスレッドを起動する"""
+    global _thread
+    if _thread is not None or CHECK_INTERVAL <= 0:
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_run, name="type-registry", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stopping.set()
+    if _thread is not None:
+        _thread.join()
+        _thread = None
+
+
+def get(code: str | None):
+    """タイプコードに対応する {code, name, description} を返す (無ければ None)"""
+    if code is None:
+        return None
+    return _payloads.get(code)
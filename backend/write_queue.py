@@ -0,0 +1,182 @@
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+from database import engine
+
+logger = logging.getLogger("uvicorn")
+
+# --- 書き込み専用スレッド ---
+# SQLiteは同時に1つしか書き込めないので、DBを変更する処理(ジョブ)はすべてこのスレッドで実行する
+# 溜まっているジョブをまとめて1トランザクションでコミットし (group commit)、
+# 各リクエストは自分のジョブの結果だけを待つ
+
+# 1回のコミットにまとめるジョブの最大数
+WRITE_QUEUE_MAX_BATCH = int(os.environ.get("WRITE_QUEUE_MAX_BATCH", "64"))
+
+
+class _GroupSession(Session):
+    """
+    書き込みスレッド用のセッション
+    crud 内の commit() はフラッシュだけ、rollback() はそのジョブの開始時点まで戻す
+    (本当のコミットは WriteQueue がまとめて行う)
+    """
+
+    _job_savepoint = None
+
+    def begin_job(self):
+        self._job_savepoint = self.begin_nested()
+
+    def end_job(self, failed: bool):
+        savepoint, self._job_savepoint = self._job_savepoint, None
+        # フラッシュに失敗したセーブポイントは is_active が False になるが、rollback は必要
+        if failed:
+            savepoint.rollback()
+        elif savepoint.is_active:
+            savepoint.commit()
+
+    def commit(self):
+        if self._job_savepoint is None:
+            super().commit()
+        else:
+            self.flush()
+
+    def rollback(self):
+        if self._job_savepoint is None:
+            super().rollback()
+            return
+        self._job_savepoint.rollback()
+        self._job_savepoint = self.begin_nested()
+
+
+GroupSessionLocal = sessionmaker(
+    class_=_GroupSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+
+class WriteQueue:
+    """
+    DBへの書き込みを1本のスレッドに集めるキュー
+
+    - run(job, *args) は job(db, *args) を書き込みスレッドで実行し、結果 (または例外) を返す
+      async def のAPIからは await run_async(job, *args) (待っている間スレッドを占有しない)
+    - ジョブごとにセーブポイントを作るので、失敗したジョブだけが取り消される
+    - ジョブの戻り値はコミット後に返す。セッションは閉じられるので、必要な値はジョブ内で取り出しておく
+    - start() 前や stop() 後は、呼び出したスレッドでそのまま実行する
+    - ジョブは登録した側の contextvars で実行する (SQLの計測を登録したリクエストに数えるため)
+    """
+
+    def __init__(self, max_batch=WRITE_QUEUE_MAX_BATCH, session_factory=GroupSessionLocal):
+        self.max_batch = max_batch
+        self.session_factory = session_factory
+        self._queue = queue.Queue()
+        self._thread = None
+
+    # --- ライフサイクル ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """キューに残っているジョブを全て実行してからスレッドを止める"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    # --- 受け付け ---
+
+    def run(self, job, *args):
+        thread = self._thread
+        if thread is None or thread is threading.current_thread():
+            return self._run_inline(job, args)
+        return self._submit(job, args).result()
+
+    async def run_async(self, job, *args):
+        if self._thread is None:
+            return await run_in_threadpool(self._run_inline, job, args)
+        return await asyncio.wrap_future(self._submit(job, args))
+
+    def _submit(self, job, args) -> Future:
+        future = Future()
+        self._queue.put((job, args, future, contextvars.copy_context()))
+        return future
+
+    def _run_inline(self, job, args):
+        future = Future()
+        self._execute([(job, args, future, contextvars.copy_context())])
+        return future.result()
+
+    # --- 書き込みスレッド ---
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch):
+        db = self.session_factory()
+        results = []
+        try:
+            # 先にトランザクションを始めておく (pysqlite は SAVEPOINT の前に BEGIN を出さないため、
+            # そのままだと RELEASE SAVEPOINT のたびにコミットされてしまう)
+            # IMMEDIATE で最初に書き込みロックを取り、途中で他の接続とぶつからないようにする
+            started = time.perf_counter()
+            db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            metrics.write_lock_wait.observe(time.perf_counter() - started)
+            metrics.write_batch_size.observe(len(batch))
+            for job, args, future, context in batch:
+                db.begin_job()
+                try:
+                    result = context.run(job, db, *args)
+                except Exception as e:
+                    db.end_job(failed=True)
+                    results.append((future, None, e))
+                else:
+                    db.end_job(failed=False)
+                    results.append((future, result, None))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"write queue commit failed ({len(batch)} jobs): {e}")
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+write_queue = WriteQueue()
+
+metrics.registry.callback_gauge(
+    "tomotune_write_queue_depth", "書き込みスレッドの順番待ちのジョブ数", (),
+    lambda: [((), write_queue._queue.qsize())])
@@ -30,7 +30,7 @@ const PostCard: React.FC<PostCardProps> = ({ post, currentUserId, onOpenComments
   const audioSrc = post.song.url.startsWith('http') ? post.song.url : `${API_BASE || ''}${post.song.url}`
   const date = new Date(post.created_at)
   const isMine = currentUserId && post.user && post.user.id === currentUserId
-  const commentCount = post.comments ? post.comments.length : 0
+  const commentCount = post.comment_count ?? (post.comments ? post.comments.length : 0)
   const navigate = useNavigate()
 
   const userTypeLabel = useMemo(() => {
@@ -21,6 +21,9 @@ function Home() {
 
   const [userId, setUserId] = useState<string | null>(null)
   const [posts, setPosts] = useState<Post[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  // all: みんなの投稿 / following: フォロー中のユーザーと自分の投稿
+  const [feed, setFeed] = useState<'all' | 'following'>('all')
   const [selectedPost, setSelectedPost] = useState<Post | null>(null)
   const [comments, setComments] = useState<Comment[]>([])
   const [commentText, setCommentText] = useState('')
@@ -35,12 +38,19 @@ function Home() {
     }
   }, [])
 
-  // 投稿データ取得
+  // 投稿データ取得 (cursor を渡すと続きのページを取得して後ろに追加)
+  const fetchPosts = async (cursor?: string) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''
+    const path = feed === 'following' && userId ? `/timeline/${userId}` : '/posts'
+    const res = await fetch(`${API_BASE}${path}${query}`)
+    const data = (await res.json()) as Post[]
+    setNextCursor(res.headers.get('X-Next-Cursor'))
+    setPosts((prev) => (cursor ? [...prev, ...data] : data))
+  }
+
   useEffect(() => {
-    fetch(`${API_BASE}/posts`)
-      .then((res) => res.json())
-      .then((data) => setPosts(data))
-  }, [])
+    fetchPosts()
+  }, [feed, userId])
 
   // コメント表示開始
   const handleOpenComments = (post: Post) => {
@@ -60,7 +70,7 @@ function Home() {
       // posts一覧側のコメント件数も更新しておく
       setPosts((prev) =>
         prev.map((p) =>
-          p.id === postId ? { ...p, comments: data } : p
+          p.id === postId ? { ...p, comments: data, comment_count: data.length } : p
         )
       )
     } catch (e) {
@@ -100,7 +110,28 @@ function Home() {
       <VStack spacing={8} align="stretch">
 
         {/* ------------------- 投稿一覧 ------------------- */}
-        <Heading size="md" color="gray.700">みんなの投稿</Heading>
+        <HStack justify="space-between">
+          <Heading size="md" color="gray.700">
+            {feed === 'following' ? 'フォロー中の投稿' : 'みんなの投稿'}
+          </Heading>
+          <HStack spacing={1}>
+            <Button
+              size="xs"
+              variant={feed === 'all' ? 'solid' : 'ghost'}
+              onClick={() => setFeed('all')}
+            >
+              みんな
+            </Button>
+            <Button
+              size="xs"
+              variant={feed === 'following' ? 'solid' : 'ghost'}
+              onClick={() => setFeed('following')}
+              isDisabled={!userId}
+            >
+              フォロー中
+            </Button>
+          </HStack>
+        </HStack>
         <VStack spacing={4} align="stretch">
           {posts.length === 0 ? (
             <Text color="gray.500">まだ投稿はありません。</Text>
@@ -114,6 +145,11 @@ function Home() {
               />
             ))
           )}
+          {nextCursor && (
+            <Button variant="ghost" size="sm" onClick={() => fetchPosts(nextCursor)}>
+              もっと見る
+            </Button>
+          )}
         </VStack>
 
       </VStack>
@@ -27,12 +27,28 @@ export interface User {
   viewer_is_following?: boolean;
 }
 
+// 曲の特徴量 (songs.csv の値)
+export interface SongFeatures {
+  acousticness: number | null;
+  danceability: number | null;
+  energy: number | null;
+  instrumentalness: number | null;
+  liveness: number | null;
+  loudness: number | null;
+  speechiness: number | null;
+  valence: number | null;
+  tempo: number | null;
+  key: number | null;
+  mode: number | null;
+  time_signature: number | null;
+}
+
 export interface Song {
   id: number;
   title: string;
   artist: string;
   url: string;
-  parameters?: string; 
+  features?: SongFeatures;
 }
 
 export interface Comment {
@@ -56,5 +72,7 @@ export interface Post {
     music_type?: MusicType | null;
   } | null;
   song: Song;
+  // コメント総数と、最新数件のコメント (全件は /posts/{id}/comments)
+  comment_count?: number;
   comments?: Comment[];
 }
\ No newline at end of file